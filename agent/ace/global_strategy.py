@@ -30,6 +30,24 @@ class GlobalStrategyLayer:
         self.strategy_history.append(strategy)
         return strategy
 
+    def update_strategy_field(self, key: str, value: Any) -> None:
+        """
+        Apply a single field of a structured strategy, e.g. as StrategyRewriter streams it.
+        :param key: strategy field name
+        :param value: new value for the field
+        """
+        strategy = dict(self.current_strategy) if isinstance(self.current_strategy, dict) else {}
+        strategy[key] = value
+        self.current_strategy = strategy
+
+    def adopt_strategy(self, strategy: Dict[str, Any]) -> None:
+        """
+        Make a complete (e.g. rewritten) strategy current and record it in the history.
+        :param strategy: the new strategy
+        """
+        self.current_strategy = strategy
+        self.strategy_history.append(strategy)
+
     def get_current_strategy(self) -> str:
         """Return the most recent global strategy."""
         return self.current_strategy
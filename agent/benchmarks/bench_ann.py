@@ -0,0 +1,65 @@
+"""
+bench_ann.py
+
+Recall-vs-latency benchmark of the IVF index against the exact flat index on synthetic
+clustered embeddings.
+
+Usage (from the repository root):
+    python -m agent.benchmarks.bench_ann --n 1000000 --dim 64 --queries 200
+"""
+
+import time
+import argparse
+import numpy as np
+from agent.memory.vector_index import FlatIndex, IVFIndex
+
+def synthetic(n: int, dim: int, clusters: int, seed: int) -> np.ndarray:
+    """
+    Gaussian blobs around random centers, roughly how topic-clustered embeddings look.
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, n)
+    return centers[labels] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+
+def timed_search(index, queries: np.ndarray, k: int, **kwargs):
+    results = []
+    started = time.perf_counter()
+    for q in queries:
+        results.append([r["id"] for r in index.search(q, k, **kwargs)])
+    return results, (time.perf_counter() - started) / len(queries) * 1000.0
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=200000, help="indexed vectors")
+    parser.add_argument("--dim", type=int, default=64, help="vector dimension")
+    parser.add_argument("--queries", type=int, default=200, help="number of queries")
+    parser.add_argument("--k", type=int, default=10, help="neighbours per query")
+    parser.add_argument("--clusters", type=int, default=256, help="clusters in the synthetic data")
+    parser.add_argument("--nlist", type=int, default=None, help="IVF buckets (default 4*sqrt(n))")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    data = synthetic(args.n + args.queries, args.dim, args.clusters, args.seed)
+    base, queries = data[:args.n], data[args.n:]
+    ids = [str(i) for i in range(args.n)]
+
+    exact = FlatIndex(args.dim, capacity=args.n)
+    exact.add(base, ids)
+    ivf = IVFIndex(args.dim, capacity=args.n, nlist=args.nlist, train_threshold=args.n)
+    started = time.perf_counter()
+    ivf.add(base, ids)
+    build = time.perf_counter() - started
+
+    truth, exact_ms = timed_search(exact, queries, args.k)
+    print(f"n={args.n} dim={args.dim} k={args.k} nlist={len(ivf.centroids)} ivf build {build:.1f}s")
+    print(f"{'index':>12} {'recall@k':>9} {'ms/query':>9} {'speedup':>8}")
+    print(f"{'flat':>12} {1.0:>9.3f} {exact_ms:>9.2f} {1.0:>8.1f}")
+    for nprobe in args.nprobe:
+        found, ms = timed_search(ivf, queries, args.k, nprobe=nprobe)
+        recall = np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)])
+        print(f"{'ivf/' + str(nprobe):>12} {recall:>9.3f} {ms:>9.2f} {exact_ms / ms:>8.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+bench_episodic_memory.py
+
+Memory footprint of episodic event storage: the former list of dicts (ISO timestamp string,
+content string, metadata dict per event) against EventColumns, measured with tracemalloc.
+With --store, a whole EpisodicMemory (columns plus keyword indexes) is measured as well.
+
+Usage (from the repository root):
+    python -m agent.benchmarks.bench_episodic_memory --n 1000000
+"""
+
+import time
+import random
+import argparse
+import datetime
+import tracemalloc
+from typing import Any, Callable, Tuple
+from agent.memory.episodic_memory import EpisodicMemory
+from agent.memory.event_columns import EventColumns
+
+TOOLS = ["search", "browser", "python", "shell", "calculator", "planner"]
+
+def synthetic(n: int, seed: int):
+    """
+    Yield (content, metadata) pairs shaped like agent step logs.
+    """
+    rng = random.Random(seed)
+    for i in range(n):
+        content = f"step {i}: called {rng.choice(TOOLS)} and got {rng.randint(0, 10 ** 6)} results"
+        yield content, {"tool": rng.choice(TOOLS), "step": i, "ok": rng.random() < 0.9}
+
+def measure(build: Callable[[], Any]) -> Tuple[int, float, Any]:
+    """
+    Return (bytes still allocated by build's result, seconds, result).
+    """
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - started
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, elapsed, result
+
+def dict_store(n: int, seed: int):
+    events = []
+    for content, metadata in synthetic(n, seed):
+        events.append({"timestamp": datetime.datetime.utcnow().isoformat(),
+                       "content": content,
+                       "metadata": metadata})
+    return events
+
+def column_store(n: int, seed: int):
+    events = EventColumns()
+    for content, metadata in synthetic(n, seed):
+        events.append(time.time_ns() // 1000, content, metadata)
+    return events
+
+def episodic_store(n: int, seed: int):
+    memory = EpisodicMemory()
+    for content, metadata in synthetic(n, seed):
+        memory.add_event(content, metadata)
+    return memory
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=200000, help="events")
+    parser.add_argument("--store", action="store_true", help="also measure a full EpisodicMemory")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    cases = [("dicts", dict_store), ("columns", column_store)]
+    if args.store:
+        cases.append(("EpisodicMemory", episodic_store))
+    print(f"n={args.n}")
+    print(f"{'store':>15} {'MB':>9} {'bytes/event':>12} {'build s':>8} {'ratio':>6}")
+    baseline = None
+    for name, build in cases:
+        size, elapsed, result = measure(lambda: build(args.n, args.seed))
+        baseline = baseline or size
+        print(f"{name:>15} {size / 2 ** 20:>9.1f} {size / args.n:>12.1f} {elapsed:>8.2f} {size / baseline:>6.2f}")
+        del result
+
+if __name__ == "__main__":
+    main()
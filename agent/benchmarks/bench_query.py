@@ -0,0 +1,75 @@
+"""
+bench_query.py
+
+Keyword query latency of EpisodicMemory (inverted keyword index) against the previous
+full substring scan, on synthetic events with metadata.
+
+Usage (from the repository root):
+    python -m agent.benchmarks.bench_query --n 1000000
+"""
+
+import time
+import random
+import itertools
+import argparse
+from agent.memory.episodic_memory import EpisodicMemory
+from agent.memory.keyword_index import matches
+
+TOOLS = ["search", "browser", "python", "shell", "calculator", "planner"]
+
+def synthetic(memory: EpisodicMemory, n: int, vocabulary: int, seed: int) -> None:
+    """
+    Events of 8-16 Zipf-distributed words with a couple of metadata fields.
+    """
+    rng = random.Random(seed)
+    words = [f"w{i}" for i in range(vocabulary)]
+    cumulative = list(itertools.accumulate(1.0 / (i + 1) for i in range(vocabulary)))
+    for i in range(n):
+        content = " ".join(rng.choices(words, cum_weights=cumulative, k=rng.randint(8, 16)))
+        memory.add_event(content, {"tool": rng.choice(TOOLS), "step": i})
+
+def scan(events, keyword: str, limit: int, filters=None):
+    """
+    The pre-index query: substring-test every event.
+    """
+    found = [e for e in events if matches(keyword, e["content"], e["metadata"], filters)]
+    return found[:limit]
+
+def timed(fn, queries) -> float:
+    started = time.perf_counter()
+    for args in queries:
+        fn(*args)
+    return (time.perf_counter() - started) / len(queries) * 1000.0
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=1000000, help="events")
+    parser.add_argument("--vocabulary", type=int, default=50000, help="distinct words")
+    parser.add_argument("--limit", type=int, default=10, help="query limit")
+    parser.add_argument("--scan-queries", type=int, default=3, help="queries timed for the full scan")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    memory = EpisodicMemory()
+    started = time.perf_counter()
+    synthetic(memory, args.n, args.vocabulary, args.seed)
+    print(f"n={args.n} vocabulary={args.vocabulary} build {time.perf_counter() - started:.1f}s")
+
+    cases = {
+        "common word": [("w1 ", args.limit)],
+        "rare word": [(f"w{args.vocabulary - 7}", args.limit)],
+        "partial word": [(f"w{args.vocabulary // 10 - 3}", args.limit)],
+        "missing word": [("nothing-like-this", args.limit)],
+        "field filter": [("", args.limit, {"tool": "shell", "step": args.n - 5})],
+    }
+    events = memory.events_since(0)
+    print(f"{'query':>14} {'index ms':>9} {'scan ms':>9} {'speedup':>8}")
+    for name, queries in cases.items():
+        for q in queries:
+            assert memory.query(*q) == scan(events, *q), name
+        index_ms = timed(memory.query, queries * 20)
+        scan_ms = timed(lambda *q: scan(events, *q), queries * args.scan_queries)
+        print(f"{name:>14} {index_ms:>9.3f} {scan_ms:>9.1f} {scan_ms / max(index_ms, 1e-6):>8.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -21,6 +21,22 @@ AGENT_TRAITS_FILE = os.path.join(BASE_DIR, "data", "config", "agent_traits.json"
 DEFAULT_DB_FILE = os.path.join(DATA_DIR, "agent.db")
 SESSION_FILE = os.path.join(DATA_DIR, "session.json")
 
+# LLM response cache (a database of its own, so cache commits never touch other tables' transactions)
+DEFAULT_LLM_CACHE_FILE = os.path.join(DATA_DIR, "llm_cache.db")
+DEFAULT_LLM_CACHE_MAX_ENTRIES = 10000
+DEFAULT_LLM_CACHE_TTL = 7 * 24 * 3600
+# Cosine similarity for semantic prompt cache hits (0 disables the semantic cache)
+DEFAULT_LLM_SEMANTIC_CACHE_THRESHOLD = 0.0
+
+# LLM backend: "openai", "record" (openai + cassette), "replay" (cassette only) or "stub"
+DEFAULT_LLM_BACKEND = "openai"
+DEFAULT_LLM_CASSETTE = os.path.join(DATA_DIR, "cassettes", "llm.jsonl")
+
+# Multi-backend routing: JSON list of {"name", "model", "api_base", "cost", "sla"} (empty disables it)
+DEFAULT_LLM_ROUTES = "[]"
+DEFAULT_LLM_ROUTING_POLICY = "cheapest_within_sla"
+
 # API Endpoints
 TWITTER_API_BASE = "https://api.twitter.com/2"
 MASTODON_API_BASE = os.getenv("MASTODON_BASE_URL", "")
+REDDIT_USER_AGENT = os.getenv("REDDIT_USER_AGENT", "ACE-X/0.1")
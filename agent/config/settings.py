@@ -5,6 +5,7 @@ Configuration loader for the ACE-X agent. Loads settings from environment variab
 """
 
 import os
+import json
 from .constants import (
     BASE_DIR,
     DATA_DIR,
@@ -15,6 +16,14 @@ from .constants import (
     AGENT_TRAITS_FILE,
     DEFAULT_DB_FILE,
     SESSION_FILE,
+    DEFAULT_LLM_CACHE_FILE,
+    DEFAULT_LLM_CACHE_MAX_ENTRIES,
+    DEFAULT_LLM_CACHE_TTL,
+    DEFAULT_LLM_SEMANTIC_CACHE_THRESHOLD,
+    DEFAULT_LLM_BACKEND,
+    DEFAULT_LLM_CASSETTE,
+    DEFAULT_LLM_ROUTES,
+    DEFAULT_LLM_ROUTING_POLICY,
     TWITTER_API_BASE,
     MASTODON_API_BASE,
     REDDIT_USER_AGENT,
@@ -37,6 +46,22 @@ class Settings:
     DATABASE_FILE = os.getenv("DATABASE_FILE", DEFAULT_DB_FILE)
     SESSION_FILE = os.getenv("SESSION_FILE", SESSION_FILE)
 
+    # LLM response cache
+    LLM_CACHE_FILE = os.getenv("LLM_CACHE_FILE", DEFAULT_LLM_CACHE_FILE)
+    LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", str(DEFAULT_LLM_CACHE_MAX_ENTRIES)))
+    LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(DEFAULT_LLM_CACHE_TTL)))
+    LLM_SEMANTIC_CACHE_THRESHOLD = float(os.getenv("LLM_SEMANTIC_CACHE_THRESHOLD",
+                                                   str(DEFAULT_LLM_SEMANTIC_CACHE_THRESHOLD)))
+
+    # LLM backend selection (record/replay/stub allow offline benchmarking)
+    LLM_BACKEND = os.getenv("LLM_BACKEND", DEFAULT_LLM_BACKEND)
+    LLM_CASSETTE = os.getenv("LLM_CASSETTE", DEFAULT_LLM_CASSETTE)
+    LLM_REPLAY_LATENCY = os.getenv("LLM_REPLAY_LATENCY", "0") == "1"
+
+    # LLM routing across several models/endpoints (see reasoning.llm_router)
+    LLM_ROUTES = json.loads(os.getenv("LLM_ROUTES", DEFAULT_LLM_ROUTES))
+    LLM_ROUTING_POLICY = os.getenv("LLM_ROUTING_POLICY", DEFAULT_LLM_ROUTING_POLICY)
+
     # API Keys & Tokens from environment
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
     TWITTER_BEARER_TOKEN = os.getenv("TWITTER_BEARER_TOKEN")
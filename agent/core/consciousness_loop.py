@@ -2,11 +2,14 @@ import time
 from datetime import datetime
 
 class ConsciousnessLoop:
-    def __init__(self, identity, self_model):
+    def __init__(self, identity, self_model, llm=None):
         self.identity = identity
         self.self_model = self_model
+        self.llm = llm
         self.tick = 0
         self.alive = True
+        # Per-call-site LLM usage of the last completed tick (see TokenUsage.start_tick)
+        self.last_tick_usage = {}
 
     def run_forever(self):
         while self.alive:
@@ -14,6 +17,7 @@ class ConsciousnessLoop:
             now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             print(f"[{now}] Tick {self.tick} — Status: {self.self_model.status}")
             self.think()
+            self.end_tick()
             time.sleep(3)
 
     def think(self):
@@ -21,3 +25,18 @@ class ConsciousnessLoop:
         summary = self.self_model.introspect()
         print(f"> Introspection: {summary}")
         self.self_model.update_state(status="idle")
+
+    def end_tick(self):
+        """
+        Close the LLM usage counters of this tick and log what the tick spent.
+        """
+        if self.llm is None:
+            return {}
+        self.last_tick_usage = self.llm.usage.start_tick()
+        if self.last_tick_usage:
+            calls = sum(row["calls"] for row in self.last_tick_usage.values())
+            tokens = sum(row["prompt_tokens"] + row["completion_tokens"] for row in self.last_tick_usage.values())
+            sites = ", ".join(f"{site}={row['prompt_tokens'] + row['completion_tokens']}"
+                              for site, row in sorted(self.last_tick_usage.items()))
+            print(f"> LLM usage: {calls} call(s), {tokens} tokens ({sites})")
+        return self.last_tick_usage
@@ -3,13 +3,36 @@ experience_synthesizer.py
 
 Synthesizes new experiences from raw episodic data, semantic facts, and reflective insights.
 Prepares consolidated summaries for planning and reflection.
+
+Summaries are plain dicts with aggregate fields (event count, first/last timestamp, weighted
+keywords, event kinds) rather than concatenated text, so summaries of summaries stay the same
+size however many events they cover; the text is rendered from the fields by a template.
 """
 
-from typing import Any, Dict, List
+import re
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
 from ..memory.episodic_memory import EpisodicMemory
 from ..memory.semantic_memory import SemanticMemory
 from ..memory.reflective_memory import ReflectiveMemory
 
+_WORD_RE = re.compile(r"[^\W\d_]{3,}")
+
+STOPWORDS = frozenset(
+    "the and for with that this from was were are has have had not but you your they them "
+    "their its into over after before then than when what which who will would can could "
+    "been being also about there here all any some more most other such only just".split()
+)
+
+# Metadata fields that name the kind of an event, in order of preference
+KIND_FIELDS = ("type", "kind", "source", "action")
+
+Pattern = Tuple[str, Any]
+
+def _keywords(text: str) -> Iterable[str]:
+    return (w for w in _WORD_RE.findall(text.lower()) if w not in STOPWORDS)
+
+
 class ExperienceSynthesizer:
     """
     Generates higher-level experience summaries for the agent.
@@ -18,24 +41,113 @@ class ExperienceSynthesizer:
     def __init__(self,
                  episodic: EpisodicMemory,
                  semantic: SemanticMemory,
-                 reflective: ReflectiveMemory):
+                 reflective: ReflectiveMemory,
+                 top_keywords: int = 8):
         """
         :param episodic: EpisodicMemory instance.
         :param semantic: SemanticMemory instance.
         :param reflective: ReflectiveMemory instance.
+        :param top_keywords: keywords kept per summary.
         """
         self.episodic = episodic
         self.semantic = semantic
         self.reflective = reflective
+        self.top_keywords = top_keywords
+
+    @staticmethod
+    def kind(event: Mapping[str, Any]) -> str:
+        """
+        Kind of an event: its first scalar KIND_FIELDS metadata value, or "event".
+        """
+        metadata = event.get("metadata") or {}
+        for field in KIND_FIELDS:
+            value = metadata.get(field)
+            if isinstance(value, (str, int, float, bool)):
+                return str(value)
+        return "event"
+
+    def describe(self, events: List[Mapping[str, Any]], start: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Level-0 summary of a run of events.
+        :param events: episodic events, oldest first.
+        :param start: timeline position of the first event, if known.
+        """
+        keywords: Counter = Counter()
+        kinds: Counter = Counter()
+        for event in events:
+            keywords.update(set(_keywords(event["content"])))
+            kinds[self.kind(event)] += 1
+        summary = {
+            "level": 0,
+            "start": start,
+            "end": None if start is None else start + len(events),
+            "count": len(events),
+            "first": events[0]["timestamp"] if events else None,
+            "last": events[-1]["timestamp"] if events else None,
+            "keywords": [[w, n] for w, n in keywords.most_common(self.top_keywords)],
+            "kinds": dict(kinds),
+        }
+        summary["text"] = self.summarize([summary])
+        return summary
+
+    def merge(self, summaries: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Summary one level above a run of consecutive summaries.
+        """
+        keywords: Counter = Counter()
+        kinds: Counter = Counter()
+        for summary in summaries:
+            keywords.update(dict(summary["keywords"]))
+            kinds.update(summary["kinds"])
+        merged = {
+            "level": max(s["level"] for s in summaries) + 1,
+            "start": summaries[0]["start"],
+            "end": summaries[-1]["end"],
+            "count": sum(s["count"] for s in summaries),
+            "first": summaries[0]["first"],
+            "last": summaries[-1]["last"],
+            "keywords": [[w, n] for w, n in keywords.most_common(self.top_keywords)],
+            "kinds": dict(kinds),
+        }
+        merged["text"] = self.summarize([merged])
+        return merged
+
+    def patterns(self, events: List[Mapping[str, Any]], topics: int = 5) -> List[Pattern]:
+        """
+        Distinct (predicate, value) patterns of a run of events: its scalar metadata values
+        ("recurring_<field>") and its most frequent keywords ("recurring_topic").
+        """
+        found = set()
+        keywords: Counter = Counter()
+        for event in events:
+            for key, value in (event.get("metadata") or {}).items():
+                if isinstance(value, (str, int, float, bool)) and len(str(value)) <= 100:
+                    found.add((f"recurring_{key}", value))
+            keywords.update(set(_keywords(event["content"])))
+        found.update(("recurring_topic", w) for w, _ in keywords.most_common(topics))
+        return sorted(found, key=repr)
 
     def synthesize(self, horizon: int = 10) -> List[Dict[str, Any]]:
         """
         Produce a list of synthesized experiences.
         :param horizon: number of recent events to include.
-        :return: list of summary dicts.
+        :return: list of summary dicts, one per event kind (most frequent first), each with
+            the semantic facts about its keywords and the reflective insights mentioning them.
         """
-        # TODO: collect recent episodic events, integrate semantic facts and reflective entries
-        return []
+        events = self.episodic.get_recent(horizon)
+        groups: Dict[str, List[Mapping[str, Any]]] = {}
+        for event in events:
+            groups.setdefault(self.kind(event), []).append(event)
+        experiences = []
+        for kind, group in sorted(groups.items(), key=lambda item: -len(item[1])):
+            experience = self.describe(group)
+            experience["kind"] = kind
+            words = [w for w, _ in experience["keywords"][:3]]
+            experience["facts"] = [[w, p, o] for w in words for p, o in self.semantic.query_subject(w)]
+            experience["insights"] = [e["insight"] for w in words
+                                      for e in self.reflective.query_insights(w, limit=2)]
+            experiences.append(experience)
+        return experiences
 
     def summarize(self, items: List[Dict[str, Any]]) -> str:
         """
@@ -43,5 +155,21 @@ class ExperienceSynthesizer:
         :param items: experience summaries.
         :return: consolidated summary string.
         """
-        # TODO: generate summary, possibly via LLMInterface or template
-        return ""
+        if not items:
+            return ""
+        count = sum(item.get("count", 0) for item in items)
+        keywords: Counter = Counter()
+        kinds: Counter = Counter()
+        for item in items:
+            keywords.update(dict(item.get("keywords", ())))
+            kinds.update(item.get("kinds", {}))
+        firsts = [item["first"] for item in items if item.get("first")]
+        lasts = [item["last"] for item in items if item.get("last")]
+        text = f"{count} event(s)"
+        if firsts and lasts:
+            text += f" from {min(firsts)} to {max(lasts)}"
+        if kinds:
+            text += ": " + ", ".join(f"{n} {k}" for k, n in kinds.most_common(5))
+        if keywords:
+            text += "; about " + ", ".join(w for w, _ in keywords.most_common(self.top_keywords))
+        return text + "."
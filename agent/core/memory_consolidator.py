@@ -0,0 +1,330 @@
+"""
+memory_consolidator.py
+
+Sleep-time memory consolidation. While the agent sleeps, old episodic events are consolidated
+in fixed-size batches. Each batch goes through three steps:
+- Summarize: the batch becomes a level-0 summary (via ExperienceSynthesizer). Every `fanout`
+  summaries of one level merge into a summary one level up. Summaries are stored as
+  reflective insights, and higher levels get higher importance.
+- Promote: metadata values and topics that recur in `promote_after` batches become
+  SemanticMemory facts about "experience".
+- Advance: the cursor moves past the batch.
+After the batches, consolidated sealed segments are archived to cold storage and the vector
+index is refreshed.
+
+All progress (cursor, pending summaries per level, pattern counts) is kept in a JSON
+checkpoint, rewritten atomically after every batch. A run can therefore be interrupted
+between any two batches, at wake time or by a crash, and resumes where it stopped. A batch
+that is re-run after a crash repeats only idempotent writes: duplicate facts are ignored,
+and an identical summary is merged into the existing insight.
+
+on_sleep() runs the batches on the event loop, yielding between them, so the loop keeps
+serving heartbeats and SleepWake's schedule checks. The reindex callback may be a coroutine
+function such as MemoryIndexer.abuild_index, which reads the stores on the loop and embeds in
+a worker thread; no memory store is ever touched off the loop. When wake time arrives,
+on_wake can call stop(), or should_stop can poll the schedule.
+
+Typical wiring:
+    reindex = functools.partial(indexer.abuild_index, episodic, semantic, procedural, working, reflective)
+    consolidator = MemoryConsolidator(synthesizer, "data/consolidation.json", archive_dir="data/cold",
+                                      reindex=reindex)
+
+    async def on_wake():
+        consolidator.stop()
+
+    SleepWake(wake, sleep, on_wake=on_wake, on_sleep=consolidator.on_sleep)
+"""
+
+import os
+import json
+import time
+import asyncio
+import inspect
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Union
+from .experience_synthesizer import ExperienceSynthesizer
+from ..infra.file_manager import FileManager
+
+CHECKPOINT_FORMAT = 1
+
+# Subject of the facts promoted from recurring patterns
+EXPERIENCE_SUBJECT = "experience"
+
+
+async def _complete(awaitable: Awaitable[None]) -> None:
+    await awaitable
+
+
+class MemoryConsolidator:
+    """
+    Checkpointed, resumable consolidation of episodic memory into summaries and facts.
+    """
+
+    def __init__(self,
+                 synthesizer: ExperienceSynthesizer,
+                 checkpoint_path: str,
+                 archive_dir: Optional[str] = None,
+                 reindex: Optional[Callable[[], Union[None, Awaitable[None]]]] = None,
+                 should_stop: Optional[Callable[[], bool]] = None,
+                 batch_size: int = 500,
+                 fanout: int = 8,
+                 keep_recent: int = 1000,
+                 promote_after: int = 3,
+                 max_patterns: int = 10000,
+                 time_budget: Optional[float] = None):
+        """
+        :param synthesizer: ExperienceSynthesizer over the episodic, semantic and reflective stores.
+        :param checkpoint_path: JSON file holding the consolidation progress.
+        :param archive_dir: cold-storage directory for consolidated segments (None: no archiving).
+        :param reindex: callback refreshing the vector index, e.g. a MemoryIndexer.abuild_index
+            partial. It is called on the event loop; a coroutine is awaited there, and a plain
+            function blocks the loop until it returns.
+        :param should_stop: polled between batches; True interrupts the run (e.g. at wake time).
+        :param batch_size: events per level-0 summary.
+        :param fanout: summaries merged into one summary of the next level.
+        :param keep_recent: most recent events left alone (the waking working set).
+        :param promote_after: batches a pattern must recur in to be promoted to a fact.
+        :param max_patterns: pattern counts kept in the checkpoint (the least frequent are dropped).
+        :param time_budget: seconds a single run may take (None: until done or stopped).
+        """
+        self.synthesizer = synthesizer
+        self.checkpoint_path = checkpoint_path
+        self.archive_dir = archive_dir
+        self.reindex = reindex
+        self.should_stop = should_stop
+        self.batch_size = max(1, batch_size)
+        self.fanout = max(2, fanout)
+        self.keep_recent = max(0, keep_recent)
+        self.promote_after = max(1, promote_after)
+        self.max_patterns = max_patterns
+        self.time_budget = time_budget
+        self._stop = False
+        self.state = self._load_checkpoint()
+
+    # ------------------------------------------------------------------
+    # Checkpoint
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _initial_state() -> Dict[str, Any]:
+        return {"format": CHECKPOINT_FORMAT,
+                "cursor": 0,           # next event position to consolidate
+                "levels": [],          # per level, summaries not yet merged upwards
+                "patterns": {},        # JSON [predicate, value] -> batches seen in
+                "promoted": 0,
+                "archived": 0,         # events moved to cold storage
+                "indexed": 0,          # cursor at the last reindex
+                "summaries": 0}
+
+    def _load_checkpoint(self) -> Dict[str, Any]:
+        if not os.path.exists(self.checkpoint_path):
+            return self._initial_state()
+        state = json.loads(FileManager.read_text(self.checkpoint_path))
+        if state.get("format") != CHECKPOINT_FORMAT:
+            raise ValueError(f"Unsupported consolidation checkpoint format in {self.checkpoint_path}.")
+        return state
+
+    def _save_checkpoint(self) -> None:
+        """
+        Rewrite the checkpoint atomically (written next to it, then renamed over it).
+        """
+        tmp = f"{self.checkpoint_path}.tmp"
+        FileManager.write_text(tmp, json.dumps(self.state, separators=(",", ":"), default=str))
+        os.replace(tmp, self.checkpoint_path)
+
+    def reset(self) -> None:
+        """
+        Forget all progress (e.g. after episodic memory was cleared).
+        """
+        self.state = self._initial_state()
+        self._save_checkpoint()
+
+    # ------------------------------------------------------------------
+    # Steps
+    # ------------------------------------------------------------------
+
+    @property
+    def target(self) -> int:
+        """
+        Position up to which events are old enough to consolidate.
+        """
+        return max(0, len(self.synthesizer.episodic) - self.keep_recent)
+
+    @property
+    def pending(self) -> int:
+        """
+        Complete batches waiting to be consolidated.
+        """
+        return max(0, self.target - self.state["cursor"]) // self.batch_size
+
+    def _store_summary(self, summary: Dict[str, Any]) -> None:
+        self.synthesizer.reflective.add_insight(
+            summary["text"],
+            {"type": "summary", "level": summary["level"], "start": summary["start"],
+             "end": summary["end"], "first": summary["first"], "last": summary["last"]},
+            importance=1.0 + summary["level"])
+        self.state["summaries"] += 1
+
+    def _add_summary(self, summary: Dict[str, Any]) -> None:
+        """
+        Store a summary and merge full levels upwards.
+        """
+        levels: List[List[Dict[str, Any]]] = self.state["levels"]
+        while True:
+            self._store_summary(summary)
+            level = summary["level"]
+            while len(levels) <= level:
+                levels.append([])
+            levels[level].append(summary)
+            if len(levels[level]) < self.fanout:
+                return
+            summary = self.synthesizer.merge(levels[level])
+            levels[level] = []
+
+    def _promote(self, events: List[Any]) -> None:
+        """
+        Count the batch's patterns and turn those recurring often enough into facts.
+        """
+        counts: Dict[str, int] = self.state["patterns"]
+        semantic = self.synthesizer.semantic
+        for predicate, value in self.synthesizer.patterns(events):
+            key = json.dumps([predicate, value])
+            count = counts.get(key, 0) + 1
+            if count < self.promote_after:
+                counts[key] = count
+                continue
+            counts.pop(key, None)
+            if semantic.add_fact(EXPERIENCE_SUBJECT, predicate, value):
+                self.state["promoted"] += 1
+        if len(counts) > 2 * self.max_patterns:
+            kept = sorted(counts.items(), key=lambda item: -item[1])[:self.max_patterns]
+            self.state["patterns"] = dict(kept)
+
+    def step(self) -> bool:
+        """
+        Consolidate one batch and checkpoint.
+        :return: False if no complete batch was waiting.
+        """
+        episodic = self.synthesizer.episodic
+        cursor = self.state["cursor"]
+        if cursor > len(episodic):
+            self.reset()  # the timeline was cleared or replaced
+            cursor = 0
+        if self.target - cursor < self.batch_size:
+            return False
+        events = episodic.events_since(cursor, limit=self.batch_size)
+        self._add_summary(self.synthesizer.describe(events, start=cursor))
+        self._promote(events)
+        self.synthesizer.semantic.flush()
+        self.state["cursor"] = cursor + len(events)
+        self._save_checkpoint()
+        return True
+
+    def archive(self) -> int:
+        """
+        Move consolidated sealed segments to cold storage.
+        :return: number of events unloaded.
+        """
+        if self.archive_dir is None:
+            return 0
+        unloaded = self.synthesizer.episodic.archive(self.archive_dir, self.state["cursor"])
+        if unloaded:
+            self.state["archived"] += unloaded
+            self._save_checkpoint()
+        return unloaded
+
+    def refresh_index(self) -> bool:
+        """
+        Run the reindex callback if anything was consolidated since the last one.
+        A coroutine callback is run to completion on a new event loop.
+        """
+        if self.reindex is None or self.state["indexed"] == self.state["cursor"]:
+            return False
+        cursor = self.state["cursor"]
+        result = self.reindex()
+        if inspect.isawaitable(result):
+            asyncio.run(_complete(result))
+        self._indexed(cursor)
+        return True
+
+    async def arefresh_index(self) -> bool:
+        """
+        refresh_index() for the event loop owning the memory stores: a coroutine callback is
+        awaited on it.
+        """
+        if self.reindex is None or self.state["indexed"] == self.state["cursor"]:
+            return False
+        cursor = self.state["cursor"]
+        result = self.reindex()
+        if inspect.isawaitable(result):
+            await result
+        self._indexed(cursor)
+        return True
+
+    def _indexed(self, cursor: int) -> None:
+        self.state["indexed"] = cursor
+        self._save_checkpoint()
+
+    # ------------------------------------------------------------------
+    # Runs
+    # ------------------------------------------------------------------
+
+    def stop(self) -> None:
+        """
+        Ask a running consolidation to stop after its current batch (e.g. from on_wake).
+        """
+        self._stop = True
+
+    def _interrupted(self, deadline: Optional[float]) -> bool:
+        return (self._stop
+                or (self.should_stop is not None and self.should_stop())
+                or (deadline is not None and time.monotonic() >= deadline))
+
+    def run(self, max_batches: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Consolidate batches until none is waiting, or until the run is interrupted (stop(),
+        should_stop or time_budget) or max_batches were done. Then archive and reindex.
+        :return: run report.
+        """
+        self._stop = False
+        deadline = None if self.time_budget is None else time.monotonic() + self.time_budget
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            if self._interrupted(deadline):
+                return self._report(batches, interrupted=True)
+            if not self.step():
+                break
+            batches += 1
+        return self._finish(batches)
+
+    async def on_sleep(self) -> None:
+        """
+        SleepWake on_sleep callback: like run(), but yields to the event loop between batches,
+        so heartbeats and a wake-time stop() are served while consolidating. Batches, archive
+        and reindex all run on the loop, so they never race the agent's own writes to memory;
+        only the embedding inside an abuild_index reindex leaves it.
+        """
+        self._stop = False
+        deadline = None if self.time_budget is None else time.monotonic() + self.time_budget
+        while True:
+            if self._interrupted(deadline):
+                return
+            if not self.step():
+                break
+            await asyncio.sleep(0)
+        self.archive()
+        await self.arefresh_index()
+
+    def _finish(self, batches: int) -> Dict[str, Any]:
+        """
+        Archive and reindex after an uninterrupted run (an interrupted one leaves them to the next).
+        """
+        return self._report(batches, archived=self.archive(), reindexed=self.refresh_index())
+
+    def _report(self,
+                batches: int,
+                interrupted: bool = False,
+                archived: int = 0,
+                reindexed: bool = False) -> Dict[str, Any]:
+        return {"batches": batches, "interrupted": interrupted, "archived": archived,
+                "reindexed": reindexed, "cursor": self.state["cursor"], "pending": self.pending,
+                "summaries": self.state["summaries"], "promoted": self.state["promoted"]}
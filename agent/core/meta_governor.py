@@ -4,9 +4,11 @@ meta_governor.py
 Meta-cognitive governance: oversees self-reflection, critique, and self-improvement logic.
 """
 
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 from ..reasoning.llm_interface import LLMInterface
+from ..reasoning.token_budget import PromptSection
 from ..memory.reflective_memory import ReflectiveMemory
+from ..memory.context_builder import ContextBuilder
 
 class MetaGovernor:
     """
@@ -15,13 +17,17 @@ class MetaGovernor:
 
     def __init__(self,
                  llm: LLMInterface,
-                 reflective_memory: ReflectiveMemory):
+                 reflective_memory: ReflectiveMemory,
+                 context_builder: Optional[ContextBuilder] = None):
         """
         :param llm: LLMInterface for generating critiques and rewrites.
         :param reflective_memory: ReflectiveMemory instance for storing insights.
+        :param context_builder: selects relevant insights; defaults to the builder shared by
+            all components over reflective_memory (ContextBuilder.shared).
         """
         self.llm = llm
         self.reflective = reflective_memory
+        self.context = context_builder or ContextBuilder.shared(reflective_memory, llm.token_counter)
 
     def critique(self, action_summary: str, outcome_summary: str) -> str:
         """
@@ -30,12 +36,13 @@ class MetaGovernor:
         :param outcome_summary: description of the outcome.
         :return: critique text.
         """
-        prompt = (
-            "Critique the following action vs outcome:\n\n"
-            f"Action: {action_summary}\nOutcome: {outcome_summary}\n\n"
-            "Provide constructive feedback."
-        )
-        return self.llm.generate(prompt)
+        prompt = [
+            PromptSection("Critique the following action vs outcome:", priority=100, name="instructions"),
+            PromptSection(f"Action: {action_summary}", priority=20, name="action", keep="middle"),
+            PromptSection(f"Outcome: {outcome_summary}", priority=10, name="outcome", keep="middle"),
+            PromptSection("Provide constructive feedback.", priority=100, name="format"),
+        ]
+        return self.llm.generate(prompt, cache=True, call_site="meta_governor.critique")
 
     def add_insight(self, insight: str, metadata: Dict[str, Any] = None) -> None:
         """
@@ -51,8 +58,9 @@ class MetaGovernor:
         # TODO: implement self-rewriting based on critique
         pass
 
-    def review_reflections(self, limit: int = 5) -> List[Dict[str, Any]]:
+    def review_reflections(self, limit: int = 5, query: Optional[str] = None) -> List[Dict[str, Any]]:
         """
-        Retrieve recent reflective insights for reporting or act planning.
+        Retrieve reflective insights for reporting or act planning, best first.
+        :param query: optional topic; without it the most recent insights are returned.
         """
-        return self.reflective.query_insights("", limit)
+        return self.context.select_insights(query, limit)
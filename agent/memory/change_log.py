@@ -0,0 +1,87 @@
+"""
+change_log.py
+
+Change tracking for memory stores. Each store appends ("add" | "remove" | "clear", key)
+records to its ChangeLog; consumers such as MemoryIndexer keep an integer cursor and only
+process what changed since their last visit. Each log also carries an epoch token: a cursor
+is only meaningful for the epoch it was taken in. Persistent stores save (epoch, cursor) with
+their data and restore() it on load, so a consumer that saved its own cursor can resume
+after a restart instead of rescanning.
+"""
+
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+Change = Tuple[str, Any]
+
+class ChangeLog:
+    """
+    Bounded append-only log of changes addressed by a monotonically increasing cursor.
+    """
+
+    def __init__(self, max_entries: int = 100000):
+        """
+        :param max_entries: records kept; consumers further behind must resynchronize.
+        """
+        self.max_entries = max_entries
+        self.epoch = uuid.uuid4().hex
+        self._changes: List[Change] = []
+        self._base = 0
+
+    @property
+    def cursor(self) -> int:
+        """
+        Cursor positioned after the latest change.
+        """
+        return self._base + len(self._changes)
+
+    def record(self, op: str, key: Any = None) -> None:
+        """
+        Append a change: "add" (new or updated key), "remove" (deleted key) or "clear".
+        """
+        if op == "clear":
+            # Nothing before a clear matters to a consumer that sees the clear itself
+            self._base += len(self._changes)
+            self._changes = []
+        self._changes.append((op, key))
+        if len(self._changes) > self.max_entries:
+            drop = len(self._changes) - self.max_entries // 2
+            self._base += drop
+            del self._changes[:drop]
+
+    def reset(self) -> None:
+        """
+        Invalidate every consumer cursor, e.g. after a store was reloaded wholesale;
+        consumers rescan the store on their next visit.
+        """
+        self._base = self.cursor + 1
+        self._changes = []
+        self.epoch = uuid.uuid4().hex
+
+    def state(self) -> Dict[str, Any]:
+        """
+        The (epoch, cursor) position to persist alongside the store's data.
+        """
+        return {"epoch": self.epoch, "cursor": self.cursor}
+
+    def restore(self, state: Optional[Dict[str, Any]]) -> None:
+        """
+        Continue a persisted log: consumers holding a cursor of that epoch up to its position
+        see no changes, older ones must rescan. Without a state this is reset().
+        """
+        if not state:
+            self.reset()
+            return
+        self.epoch = state["epoch"]
+        self._base = int(state["cursor"])
+        self._changes = []
+
+    def since(self, cursor: int, epoch: Optional[str] = None) -> Optional[List[Change]]:
+        """
+        Changes recorded after cursor, or None if they are no longer available
+        (the consumer must then rescan the store).
+        :param epoch: epoch the cursor was taken in, if known; another epoch means a rescan.
+        """
+        if cursor < self._base or cursor > self.cursor or (epoch is not None and epoch != self.epoch):
+            return None
+        return self._changes[cursor - self._base:]
@@ -0,0 +1,198 @@
+"""
+context_builder.py
+
+Assembles size-bounded prompt context from memory. Reflective insights and episodic events
+are indexed incrementally (only entries added or removed since the last call are processed;
+removed entries are tombstoned, and the index is rebuilt once tombstones outnumber live
+documents), and for a query the most relevant and most recent items are selected, together
+with semantic facts about the query's terms, until a token budget is filled.
+ContextBuilder.shared() returns one builder per reflective store, so components reading the
+same memory share a single index.
+"""
+
+import weakref
+from typing import Any, Dict, List, Optional, Tuple
+from .text_index import TextIndex, tokenize
+from .episodic_memory import EpisodicMemory
+from .reflective_memory import ReflectiveMemory
+from .semantic_memory import SemanticMemory
+from ..reasoning.token_budget import TokenCounter
+
+class ContextBuilder:
+    """
+    Selects top-k memory items for a query under a token budget.
+    """
+
+    def __init__(self,
+                 reflective: Optional[ReflectiveMemory] = None,
+                 episodic: Optional[EpisodicMemory] = None,
+                 semantic: Optional[SemanticMemory] = None,
+                 counter: Optional[TokenCounter] = None,
+                 recency_weight: float = 0.3,
+                 half_life: float = 200.0):
+        """
+        :param reflective: ReflectiveMemory providing insights.
+        :param episodic: EpisodicMemory providing events.
+        :param semantic: SemanticMemory providing facts about query terms.
+        :param counter: TokenCounter used to measure items against the budget.
+        :param recency_weight: share of an item's score given to recency (0 = relevance only).
+        :param half_life: recency half-life, in entries added after the item.
+        """
+        self.reflective = reflective
+        self.episodic = episodic
+        self.semantic = semantic
+        self.counter = counter or TokenCounter()
+        self.recency_weight = recency_weight
+        self.half_life = half_life
+        self._insights = TextIndex()
+        self._episodes = TextIndex()
+        # name -> (next entry id to index, change-log cursor)
+        self._cursors: Dict[str, Tuple[int, Optional[int]]] = {"insights": (0, None), "episodes": (0, None)}
+        # name -> store entry id -> text index document id (entries that can be removed)
+        self._docs: Dict[str, Dict[Any, int]] = {"insights": {}, "episodes": {}}
+
+    _shared: "weakref.WeakKeyDictionary[ReflectiveMemory, ContextBuilder]" = weakref.WeakKeyDictionary()
+
+    @classmethod
+    def shared(cls, reflective: ReflectiveMemory, counter: Optional[TokenCounter] = None) -> "ContextBuilder":
+        """
+        Return the builder shared by every component reading insights from reflective,
+        creating it on first use, so the store is indexed once rather than per component.
+        :param counter: TokenCounter for a newly created builder (an existing one keeps its own).
+        """
+        builder = cls._shared.get(reflective)
+        if builder is None:
+            builder = cls._shared[reflective] = cls(reflective=reflective, counter=counter)
+        return builder
+
+    # ------------------------------------------------------------------
+    # Incremental indexing
+    # ------------------------------------------------------------------
+
+    def _sync(self, name: str, index: TextIndex, store: Any, fetch: str, text_field: str) -> None:
+        if store is None:
+            return
+        cursor, seen = self._cursors[name]
+        docs = self._docs[name]
+        if seen is not None:
+            changes = store.changes.since(seen)
+            if changes is None or any(op == "clear" for op, _ in changes):
+                # Store was cleared or replaced: start over
+                index.clear()
+                docs.clear()
+                cursor = 0
+            else:
+                for op, key in changes:
+                    if op == "remove" and key in docs:
+                        index.remove(docs.pop(key))
+                if index.dead > len(index):
+                    # Mostly tombstones: rebuild from the live entries
+                    index.clear()
+                    docs.clear()
+                    cursor = 0
+        for entry in getattr(store, fetch)(cursor):
+            metadata = " ".join(str(v) for v in entry.get("metadata", {}).values())
+            doc_id = index.add(f"{entry[text_field]} {metadata}", entry)
+            if entry.get("id") is not None:
+                docs[entry["id"]] = doc_id
+        self._cursors[name] = (store.next_id, store.changes.cursor)
+
+    def refresh(self) -> None:
+        """
+        Index entries added to the memory stores since the last refresh.
+        """
+        self._sync("insights", self._insights, self.reflective, "entries_since", "insight")
+        self._sync("episodes", self._episodes, self.episodic, "events_since", "content")
+
+    # ------------------------------------------------------------------
+    # Selection
+    # ------------------------------------------------------------------
+
+    def _search(self, index: TextIndex, query: Optional[str], k: int) -> List[Tuple[float, Dict[str, Any]]]:
+        self.refresh()
+        return index.search(query, top_k=k, recency_weight=self.recency_weight, half_life=self.half_life)
+
+    def select_insights(self, query: Optional[str] = None, k: int = 5) -> List[Dict[str, Any]]:
+        """
+        Return the k best insights for query (the k most recent when query is empty), best first.
+        """
+        if not query and self.reflective is not None:
+            return list(reversed(self.reflective.get_recent(k)))
+        return [entry for _, entry in self._search(self._insights, query, k)]
+
+    def select_episodes(self, query: Optional[str] = None, k: int = 5) -> List[Dict[str, Any]]:
+        """
+        Return the k best episodic events for query (the k most recent when query is empty), best first.
+        """
+        if not query and self.episodic is not None:
+            return list(reversed(self.episodic.get_recent(k)))
+        return [entry for _, entry in self._search(self._episodes, query, k)]
+
+    def select_facts(self, query: Optional[str], k: int = 5) -> List[Tuple[str, str, Any]]:
+        """
+        Return up to k (subject, predicate, object) facts whose subject is a term of the query.
+        """
+        if self.semantic is None or not query:
+            return []
+        facts: List[Tuple[str, str, Any]] = []
+        seen = set()
+        for term in [w.strip(".,;:!?\"'()") for w in query.split()] + tokenize(query):
+            if not term or term in seen:
+                continue
+            seen.add(term)
+            for predicate, obj in self.semantic.query_subject(term):
+                facts.append((term, predicate, obj))
+                if len(facts) >= k:
+                    return facts
+        return facts
+
+    def build(self, query: Optional[str], max_tokens: int, k: int = 10) -> Dict[str, List[Any]]:
+        """
+        Select insights, episodes and facts for query, best first across all sources,
+        until max_tokens is used. Items that would overflow the budget are skipped.
+        :param k: candidates considered per source.
+        :return: dict with 'insights', 'episodes' and 'facts' lists, each best first.
+        """
+        candidates: List[Tuple[float, str, Any]] = []
+        if self.reflective is not None:
+            candidates.extend((score, "insights", e)
+                              for score, e in self._search(self._insights, query, k))
+        if self.episodic is not None:
+            candidates.extend((score, "episodes", e)
+                              for score, e in self._search(self._episodes, query, k))
+        # Facts are exact subject matches: rank them ahead of fuzzy text matches
+        candidates.extend((2.0, "facts", f) for f in self.select_facts(query, k))
+        candidates.sort(key=lambda c: c[0], reverse=True)
+
+        context: Dict[str, List[Any]] = {"insights": [], "episodes": [], "facts": []}
+        remaining = max_tokens
+        for _, kind, item in candidates:
+            cost = self.counter.count(self.format_item(kind, item)) + 1
+            if cost <= remaining:
+                context[kind].append(item)
+                remaining -= cost
+        return context
+
+    @staticmethod
+    def format_item(kind: str, item: Any) -> str:
+        """
+        Render one selected item as a single bullet line.
+        """
+        if kind == "insights":
+            return f"- {item['insight']}"
+        if kind == "episodes":
+            return f"- [{item.get('timestamp', '')}] {item['content']}"
+        subject, predicate, obj = item
+        return f"- {subject} {predicate} {obj}"
+
+    def render(self, context: Dict[str, List[Any]]) -> str:
+        """
+        Render a build() result as titled bullet lists, omitting empty groups.
+        """
+        titles = {"insights": "Insights", "episodes": "Recent events", "facts": "Known facts"}
+        blocks = []
+        for kind, title in titles.items():
+            items = context.get(kind) or []
+            if items:
+                blocks.append(f"{title}:\n" + "\n".join(self.format_item(kind, i) for i in items))
+        return "\n\n".join(blocks)
@@ -0,0 +1,184 @@
+"""
+embedding_pipeline.py
+
+Batched, parallel embedding. Texts are grouped into micro-batches bounded by item count and
+total characters, batches run on a thread or process pool with a bounded number in flight,
+failed batches are retried with backoff, and results come back in input order.
+Works with per-item embed functions (text -> vector) and batch-capable ones (texts -> vectors).
+"""
+
+import time
+import threading
+import concurrent.futures
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Iterable, List, Tuple
+
+
+def _embed_batch(embed_fn: Callable[..., Any],
+                 batched: bool,
+                 texts: List[str],
+                 retries: int,
+                 backoff: float) -> Tuple[List[Any], int]:
+    """
+    Embed one batch, retrying on failure. Module-level so process pools can pickle it.
+    :return: (vectors, retries used).
+    """
+    attempt = 0
+    while True:
+        try:
+            if batched:
+                vectors = list(embed_fn(texts))
+                if len(vectors) != len(texts):
+                    raise ValueError(f"Embedding function returned {len(vectors)} vectors for {len(texts)} texts.")
+                return vectors, attempt
+            return [embed_fn(t) for t in texts], attempt
+        except Exception:
+            if attempt >= retries:
+                raise
+            time.sleep(backoff * (2 ** attempt))
+            attempt += 1
+
+
+class EmbeddingPipeline:
+    """
+    Micro-batching embedding front end; callable as a per-item embed function as well.
+    """
+
+    def __init__(self,
+                 embed_fn: Callable[..., Any],
+                 batched: bool = False,
+                 max_batch_size: int = 64,
+                 max_batch_chars: int = 32000,
+                 workers: int = 4,
+                 executor: str = "thread",
+                 max_pending: int = 8,
+                 retries: int = 2,
+                 backoff: float = 0.5):
+        """
+        :param embed_fn: text -> vector, or texts -> vectors when batched is True.
+        :param batched: embed_fn accepts a list of texts.
+        :param max_batch_size: maximum texts per batch.
+        :param max_batch_chars: maximum total characters per batch (a longer single text gets its own batch).
+        :param workers: pool size.
+        :param executor: "thread" or "process" (process requires a picklable embed_fn).
+        :param max_pending: maximum batches submitted but not yet collected.
+        :param retries: retries per failed batch before the error is raised.
+        :param backoff: initial retry delay in seconds, doubled per attempt.
+        """
+        if executor not in ("thread", "process"):
+            raise ValueError(f"Unknown executor '{executor}'.")
+        self.embed_fn = embed_fn
+        self.batched = batched
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_batch_chars = max_batch_chars
+        self.workers = max(1, workers)
+        self.executor = executor
+        self.max_pending = max(1, max_pending)
+        self.retries = retries
+        self.backoff = backoff
+        self._pool = None
+        self._lock = threading.Lock()
+        self._stats = {"texts": 0, "batches": 0, "retries": 0, "failures": 0, "seconds": 0.0}
+
+    def _executor(self) -> concurrent.futures.Executor:
+        with self._lock:
+            if self._pool is None:
+                if self.executor == "process":
+                    self._pool = concurrent.futures.ProcessPoolExecutor(self.workers)
+                else:
+                    self._pool = concurrent.futures.ThreadPoolExecutor(self.workers, thread_name_prefix="embed")
+            return self._pool
+
+    def batches(self, texts: Iterable[str]) -> Iterable[List[str]]:
+        """
+        Group texts into consecutive micro-batches bounded by count and characters.
+        """
+        batch: List[str] = []
+        size = 0
+        for text in texts:
+            if batch and (len(batch) >= self.max_batch_size or size + len(text) > self.max_batch_chars):
+                yield batch
+                batch, size = [], 0
+            batch.append(text)
+            size += len(text)
+        if batch:
+            yield batch
+
+    def embed(self, texts: Iterable[str]) -> List[Any]:
+        """
+        Embed texts and return vectors in input order.
+        :raises Exception: the last error of a batch that failed after all retries.
+        """
+        started = time.perf_counter()
+        results: List[Any] = []
+        if self.workers == 1 and self.executor == "thread":
+            # Serial path: no pool hand-off
+            for batch in self.batches(texts):
+                vectors, retried = self._run(batch)
+                results.extend(vectors)
+                self._record(len(batch), retried)
+        else:
+            pool = self._executor()
+            pending: Deque[Tuple[concurrent.futures.Future, int]] = deque()
+            try:
+                for batch in self.batches(texts):
+                    if len(pending) >= self.max_pending:
+                        results.extend(self._collect(*pending.popleft()))
+                    pending.append((pool.submit(_embed_batch, self.embed_fn, self.batched, batch,
+                                                self.retries, self.backoff), len(batch)))
+                while pending:
+                    results.extend(self._collect(*pending.popleft()))
+            finally:
+                for future, _ in pending:
+                    future.cancel()
+        with self._lock:
+            self._stats["seconds"] += time.perf_counter() - started
+        return results
+
+    def _run(self, batch: List[str]) -> Tuple[List[Any], int]:
+        try:
+            return _embed_batch(self.embed_fn, self.batched, batch, self.retries, self.backoff)
+        except Exception:
+            with self._lock:
+                self._stats["failures"] += 1
+            raise
+
+    def _collect(self, future: concurrent.futures.Future, size: int) -> List[Any]:
+        try:
+            vectors, retried = future.result()
+        except Exception:
+            with self._lock:
+                self._stats["failures"] += 1
+            raise
+        self._record(size, retried)
+        return vectors
+
+    def _record(self, size: int, retried: int) -> None:
+        with self._lock:
+            self._stats["texts"] += size
+            self._stats["batches"] += 1
+            self._stats["retries"] += retried
+
+    def __call__(self, text: str) -> Any:
+        """
+        Embed a single text (per-item embed_fn compatibility).
+        """
+        return self.embed([text])[0]
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return totals and throughput (texts_per_sec over time spent inside embed()).
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        stats["texts_per_sec"] = stats["texts"] / stats["seconds"] if stats["seconds"] else 0.0
+        return stats
+
+    def close(self) -> None:
+        """
+        Shut down the worker pool.
+        """
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
@@ -2,71 +2,375 @@
 episodic_memory.py
 
 Episodic memory stores a timeline of experiences (events) with timestamp and metadata.
-Supports adding, querying, persisting events.
+Supports adding, querying (by keyword or time range) and persisting events.
+
+The timeline is append-only and time-partitioned: new events go to an in-memory tail, and a
+full tail is sealed into a segment. Tail and segments store events column-wise (EventColumns:
+int64 epoch timestamps, a content arena, interned metadata keys); queries return read-only
+EventView mappings with the usual "timestamp", "content" and "metadata" keys. Segments are written as JSONL files next to a manifest
+holding each segment's position and first/last timestamps, so lookups by position or time
+bisect the manifest and load only the segments they need. The manifest also lists each
+segment's tokens and metadata fields; they feed a term-to-segment index, so a keyword query
+loads only the segments that can hold a match. Reopening a store reads only the
+manifest and the tail. archive() moves old sealed segments of a memory-only store to cold
+storage, after which they are loaded the same way.
 """
 
+import os
+import json
+import time
+import bisect
 import datetime
-from typing import Any, Dict, List, Optional
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+from .change_log import ChangeLog
+from .keyword_index import KeywordIndex, matches
+from .episodic_segments import Segment, write_atomic, dump_events, read_events, index_events
+from .event_columns import EventColumns, EventView, to_epoch_us
+
+MANIFEST = "manifest.json"
+TAIL = "tail.jsonl"
+
+Timestamp = Union[str, datetime.datetime]
+
+def _timestamp(value: Optional[Timestamp]) -> Optional[int]:
+    """
+    Normalize a bound to the stored format (epoch microseconds).
+    """
+    return None if value is None else to_epoch_us(value)
+
 
 class EpisodicMemory:
     """
     Manages episodic memory entries for the agent.
     """
 
-    def __init__(self):
+    def __init__(self,
+                 storage_dir: Optional[str] = None,
+                 segment_size: int = 20000,
+                 cached_segments: int = 8):
         """
         Initialize the episodic memory store.
+        :param storage_dir: directory sealed segments are written to (None keeps them in memory
+            until save_to_file); use load_from_file to reopen an existing store.
+        :param segment_size: events per sealed segment.
+        :param cached_segments: on-disk segments kept loaded at once (LRU).
+        """
+        self.storage_dir = storage_dir
+        self.segment_size = max(1, segment_size)
+        self.cached_segments = max(1, cached_segments)
+        self._segments: List[Segment] = []
+        self._starts: List[int] = []
+        self._firsts: List[int] = []
+        self._lasts: List[int] = []
+        self._loaded: "OrderedDict[int, Segment]" = OrderedDict()
+        self._tail = EventColumns()
+        self._index = KeywordIndex()
+        # Segment positions by token and metadata field; segments without known terms are
+        # always searched
+        self._segment_terms = KeywordIndex(scan_density=float("inf"))
+        self._unmapped: List[int] = []
+        self.changes = ChangeLog()
+
+    # ------------------------------------------------------------------
+    # Segments
+    # ------------------------------------------------------------------
+
+    @property
+    def _tail_start(self) -> int:
+        return self._segments[-1].end if self._segments else 0
+
+    @property
+    def _last_timestamp(self) -> Optional[int]:
+        if len(self._tail):
+            return self._tail.timestamps[-1]
+        return self._lasts[-1] if self._lasts else None
+
+    def _resident(self, position: int) -> Segment:
+        """
+        Return segment number `position`, loading it from disk if necessary.
+        """
+        segment = self._segments[position]
+        if segment.path is None:
+            return segment  # memory-only, always resident
+        if position in self._loaded:
+            self._loaded.move_to_end(position)
+            return segment
+        segment.load()
+        self._cache(position, segment)
+        return segment
+
+    def _cache(self, position: int, segment: Segment) -> None:
+        """
+        Mark an on-disk segment as most recently used, unloading the least recently used
+        ones beyond cached_segments.
+        """
+        self._loaded[position] = segment
+        self._loaded.move_to_end(position)
+        while len(self._loaded) > self.cached_segments:
+            _, evicted = self._loaded.popitem(last=False)
+            evicted.unload()
+
+    def _register(self, segment: Segment) -> None:
+        if segment.terms is None or segment.fields is None:
+            self._unmapped.append(len(self._segments))
+        else:
+            self._segment_terms.add_terms(len(self._segments), segment.terms, segment.fields)
+        self._segments.append(segment)
+        self._starts.append(segment.start)
+        self._firsts.append(segment.first)
+        self._lasts.append(segment.last)
+
+    def _seal(self) -> None:
+        """
+        Turn the tail into a segment (written to storage_dir when one is set).
+        """
+        segment = Segment.seal(self._tail_start, self._tail, self._index)
+        self._register(segment)
+        self._tail, self._index = EventColumns(), KeywordIndex()
+        if self.storage_dir is not None:
+            segment.write(self.storage_dir)
+            self._write_manifest(self.storage_dir)
+            self._cache(len(self._segments) - 1, segment)
+
+    def _parts(self,
+               first: int = 0,
+               last: Optional[int] = None,
+               positions: Optional[Iterable[int]] = None) -> Iterable[Tuple[int, EventColumns, KeywordIndex]]:
+        """
+        Yield (start, events, keyword index) for segments first..last (or the given
+        increasing positions), then the tail.
+        """
+        if positions is None:
+            positions = range(first, len(self._segments) if last is None else last)
+        for position in positions:
+            segment = self._resident(position)
+            yield segment.start, segment.events, segment.index
+        yield self._tail_start, self._tail, self._index
+
+    def _keyword_segments(self, keyword: str, filters: Optional[Dict[str, Any]]) -> Iterable[int]:
+        """
+        Increasing positions of the sealed segments that may hold a match.
         """
-        self._events: List[Dict[str, Any]] = []
+        positions = self._segment_terms.candidates(keyword, filters)
+        if positions is None:
+            return range(len(self._segments))
+        if self._unmapped:
+            return sorted(set(positions).union(self._unmapped))
+        return positions
+
+    # ------------------------------------------------------------------
+    # Events
+    # ------------------------------------------------------------------
 
     def add_event(self, content: str, metadata: Optional[Dict[str, Any]] = None) -> None:
         """
-        Add a new event to memory.
+        Add a new event to memory. Its timestamp is clamped to the previous event's, so the
+        timeline stays sorted (and bisectable) even if the wall clock steps backwards.
         :param content: Description of the event.
         :param metadata: Optional additional data.
         """
-        event = {
-            "timestamp": datetime.datetime.utcnow().isoformat(),
-            "content": content,
-            "metadata": metadata or {}
-        }
-        self._events.append(event)
+        timestamp = time.time_ns() // 1000
+        last = self._last_timestamp
+        if last is not None and timestamp < last:
+            timestamp = last
+        row = self._tail.append(timestamp, content, metadata)
+        self._index.add(row, content, metadata)
+        self.changes.record("add", self._tail_start + len(self._tail) - 1)
+        if len(self._tail) >= self.segment_size:
+            self._seal()
 
-    def query(self, keyword: str, limit: int = 10) -> List[Dict[str, Any]]:
+    def query(self,
+              keyword: str,
+              limit: int = 10,
+              filters: Optional[Dict[str, Any]] = None) -> List[EventView]:
         """
-        Query events containing a keyword in content or metadata.
+        Query events containing a keyword in content or metadata, oldest first.
+        Segments whose terms cannot match are skipped without being loaded; in the others the
+        segment's keyword index supplies candidates, and only they are checked against the keyword.
         :param keyword: Search term.
         :param limit: Maximum number of events to return.
+        :param filters: Optional metadata fields the events must equal.
         :return: List of matching events.
         """
-        matches = [e for e in self._events
-                   if keyword.lower() in e["content"].lower()
-                   or any(keyword.lower() in str(v).lower() for v in e["metadata"].values())]
-        return matches[:limit]
+        found: List[EventView] = []
+        if limit <= 0:
+            return found
+        for _, events, index in self._parts(positions=self._keyword_segments(keyword, filters)):
+            candidates = index.candidates(keyword, filters)
+            if candidates is None:
+                candidates = range(len(events))
+            for row in candidates:
+                if matches(keyword, events.content(row), events.metadata(row), filters):
+                    found.append(events.view(row))
+                    if len(found) >= limit:
+                        return found
+        return found
+
+    def query_range(self,
+                    start: Optional[Timestamp] = None,
+                    end: Optional[Timestamp] = None,
+                    limit: Optional[int] = None) -> List[EventView]:
+        """
+        Return events with start <= timestamp < end, oldest first.
+        Only segments overlapping the range are loaded.
+        :param start: inclusive lower bound (datetime or ISO string; None = unbounded).
+        :param end: exclusive upper bound (datetime or ISO string; None = unbounded).
+        :param limit: Maximum number of events to return.
+        """
+        start, end = _timestamp(start), _timestamp(end)
+        first = bisect.bisect_left(self._lasts, start) if start is not None else 0
+        last = bisect.bisect_left(self._firsts, end) if end is not None else len(self._segments)
+        found: List[EventView] = []
+        for _, events, _ in self._parts(first, max(first, last)):
+            timestamps = events.timestamps
+            lo = bisect.bisect_left(timestamps, start) if start is not None else 0
+            hi = bisect.bisect_left(timestamps, end, lo) if end is not None else len(timestamps)
+            found.extend(events.views(lo, hi))
+            if limit is not None and len(found) >= limit:
+                return found[:limit]
+        return found
 
-    def get_recent(self, count: int = 5) -> List[Dict[str, Any]]:
+    def get_recent(self, count: int = 5) -> List[EventView]:
         """
         Retrieve the most recent events.
         :param count: Number of events to return.
         """
-        return self._events[-count:]
+        if count <= 0:
+            return []
+        recent = self._tail.views(-count)
+        position = len(self._segments) - 1
+        while len(recent) < count and position >= 0:
+            events = self._resident(position).events
+            recent = events.views(-(count - len(recent))) + recent
+            position -= 1
+        return recent
+
+    def get_event(self, index: int) -> EventView:
+        """
+        Return the event at a position in the timeline.
+        """
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("event index out of range")
+        if index >= self._tail_start:
+            return self._tail.view(index - self._tail_start)
+        position = bisect.bisect_right(self._starts, index) - 1
+        segment = self._resident(position)
+        return segment.events.view(index - segment.start)
+
+    def events_since(self, cursor: int, limit: Optional[int] = None) -> List[EventView]:
+        """
+        Return events added after the first `cursor` events (for incremental indexing).
+        :param limit: Maximum number of events to return (only the segments holding them are loaded).
+        """
+        cursor = max(0, cursor)
+        stop = None if limit is None else cursor + max(0, limit)
+        if cursor >= self._tail_start:
+            return self._tail.views(cursor - self._tail_start, None if stop is None else stop - self._tail_start)
+        found: List[EventView] = []
+        for start, events, _ in self._parts(bisect.bisect_right(self._starts, cursor) - 1):
+            if stop is not None and start >= stop:
+                break
+            found.extend(events.views(max(0, cursor - start), None if stop is None else stop - start))
+        return found
+
+    def archive(self, directory: str, before: int) -> int:
+        """
+        Move sealed segments that end at or before position `before` out of memory. Segments
+        held only in memory are written to directory first; all of them are then unloaded and
+        are read back from disk only if a query reaches them.
+        :param directory: cold-storage directory for memory-only segments.
+        :param before: timeline position up to which events may leave memory.
+        :return: number of events unloaded.
+        """
+        unloaded = 0
+        for position, segment in enumerate(self._segments):
+            if segment.end > before:
+                break
+            if not segment.loaded:
+                continue
+            if segment.path is None:
+                segment.write(directory)
+            self._loaded.pop(position, None)
+            segment.unload()
+            unloaded += segment.count
+        return unloaded
+
+    @property
+    def next_id(self) -> int:
+        """
+        Position the next event will take (a cursor for events_since).
+        """
+        return len(self)
+
+    def __len__(self) -> int:
+        return self._tail_start + len(self._tail)
 
     def clear(self) -> None:
         """
-        Clear all episodic memory events.
+        Clear all episodic memory events. Files in storage_dir are replaced on the next seal or save.
+        """
+        self._segments, self._starts, self._firsts, self._lasts = [], [], [], []
+        self._loaded.clear()
+        self._tail = EventColumns()
+        self._index.clear()
+        self._segment_terms.clear()
+        self._unmapped = []
+        self.changes.record("clear")
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+
+    def _write_manifest(self, directory: str, complete: bool = False) -> None:
+        """
+        :param complete: the tail file is current too, so the change-log position is recorded
+            and consumers that saved their own cursor resume from it after a reload.
         """
-        self._events.clear()
+        manifest = {"format": 1,
+                    "count": len(self),
+                    "segment_size": self.segment_size,
+                    "segments": [s.record() for s in self._segments],
+                    "tail": TAIL}
+        if complete:
+            manifest["changes"] = self.changes.state()
+        write_atomic(os.path.join(directory, MANIFEST), json.dumps(manifest, indent=2))
 
     def save_to_file(self, path: str) -> None:
         """
-        Persist memory events to disk as JSON.
-        TODO: implement file write (e.g., via infra.file_manager).
+        Persist memory events to a store directory: one JSONL file per sealed segment, the
+        tail, and a manifest. Segments already stored there are not rewritten.
+        The directory becomes the store's storage_dir, and sealed segments become lazily loaded.
+        :param path: store directory.
         """
-        pass
+        os.makedirs(path, exist_ok=True)
+        for position, segment in enumerate(self._segments):
+            target = os.path.join(path, Segment.file_name(segment.start))
+            if segment.path is not None and os.path.abspath(segment.path) == os.path.abspath(target):
+                continue
+            self._resident(position).write(path)
+            self._cache(position, segment)
+        write_atomic(os.path.join(path, TAIL), dump_events(self._tail))
+        self._write_manifest(path, complete=True)
+        self.storage_dir = path
 
     def load_from_file(self, path: str) -> None:
         """
-        Load memory events from disk.
-        TODO: implement file read and parsing.
+        Open a store directory written by save_to_file. Only the manifest and the tail are
+        read; segments are loaded when a query reaches them.
+        The change log continues from the saved position, so consumers whose cursor is that
+        position see no changes; any other consumer rescans the store.
+        :param path: store directory.
         """
-        pass
+        with open(os.path.join(path, MANIFEST), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        self.clear()
+        for record in manifest["segments"]:
+            self._register(Segment.from_record(record, path))
+        tail_path = os.path.join(path, manifest.get("tail", TAIL))
+        self._tail = read_events(tail_path) if os.path.exists(tail_path) else EventColumns()
+        self._index = index_events(self._tail)
+        self.storage_dir = path
+        self.changes.restore(manifest.get("changes"))
@@ -0,0 +1,155 @@
+"""
+episodic_segments.py
+
+Sealed segments of the episodic timeline. A segment is a run of consecutive events written
+as one JSONL file and described in the store manifest by its global start position, size and
+first/last timestamps, so it can be located without being read. The record also lists the
+segment's tokens and metadata fields, so keyword queries skip segments that cannot match
+without reading them. Its events (as EventColumns, whose int64 timestamp column is bisected
+by range queries) and keyword index are loaded only when a query needs them.
+"""
+
+import os
+import json
+from typing import Any, Dict, List, Optional, Tuple
+from .keyword_index import KeywordIndex
+from .event_columns import EventColumns, to_epoch_us, from_epoch_us
+
+def write_atomic(path: str, text: str) -> None:
+    """
+    Write text to path through a temporary file, so readers never see a partial file.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+def dump_events(events: EventColumns) -> str:
+    """
+    Serialize events as JSON lines (non-JSON metadata values are stored as strings).
+    """
+    return "".join(json.dumps(events.to_dict(row), default=str) + "\n" for row in range(len(events)))
+
+def read_events(path: str) -> EventColumns:
+    """
+    Read events from a JSONL file.
+    """
+    events = EventColumns()
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                events.append_event(json.loads(line))
+    return events
+
+def index_events(events: EventColumns) -> KeywordIndex:
+    """
+    Build a keyword index over events, with rows as document ids.
+    """
+    index = KeywordIndex()
+    for row in range(len(events)):
+        index.add(row, events.content(row), events.metadata(row))
+    return index
+
+
+class Segment:
+    """
+    Consecutive events [start, start + count) of the timeline, resident or on disk.
+    """
+
+    def __init__(self,
+                 start: int,
+                 count: int,
+                 first: int,
+                 last: int,
+                 path: Optional[str] = None,
+                 terms: Optional[List[str]] = None,
+                 fields: Optional[List[Tuple[Any, str]]] = None):
+        """
+        :param start: global position of the first event.
+        :param count: number of events.
+        :param first: timestamp of the first event (epoch microseconds).
+        :param last: timestamp of the last event (epoch microseconds).
+        :param path: JSONL file holding the events (None while the segment is memory-only).
+        :param terms: tokens of the events' content and metadata (None if unknown).
+        :param fields: metadata field keys of the events (None if unknown).
+        """
+        self.start = start
+        self.count = count
+        self.first = first
+        self.last = last
+        self.path = path
+        self.terms = terms
+        self.fields = fields
+        self.events: Optional[EventColumns] = None
+        self.index: Optional[KeywordIndex] = None
+
+    @classmethod
+    def seal(cls, start: int, events: EventColumns, index: KeywordIndex) -> "Segment":
+        """
+        Turn the events of a full tail into a resident segment, reusing its keyword index.
+        """
+        segment = cls(start, len(events), events.timestamps[0], events.timestamps[-1],
+                      terms=index.terms(), fields=index.field_keys())
+        segment.events, segment.index = events, index
+        return segment
+
+    @staticmethod
+    def file_name(start: int) -> str:
+        return f"segment-{start:012d}.jsonl"
+
+    @property
+    def loaded(self) -> bool:
+        return self.events is not None
+
+    @property
+    def end(self) -> int:
+        return self.start + self.count
+
+    def record(self) -> Dict[str, Any]:
+        """
+        Manifest record of the segment.
+        """
+        record = {"file": os.path.basename(self.path or self.file_name(self.start)),
+                  "start": self.start, "count": self.count,
+                  "first": from_epoch_us(self.first), "last": from_epoch_us(self.last)}
+        if self.terms is not None and self.fields is not None:
+            record["terms"] = sorted(self.terms)
+            record["fields"] = [list(key) for key in self.fields]
+        return record
+
+    @classmethod
+    def from_record(cls, record: Dict[str, Any], directory: str) -> "Segment":
+        fields = record.get("fields")
+        return cls(record["start"], record["count"], to_epoch_us(record["first"]), to_epoch_us(record["last"]),
+                   os.path.join(directory, record["file"]), record.get("terms"),
+                   None if fields is None else [(key, value) for key, value in fields])
+
+    def load(self) -> None:
+        """
+        Read the events from disk and build the keyword index.
+        """
+        if self.loaded:
+            return
+        events = read_events(self.path)
+        if len(events) != self.count:
+            raise ValueError(f"Segment {self.path} holds {len(events)} events, manifest says {self.count}.")
+        self.index = index_events(events)
+        self.events = events
+        if self.terms is None or self.fields is None:  # a manifest from before terms were recorded
+            self.terms, self.fields = self.index.terms(), self.index.field_keys()
+
+    def unload(self) -> None:
+        """
+        Drop the resident copy of a segment that is stored on disk.
+        """
+        if self.path is not None:
+            self.events, self.index = None, None
+
+    def write(self, directory: str) -> None:
+        """
+        Write the (loaded) events to directory and remember the file as the segment's home.
+        """
+        path = os.path.join(directory, self.file_name(self.start))
+        write_atomic(path, dump_events(self.events))
+        self.path = path
@@ -0,0 +1,148 @@
+"""
+event_columns.py
+
+Compact columnar storage for episodic events. Instead of one dict per event, a block of
+events keeps epoch-microsecond timestamps in an int64 array, all content in one UTF-8 arena
+with an offset column, and metadata as a tuple of values plus an interned "shape" (the tuple
+of its keys), so events with the same metadata keys share a single key tuple.
+Events are read through EventView, a read-only mapping with the familiar
+{"timestamp", "content", "metadata"} keys that is created only when an event is returned.
+"""
+
+import datetime
+import threading
+from array import array
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+def to_epoch_us(value: Any) -> int:
+    """
+    Convert a datetime or ISO string to microseconds since the epoch (naive values are UTC).
+    """
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value)
+    if value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    delta = value - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+def from_epoch_us(value: int) -> str:
+    """
+    Naive UTC ISO string of an epoch-microsecond timestamp.
+    """
+    return (_EPOCH + datetime.timedelta(microseconds=value)).isoformat()
+
+
+class EventColumns:
+    """
+    Append-only block of events stored column-wise.
+    """
+
+    # Metadata shapes are interned process-wide: blocks come and go as segments are loaded.
+    _shape_ids: Dict[Tuple[Any, ...], int] = {(): 0}
+    _shapes: List[Tuple[Any, ...]] = [()]
+    _intern_lock = threading.Lock()
+
+    def __init__(self):
+        self.timestamps = array("q")
+        self._offsets = array("q", [0])
+        self._arena = bytearray()
+        self._shape = array("l")
+        self._values: List[Tuple[Any, ...]] = []
+
+    @classmethod
+    def _intern(cls, keys: Tuple[Any, ...]) -> int:
+        shape = cls._shape_ids.get(keys)
+        if shape is None:
+            with cls._intern_lock:
+                shape = cls._shape_ids.get(keys)
+                if shape is None:
+                    shape = len(cls._shapes)
+                    cls._shapes.append(keys)
+                    cls._shape_ids[keys] = shape
+        return shape
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def append(self, timestamp: int, content: str, metadata: Optional[Dict[str, Any]] = None) -> int:
+        """
+        Append an event and return its row.
+        :param timestamp: epoch microseconds.
+        """
+        self.timestamps.append(timestamp)
+        self._arena += content.encode("utf-8")
+        self._offsets.append(len(self._arena))
+        metadata = metadata or {}
+        self._shape.append(self._intern(tuple(metadata)))
+        self._values.append(tuple(metadata.values()) if metadata else ())
+        return len(self.timestamps) - 1
+
+    def append_event(self, event: Dict[str, Any]) -> int:
+        """
+        Append an event dict with an ISO timestamp (as stored in JSONL segments).
+        """
+        return self.append(to_epoch_us(event["timestamp"]), event["content"], event.get("metadata"))
+
+    def timestamp(self, row: int) -> str:
+        return from_epoch_us(self.timestamps[row])
+
+    def content(self, row: int) -> str:
+        return self._arena[self._offsets[row]:self._offsets[row + 1]].decode("utf-8")
+
+    def metadata(self, row: int) -> Dict[str, Any]:
+        """
+        A new dict of the event's metadata.
+        """
+        values = self._values[row]
+        return dict(zip(self._shapes[self._shape[row]], values)) if values else {}
+
+    def to_dict(self, row: int) -> Dict[str, Any]:
+        return {"timestamp": self.timestamp(row), "content": self.content(row), "metadata": self.metadata(row)}
+
+    def view(self, row: int) -> "EventView":
+        return EventView(self, row)
+
+    def views(self, start: int = 0, stop: Optional[int] = None) -> List["EventView"]:
+        """
+        Views of rows [start, stop), like slicing a list (negative bounds count from the end).
+        """
+        return [EventView(self, row) for row in range(*slice(start, stop).indices(len(self)))]
+
+
+class EventView(Mapping):
+    """
+    Read-only mapping view of one stored event: {"timestamp", "content", "metadata"}.
+    Values are decoded on access; the metadata dict is a copy.
+    """
+
+    __slots__ = ("_columns", "_row")
+
+    KEYS = ("timestamp", "content", "metadata")
+
+    def __init__(self, columns: EventColumns, row: int):
+        self._columns = columns
+        self._row = row
+
+    def __getitem__(self, key: str) -> Any:
+        if key == "content":
+            return self._columns.content(self._row)
+        if key == "timestamp":
+            return self._columns.timestamp(self._row)
+        if key == "metadata":
+            return self._columns.metadata(self._row)
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.KEYS)
+
+    def __len__(self) -> int:
+        return len(self.KEYS)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return self._columns.to_dict(self._row)
+
+    def __repr__(self) -> str:
+        return f"EventView({self.to_dict()!r})"
@@ -0,0 +1,227 @@
+"""
+keyword_index.py
+
+Incrementally maintained keyword index for the substring queries of EpisodicMemory and
+ReflectiveMemory. Each document's content and metadata values are split into word tokens with
+posting lists of document ids, and metadata (key, value) pairs get field posting lists.
+A keyword is resolved to every vocabulary token that contains one of its words, so partial
+words still match; the candidates are a superset of the substring matches, and callers verify
+them in id order, which keeps results identical to a full scan.
+This module owns tokenization and postings for all text indexes: with frequencies=True the
+index also keeps per-document term counts, which TextIndex scores with BM25.
+"""
+
+import re
+import heapq
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple, Union
+
+_WORD_RE = re.compile(r"\w+")
+
+def tokens(text: str) -> List[str]:
+    """
+    Lowercase word tokens of text in order, repeats included.
+    """
+    return _WORD_RE.findall(text.lower())
+
+def words(text: str) -> Set[str]:
+    """
+    Distinct lowercase word tokens of text.
+    """
+    return set(tokens(text))
+
+def field_key(key: Any, value: Any) -> Tuple[Any, str]:
+    """
+    Hashable field-index key of a metadata pair.
+    """
+    return key, str(value)
+
+def matches(keyword: str,
+            text: str,
+            metadata: Dict[str, Any],
+            filters: Optional[Dict[str, Any]] = None) -> bool:
+    """
+    The reference predicate: keyword is a case-insensitive substring of the text or of a
+    metadata value, and every filter equals the metadata field.
+    """
+    if filters and any(k not in metadata or metadata[k] != v for k, v in filters.items()):
+        return False
+    keyword = keyword.lower()
+    return keyword in text.lower() or any(keyword in str(v).lower() for v in metadata.values())
+
+def _unique(ids: Iterable[int]) -> Iterator[int]:
+    last = -1
+    for doc_id in ids:
+        if doc_id != last:
+            last = doc_id
+            yield doc_id
+
+
+class KeywordIndex:
+    """
+    Token and metadata-field posting lists over documents with increasing integer ids.
+    """
+
+    def __init__(self, expansion_cache_size: int = 1024, scan_density: float = 0.125, frequencies: bool = False):
+        """
+        :param expansion_cache_size: query words whose matching vocabulary is cached (LRU).
+        :param scan_density: candidate share of all documents above which an early-exit scan
+            is cheaper than merging posting lists, so candidates() returns None.
+        :param frequencies: keep each token's count per document (documents added with add_counts).
+        """
+        self.expansion_cache_size = expansion_cache_size
+        self.scan_density = scan_density
+        self._size = 0
+        # A key seen in one document maps to its id; the array is created on the second one
+        # (one-off tokens and values such as numbers and ids are the bulk of a log's vocabulary).
+        self._postings: Dict[str, Union[int, array]] = {}
+        self._fields: Dict[Tuple[Any, str], Union[int, array]] = {}
+        self._vocab: List[str] = []
+        self._expansions: "OrderedDict[str, Tuple[int, List[str]]]" = OrderedDict()
+        # token -> counts parallel to its posting list
+        self._frequencies: Optional[Dict[str, array]] = {} if frequencies else None
+
+    def add(self, doc_id: int, text: str, metadata: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Index a document. Ids must be added in increasing order.
+        """
+        fields = [field_key(key, value) for key, value in (metadata or {}).items()]
+        if self._frequencies is not None:
+            counts: Dict[str, int] = {}
+            for value in [text, *(str(v) for v in (metadata or {}).values())]:
+                for token in tokens(value):
+                    counts[token] = counts.get(token, 0) + 1
+            self.add_counts(doc_id, counts, fields)
+            return
+        found = words(text)
+        for value in (metadata or {}).values():
+            found.update(words(str(value)))
+        self.add_terms(doc_id, found, fields)
+
+    def add_terms(self,
+                  doc_id: int,
+                  tokens: Iterable[str],
+                  fields: Iterable[Tuple[Any, str]] = ()) -> None:
+        """
+        Index a document given as its distinct tokens and field keys, e.g. a whole segment
+        summarized by terms() and field_keys() of its own index. An index keeping frequencies
+        takes documents through add() or add_counts() instead.
+        """
+        self._size = doc_id + 1
+        for key in fields:
+            self._append(self._fields, key, doc_id)
+        for token in tokens:
+            if self._append(self._postings, token, doc_id):
+                self._vocab.append(token)
+
+    def add_counts(self,
+                   doc_id: int,
+                   counts: Dict[str, int],
+                   fields: Iterable[Tuple[Any, str]] = ()) -> None:
+        """
+        Index a document given as {token: occurrences}; the counts are kept when the index
+        was created with frequencies=True.
+        """
+        self.add_terms(doc_id, counts, fields)
+        if self._frequencies is not None:
+            for token, count in counts.items():
+                frequencies = self._frequencies.get(token)
+                if frequencies is None:
+                    frequencies = self._frequencies[token] = array("L")
+                frequencies.append(count)
+
+    def postings(self, token: str) -> Tuple[Sequence[int], Sequence[int]]:
+        """
+        (increasing document ids, occurrences in each) of an exact token. Without
+        frequencies every count is 1.
+        """
+        postings = self._postings.get(token)
+        if postings is None:
+            return (), ()
+        ids = self._as_list(postings)
+        return ids, self._frequencies[token] if self._frequencies is not None else (1,) * len(ids)
+
+    def terms(self) -> List[str]:
+        """
+        Every indexed token.
+        """
+        return list(self._vocab)
+
+    def field_keys(self) -> List[Tuple[Any, str]]:
+        """
+        Every indexed metadata (key, value) pair.
+        """
+        return list(self._fields)
+
+    @staticmethod
+    def _append(table: Dict[Any, Union[int, array]], key: Any, doc_id: int) -> bool:
+        """
+        Add doc_id to the posting list of key; return True if the key is new.
+        """
+        postings = table.get(key)
+        if postings is None:
+            table[key] = doc_id
+            return True
+        if isinstance(postings, int):
+            table[key] = array("L", (postings, doc_id))
+        else:
+            postings.append(doc_id)
+        return False
+
+    @staticmethod
+    def _as_list(postings: Union[int, array]) -> Sequence[int]:
+        return (postings,) if isinstance(postings, int) else postings
+
+    def _expand(self, word: str) -> List[str]:
+        """
+        Vocabulary tokens containing word. Cached per word and extended only by the
+        vocabulary added since the previous lookup.
+        """
+        scanned, tokens = self._expansions.pop(word, (0, []))
+        if scanned < len(self._vocab):
+            tokens = tokens + [t for t in self._vocab[scanned:] if word in t]
+            scanned = len(self._vocab)
+        self._expansions[word] = (scanned, tokens)
+        while len(self._expansions) > self.expansion_cache_size:
+            self._expansions.popitem(last=False)
+        return tokens
+
+    def candidates(self,
+                   keyword: str,
+                   filters: Optional[Dict[str, Any]] = None) -> Optional[Iterable[int]]:
+        """
+        Increasing ids of documents that may match keyword and filters, or None when the
+        index cannot narrow the search (e.g. a keyword without word characters and no filters).
+        Only the most selective posting source is returned; callers verify each candidate.
+        """
+        sources: List[Tuple[int, List[Sequence[int]]]] = []
+        for word in words(keyword):
+            lists = [self._as_list(self._postings[t]) for t in self._expand(word)]
+            sources.append((sum(len(p) for p in lists), lists))
+        for key, value in (filters or {}).items():
+            postings = self._fields.get(field_key(key, value))
+            if postings is None:
+                sources.append((0, []))
+            else:
+                postings = self._as_list(postings)
+                sources.append((len(postings), [postings]))
+        if not sources:
+            return None
+        total, lists = min(sources, key=lambda s: s[0])
+        if total > self.scan_density * self._size:
+            return None
+        if len(lists) == 1:
+            return lists[0]
+        if len(lists) <= 64:
+            return _unique(heapq.merge(*lists))
+        return sorted(set().union(*lists))
+
+    def clear(self) -> None:
+        self._size = 0
+        self._postings.clear()
+        self._fields.clear()
+        self._vocab.clear()
+        self._expansions.clear()
+        if self._frequencies is not None:
+            self._frequencies.clear()
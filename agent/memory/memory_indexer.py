@@ -1,16 +1,44 @@
 """
 memory_indexer.py
 
-Indexes memory entries (from various memory types) into vector store (FAISS/Chroma).
-Supports embedding, searching, and persistence.
+Indexes memory entries (from various memory types) into an in-process vector index.
+Supports embedding, searching, and persistence (memory-mapped on load).
+Indexing is incremental: each memory store keeps a ChangeLog, and only entries added,
+changed or removed since the previous pass are processed. Embeddings are cached by content
+hash, and removals leave tombstones that are compacted in a background thread. Cache misses
+are embedded together through an EmbeddingPipeline (micro-batched, optionally parallel).
+A pass reads the stores and updates the index under the lock but embeds outside it, so
+searches are not held up by embedding calls; abuild_index runs only the embedding off the
+event loop. save() also records each store's change-log position, so after a restart only
+what changed since is processed.
 """
 
-from typing import Any, Dict, List, Optional
+import os
+import json
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+import numpy as np
 from .episodic_memory import EpisodicMemory
 from .semantic_memory import SemanticMemory
 from .procedural_memory import ProceduralMemory
 from .working_memory import WorkingMemory
 from .reflective_memory import ReflectiveMemory
+from .vector_index import FlatIndex, create_index, load_index
+from .embedding_pipeline import EmbeddingPipeline
+from .episodic_segments import write_atomic
+
+# (entry id, text, metadata)
+Entry = Tuple[str, str, Dict[str, Any]]
+
+# (change-log epoch, cursor)
+Position = Tuple[str, int]
+
+def _content_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
 
 class MemoryIndexer:
     """
@@ -18,46 +46,375 @@ class MemoryIndexer:
     stores them in a vector index, and provides similarity search.
     """
 
-    def __init__(self, embed_fn: Any, index_path: str):
+    SOURCES = ("episodic", "semantic", "procedural", "working", "reflective")
+
+    def __init__(self,
+                 embed_fn: Any,
+                 index_path: str,
+                 embedding_cache_size: int = 100000,
+                 compact_ratio: float = 0.2,
+                 background_compaction: bool = True,
+                 index_type: str = "flat",
+                 index_options: Optional[Dict[str, Any]] = None,
+                 pipeline: Optional[EmbeddingPipeline] = None,
+                 query_cache_size: int = 256):
         """
         :param embed_fn: function that converts text to vector embeddings
         :param index_path: path to store or load the vector index
+        :param embedding_cache_size: number of embeddings cached by content hash (LRU)
+        :param compact_ratio: tombstone share of the index that triggers compaction
+        :param background_compaction: compact in a background thread instead of inline
+        :param index_type: "flat" (exact) or "ivf" (approximate, for millions of entries)
+        :param index_options: constructor options for the index, e.g. {"nprobe": 16} for ivf
+        :param pipeline: embedding pipeline for cache misses (default: serial batches over embed_fn);
+            pass one with batched=True or several workers to embed in bulk
+        :param query_cache_size: search queries whose embeddings are cached (LRU), kept apart from
+            the entry cache so ad-hoc queries never evict entry embeddings
         """
         self.embed_fn = embed_fn
+        self.pipeline = pipeline or EmbeddingPipeline(embed_fn, workers=1, retries=0)
         self.index_path = index_path
-        # TODO: initialize or load vector index (e.g., FAISS or Chroma)
-        self._index = None
+        self.embedding_cache_size = embedding_cache_size
+        self.query_cache_size = query_cache_size
+        self.compact_ratio = compact_ratio
+        self.background_compaction = background_compaction
+        self.index_type = index_type
+        self.index_options = dict(index_options or {})
+        self._index = create_index(index_type, **self.index_options)
+        self._cursors: Dict[str, Optional[Position]] = {s: None for s in self.SOURCES}
+        self._source_ids: Dict[str, Set[str]] = {s: set() for s in self.SOURCES}
+        # entry id -> pass whose embedding for it is in flight; a later pass or a removal
+        # takes the claim away, and the stale result is then dropped
+        self._claims: Dict[str, int] = {}
+        self._passes = 0
+        self._embeddings: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._query_embeddings: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._compactor: Optional[threading.Thread] = None
+        self.stats = {"indexed": 0, "embedded": 0, "cache_hits": 0, "removed": 0, "compactions": 0}
+
+    # ------------------------------------------------------------------
+    # Per-store entry resolution
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _entry(source: str, store: Any, key: Any) -> Optional[Entry]:
+        """
+        Resolve a change-log key of a store into an indexable entry (None if it is gone).
+        """
+        try:
+            if source == "episodic":
+                event = store.get_event(key)
+                return (f"episodic:{key}", event["content"],
+                        {"source": source, "text": event["content"], "timestamp": event.get("timestamp")})
+            if source == "reflective":
+                insight = store.get_entry(key)["insight"]
+                return f"reflective:{key}", insight, {"source": source, "text": insight}
+            if source == "semantic":
+                subject, position = key
+                predicate, obj = store.get_fact(subject, position)
+                text = f"{subject} {predicate} {obj}"
+                return f"semantic:{subject}:{position}", text, {"source": source, "text": text}
+            if source == "procedural":
+                if key not in store.list_procedures():
+                    return None
+                return f"procedural:{key}", key, {"source": source, "text": key}
+            if source == "working":
+                value = store.peek(key)
+                if value is None:
+                    return None
+                text = f"{key}: {value}"
+                return f"working:{key}", text, {"source": source, "text": text}
+        except (IndexError, KeyError):
+            return None
+        raise ValueError(f"Unknown memory source '{source}'.")
+
+    @staticmethod
+    def _keys(source: str, store: Any) -> Iterable[Any]:
+        """
+        Every current key of a store, for a full rescan.
+        """
+        if source == "episodic":
+            return range(len(store))
+        if source == "reflective":
+            return store.entry_ids()
+        if source == "semantic":
+            positions: Dict[str, int] = {}
+            keys = []
+            for subject, _, _ in store.all_facts():
+                keys.append((subject, positions.get(subject, 0)))
+                positions[subject] = positions.get(subject, 0) + 1
+            return keys
+        if source == "procedural":
+            return store.list_procedures()
+        return [key for key, _ in store.items()]
+
+    @staticmethod
+    def _id(source: str, key: Any) -> str:
+        if source == "semantic":
+            return f"semantic:{key[0]}:{key[1]}"
+        return f"{source}:{key}"
+
+    # ------------------------------------------------------------------
+    # Embedding cache
+    # ------------------------------------------------------------------
+
+    def _embed(self, texts: List[str]) -> List[np.ndarray]:
+        """
+        Embed texts, reusing cached vectors for content seen before (including within the batch).
+        """
+        hashes = [_content_hash(t) for t in texts]
+        vectors: Dict[str, np.ndarray] = {}
+        misses: Dict[str, str] = {}
+        with self._lock:
+            for h, text in zip(hashes, texts):
+                if h in vectors or h in misses:
+                    continue
+                cached = self._embeddings.get(h)
+                if cached is not None:
+                    self._embeddings.move_to_end(h)
+                    self.stats["cache_hits"] += 1
+                    vectors[h] = cached
+                    continue
+                misses[h] = text
+        if misses:
+            embedded = self.pipeline.embed(list(misses.values()))
+            with self._lock:
+                for h, vector in zip(misses, embedded):
+                    vectors[h] = np.asarray(vector, dtype=np.float32)
+                    self._remember(h, vectors[h])
+                self.stats["embedded"] += len(misses)
+        return [vectors[h] for h in hashes]
+
+    def _embed_query(self, query: str) -> np.ndarray:
+        """
+        Embed a search query through the small query cache.
+        """
+        with self._lock:
+            vector = self._query_embeddings.get(query)
+            if vector is not None:
+                self._query_embeddings.move_to_end(query)
+                return vector
+        vector = np.asarray(self.pipeline.embed([query])[0], dtype=np.float32)
+        with self._lock:
+            self._query_embeddings[query] = vector
+            while len(self._query_embeddings) > self.query_cache_size:
+                self._query_embeddings.popitem(last=False)
+        return vector
+
+    def _remember(self, content_hash: str, vector: np.ndarray) -> None:
+        self._embeddings[content_hash] = vector
+        self._embeddings.move_to_end(content_hash)
+        while len(self._embeddings) > self.embedding_cache_size:
+            self._embeddings.popitem(last=False)
+
+    # ------------------------------------------------------------------
+    # Indexing
+    # ------------------------------------------------------------------
+
+    def _remove(self, entry_id: str) -> None:
+        self._claims.pop(entry_id, None)
+        if self._index.remove(entry_id):
+            self.stats["removed"] += 1
+
+    def _remove_source(self, source: str) -> None:
+        for entry_id in self._source_ids[source]:
+            self._remove(entry_id)
+        self._source_ids[source] = set()
+
+    def _pending(self, source: str, store: Any) -> Dict[str, Any]:
+        """
+        Apply removals for one store and return {entry id: key} of entries to (re)index.
+        """
+        position = self._cursors[source]
+        epoch, head = store.changes.epoch, store.changes.cursor
+        changes = store.changes.since(position[1], position[0]) if position is not None else None
+        # Advance only past what was read: changes a writer on another thread records
+        # meanwhile are left for the next pass
+        self._cursors[source] = (epoch, head if changes is None else position[1] + len(changes))
+        if changes is None:
+            # Full rescan: drop entries that no longer exist, revisit the rest
+            current = {self._id(source, key): key for key in self._keys(source, store)}
+            for entry_id in self._source_ids[source] - set(current):
+                self._remove(entry_id)
+            self._source_ids[source] &= set(current)
+            return current
+        pending: Dict[str, Any] = {}
+        for op, key in changes:
+            if op == "clear":
+                self._remove_source(source)
+                pending.clear()
+            elif op == "remove":
+                entry_id = self._id(source, key)
+                pending.pop(entry_id, None)
+                self._source_ids[source].discard(entry_id)
+                self._remove(entry_id)
+            else:
+                pending[self._id(source, key)] = key
+        return pending
+
+    def _collect(self, stores: Dict[str, Any], rebuild: bool) -> Tuple[int, List[Entry]]:
+        """
+        Read the changes of every store and claim the entries that need embedding.
+        :return: (pass number, entries to embed).
+        """
+        with self._lock:
+            if rebuild:
+                self._index = create_index(self.index_type, **self.index_options)
+                self._cursors = {s: None for s in self.SOURCES}
+                self._source_ids = {s: set() for s in self.SOURCES}
+                self._claims = {}
+            self._passes += 1
+            entries: List[Entry] = []
+            for source, store in stores.items():
+                for entry_id, key in self._pending(source, store).items():
+                    entry = self._entry(source, store, key)
+                    stored = self._index.get_metadata(entry_id) if entry is not None else None
+                    if entry is None or (stored is not None and stored.get("hash") == _content_hash(entry[1])):
+                        self._claims.pop(entry_id, None)  # gone or unchanged since it was indexed
+                        if entry is not None:
+                            self._source_ids[source].add(entry_id)
+                        continue
+                    self._source_ids[source].add(entry_id)
+                    self._claims[entry_id] = self._passes
+                    entries.append(entry)
+            return self._passes, entries
+
+    def _insert(self, generation: int, entries: List[Entry], vectors: List[np.ndarray]) -> None:
+        """
+        Add the embedded entries of a pass that are still claimed by it.
+        """
+        with self._lock:
+            kept = [(entry, vector) for entry, vector in zip(entries, vectors)
+                    if self._claims.get(entry[0]) == generation]
+            for entry, _ in kept:
+                del self._claims[entry[0]]
+            if kept:
+                metadata = [dict(meta, hash=_content_hash(text)) for (_, text, meta), _ in kept]
+                self._index.add([v for _, v in kept], [e[0] for e, _ in kept], metadata)
+                self.stats["indexed"] += len(kept)
+            compact = self._index.tombstone_ratio > self.compact_ratio
+        if compact:
+            self.compact(wait=not self.background_compaction)
 
     def build_index(self,
                     episodic: EpisodicMemory,
                     semantic: SemanticMemory,
                     procedural: ProceduralMemory,
                     working: WorkingMemory,
-                    reflective: ReflectiveMemory) -> None:
+                    reflective: ReflectiveMemory,
+                    rebuild: bool = False) -> None:
         """
         Build or refresh the vector index from all memory stores.
+        Only changes since the previous call are processed unless rebuild is True.
+        The stores are read in the calling thread; the lock is released while embedding.
         """
-        # TODO: collect texts from each memory, embed, and add to index
-        pass
+        stores = dict(zip(self.SOURCES, (episodic, semantic, procedural, working, reflective)))
+        generation, entries = self._collect(stores, rebuild)
+        self._insert(generation, entries, self._embed([text for _, text, _ in entries]) if entries else [])
 
-    def search(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+    async def abuild_index(self,
+                           episodic: EpisodicMemory,
+                           semantic: SemanticMemory,
+                           procedural: ProceduralMemory,
+                           working: WorkingMemory,
+                           reflective: ReflectiveMemory,
+                           rebuild: bool = False) -> None:
+        """
+        build_index for stores owned by an event loop: the stores are read and the index
+        updated on the loop, and only the embedding runs in the default executor, so code
+        writing to the stores on the loop meanwhile never races the indexer.
+        """
+        stores = dict(zip(self.SOURCES, (episodic, semantic, procedural, working, reflective)))
+        generation, entries = self._collect(stores, rebuild)
+        vectors: List[np.ndarray] = []
+        if entries:
+            vectors = await asyncio.get_running_loop().run_in_executor(
+                None, self._embed, [text for _, text, _ in entries])
+        self._insert(generation, entries, vectors)
+
+    # ------------------------------------------------------------------
+    # Compaction
+    # ------------------------------------------------------------------
+
+    def _compact_once(self) -> None:
+        with self._lock:
+            snapshot, version = self._index, self._index.version
+        compacted = snapshot.compacted()
+        with self._lock:
+            # Discard the copy if the index changed meanwhile; the next pass will retry.
+            if self._index is snapshot and snapshot.version == version:
+                self._index = compacted
+                self.stats["compactions"] += 1
+
+    def compact(self, wait: bool = True) -> None:
+        """
+        Drop tombstones from the index, inline or in a background thread.
+        """
+        if wait:
+            self._compact_once()
+            return
+        with self._lock:
+            if self._compactor is not None and self._compactor.is_alive():
+                return
+            self._compactor = threading.Thread(target=self._compact_once, name="memory-compactor", daemon=True)
+            self._compactor.start()
+
+    # ------------------------------------------------------------------
+    # Search and persistence
+    # ------------------------------------------------------------------
+
+    def search(self, query: str, top_k: int = 5, **kwargs) -> List[Dict[str, Any]]:
         """
         Search the vector index for entries similar to the query.
+        Extra keyword arguments go to the index (e.g. nprobe for ivf).
         Returns list of {id, score, metadata}.
         """
-        # TODO: embed query, perform vector search, map results back to memory entries
-        return []
+        with self._lock:
+            if not len(self._index):
+                return []
+        vector = self._embed_query(query)
+        with self._lock:
+            return self._index.search(vector, top_k, **kwargs)
+
+    def _cursors_path(self) -> str:
+        return f"{FlatIndex.stem(self.index_path)}.cursors.json"
 
     def save(self) -> None:
         """
-        Persist the vector index to disk at index_path.
+        Persist the vector index to disk at index_path, followed by each store's change-log
+        position. A store with entries still being embedded is saved without a position and
+        is rescanned after a restart.
         """
-        # TODO: implement save logic
-        pass
+        with self._lock:
+            self._index.save(self.index_path)
+            busy = {entry_id.split(":", 1)[0] for entry_id in self._claims}
+            cursors = {source: None if source in busy or position is None else list(position)
+                       for source, position in self._cursors.items()}
+            write_atomic(self._cursors_path(), json.dumps(cursors))
 
     def load(self) -> None:
         """
-        Load the vector index from disk if available.
+        Load the vector index from disk if available (the matrix is memory-mapped).
+        Saved change-log positions are restored, so a store reloaded at the position it had
+        when the index was saved is not rescanned; for the others, stored vectors seed the
+        embedding cache, so re-indexing unchanged memories costs no embedding calls.
         """
-        # TODO: implement load logic
-        pass
+        matrix_path, sidecar_path = FlatIndex.paths(self.index_path)
+        if not (os.path.exists(matrix_path) and os.path.exists(sidecar_path)):
+            return
+        cursors: Dict[str, Any] = {}
+        if os.path.exists(self._cursors_path()):
+            with open(self._cursors_path(), "r", encoding="utf-8") as f:
+                cursors = json.load(f)
+        with self._lock:
+            self._index = load_index(self.index_path)
+            self._cursors = {s: tuple(cursors[s]) if cursors.get(s) else None for s in self.SOURCES}
+            self._claims = {}
+            self._source_ids = {s: set() for s in self.SOURCES}
+            for row, (entry_id, meta) in enumerate(zip(self._index.ids, self._index.metadata)):
+                source = meta.get("source")
+                if source in self._source_ids:
+                    self._source_ids[source].add(entry_id)
+                if meta.get("hash"):
+                    self._remember(meta["hash"], self._index.vectors[row])
@@ -6,6 +6,7 @@ Supports registering procedures and invoking them by name with parameters.
 """
 
 from typing import Any, Callable, Dict, List, Optional
+from .change_log import ChangeLog
 
 class ProceduralMemory:
     """
@@ -17,6 +18,7 @@ class ProceduralMemory:
         Initialize the procedural memory registry.
         """
         self._procedures: Dict[str, Callable[..., Any]] = {}
+        self.changes = ChangeLog()
 
     def register(self, name: str, func: Callable[..., Any]) -> None:
         """
@@ -25,6 +27,7 @@ class ProceduralMemory:
         :param func: Callable implementing the procedure.
         """
         self._procedures[name] = func
+        self.changes.record("add", name)
 
     def execute(self, name: str, *args, **kwargs) -> Any:
         """
@@ -48,3 +51,4 @@ class ProceduralMemory:
         """
         if name in self._procedures:
             del self._procedures[name]
+            self.changes.record("remove", name)
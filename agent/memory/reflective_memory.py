@@ -3,43 +3,256 @@ reflective_memory.py
 
 Reflective memory stores lessons learned and higher-order generalizations from past experiences.
 Supports logging evaluations, retrieving insights, and clearing reflective entries.
+
+The store is bounded. An insight that is a near duplicate of a stored one (SimHash within a
+few bits) is merged into it rather than appended; each entry carries an importance and a hit
+count, and once the entry or byte budget is exceeded the entries with the lowest
+importance x recency score are evicted. Large metadata values are stored once, as compact
+JSON in a content-addressed blob table, and entries hold a MetadataRef to them.
 """
 
+import json
+import math
+import bisect
+import hashlib
 from typing import Any, Dict, List, Optional
+from .change_log import ChangeLog
+from .keyword_index import KeywordIndex, matches
+from .simhash import SimHashIndex, simhash
+
+# Rough per-entry bookkeeping cost (dicts, index postings), counted against max_bytes
+ENTRY_OVERHEAD = 400
+
+
+class MetadataRef:
+    """
+    Reference to a large metadata value held in ReflectiveMemory's blob table.
+    """
+
+    __slots__ = ("digest", "size")
+
+    def __init__(self, digest: str, size: int):
+        self.digest = digest
+        self.size = size
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, MetadataRef) and other.digest == self.digest
+
+    def __hash__(self) -> int:
+        return hash(self.digest)
+
+    def __repr__(self) -> str:
+        return f"<ref {self.digest[:12]} {self.size} bytes>"
+
 
 class ReflectiveMemory:
     """
     Manages reflective memory entries for self-analysis and meta-reasoning.
     """
 
-    def __init__(self):
+    def __init__(self,
+                 max_entries: int = 10000,
+                 max_bytes: int = 16 * 2 ** 20,
+                 duplicate_distance: int = 3,
+                 half_life: float = 500.0,
+                 metadata_ref_bytes: int = 1024):
         """
         Initialize the reflective memory store.
+        :param max_entries: entries kept before eviction.
+        :param max_bytes: approximate bytes (insight text, inline metadata, blobs) kept before eviction.
+        :param duplicate_distance: SimHash bit distance at or below which an insight is merged
+            into an existing one (0 disables merging; exact up to 3).
+        :param half_life: recency half-life of the eviction score, in insights added since
+            an entry was last seen.
+        :param metadata_ref_bytes: metadata values whose JSON exceeds this size are stored by reference.
         """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.duplicate_distance = duplicate_distance
+        self.half_life = half_life
+        self.metadata_ref_bytes = metadata_ref_bytes
         self._entries: List[Dict[str, Any]] = []
+        self._by_id: Dict[int, Dict[str, Any]] = {}
+        self._sizes: Dict[int, int] = {}
+        self._blobs: Dict[str, List[Any]] = {}  # digest -> [json text, refcount]
+        self._next_id = 0
+        self._bytes = 0
+        self._dead = 0  # evicted ids still present in the keyword index
+        self._index = KeywordIndex()
+        self._duplicates = SimHashIndex()
+        self.stats = {"added": 0, "merged": 0, "evicted": 0}
+        self.changes = ChangeLog()
+
+    # ------------------------------------------------------------------
+    # Metadata blobs
+    # ------------------------------------------------------------------
+
+    def _store_metadata(self, metadata: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Replace large values by references to deduplicated blobs.
+        """
+        stored: Dict[str, Any] = {}
+        for key, value in metadata.items():
+            if isinstance(value, (str, int, float, bool, type(None))) and len(str(value)) <= self.metadata_ref_bytes:
+                stored[key] = value
+                continue
+            text = json.dumps(value, sort_keys=True, default=str, separators=(",", ":"))
+            if len(text) <= self.metadata_ref_bytes:
+                stored[key] = value
+                continue
+            digest = hashlib.sha1(text.encode("utf-8")).hexdigest()
+            blob = self._blobs.get(digest)
+            if blob is None:
+                self._blobs[digest] = [text, 1]
+                self._bytes += len(text)
+            else:
+                blob[1] += 1
+            stored[key] = MetadataRef(digest, len(text))
+        return stored
+
+    def _release_metadata(self, metadata: Dict[str, Any]) -> None:
+        for value in metadata.values():
+            if isinstance(value, MetadataRef):
+                blob = self._blobs[value.digest]
+                blob[1] -= 1
+                if blob[1] == 0:
+                    del self._blobs[value.digest]
+                    self._bytes -= value.size
+
+    def resolve(self, value: Any) -> Any:
+        """
+        Return the value a MetadataRef points to (other values are returned unchanged).
+        """
+        if isinstance(value, MetadataRef):
+            return json.loads(self._blobs[value.digest][0])
+        return value
+
+    def resolve_metadata(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Return an entry's metadata with every reference resolved.
+        """
+        return {k: self.resolve(v) for k, v in entry["metadata"].items()}
 
-    def add_insight(self, insight: str, metadata: Optional[Dict[str, Any]] = None) -> None:
+    # ------------------------------------------------------------------
+    # Adding and eviction
+    # ------------------------------------------------------------------
+
+    def add_insight(self,
+                    insight: str,
+                    metadata: Optional[Dict[str, Any]] = None,
+                    importance: float = 1.0) -> int:
         """
-        Add a new reflective insight.
+        Add a new reflective insight, or merge it into a near-duplicate entry.
         :param insight: Description of the lesson learned.
-        :param metadata: Optional additional context.
+        :param metadata: Optional additional context (large values are stored by reference).
+        :param importance: weight against eviction; a merge keeps the higher importance.
+        :return: id of the new or merged entry.
         """
+        fingerprint = simhash(insight)
+        if self.duplicate_distance > 0:
+            near = self._duplicates.nearest(fingerprint, self.duplicate_distance)
+            if near:
+                entry = self._by_id[near[0][1]]
+                entry["count"] += 1
+                entry["importance"] = max(entry["importance"], importance)
+                entry["last_seen"] = self._next_id
+                self._next_id += 1
+                self.stats["merged"] += 1
+                return entry["id"]
+        entry_id = self._next_id
+        self._next_id += 1
         entry = {
+            "id": entry_id,
             "insight": insight,
-            "metadata": metadata or {}
+            "metadata": self._store_metadata(metadata or {}),
+            "importance": importance,
+            "count": 1,
+            "last_seen": entry_id,
         }
+        self._index.add(entry_id, entry["insight"], entry["metadata"])
+        self._duplicates.add(entry_id, fingerprint)
         self._entries.append(entry)
+        self._by_id[entry_id] = entry
+        size = ENTRY_OVERHEAD + len(insight.encode("utf-8")) + len(json.dumps(entry["metadata"], default=repr))
+        self._sizes[entry_id] = size
+        self._bytes += size
+        self.stats["added"] += 1
+        self.changes.record("add", entry_id)
+        if len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            self._evict()
+        return entry_id
 
-    def query_insights(self, keyword: str, limit: int = 10) -> List[Dict[str, Any]]:
+    def score(self, entry: Dict[str, Any]) -> float:
+        """
+        Retention score: importance, boosted by repeats, decayed by insights since last seen.
+        """
+        age = self._next_id - entry["last_seen"]
+        return entry["importance"] * (1.0 + math.log(entry["count"])) * 0.5 ** (age / self.half_life)
+
+    def _evict(self) -> None:
+        """
+        Drop the lowest-scoring entries until both budgets are met with 5% headroom
+        (so eviction runs once per batch of inserts rather than on every insert).
         """
-        Query reflective entries by keyword.
+        max_entries = int(self.max_entries * 0.95)
+        max_bytes = int(self.max_bytes * 0.95)
+        evicted = set()
+        for entry in sorted(self._entries, key=self.score):
+            if len(self._entries) - len(evicted) <= max_entries and self._bytes <= max_bytes:
+                break
+            if len(self._entries) - len(evicted) <= 1:
+                break
+            evicted.add(entry["id"])
+            self._forget(entry)
+        self._entries = [e for e in self._entries if e["id"] not in evicted]
+        self.stats["evicted"] += len(evicted)
+        self._dead += len(evicted)
+        if self._dead > len(self._entries):
+            self._reindex()
+
+    def _forget(self, entry: Dict[str, Any]) -> None:
+        entry_id = entry["id"]
+        del self._by_id[entry_id]
+        self._bytes -= self._sizes.pop(entry_id)
+        self._release_metadata(entry["metadata"])
+        self._duplicates.remove(entry_id)
+        self.changes.record("remove", entry_id)
+
+    def _reindex(self) -> None:
+        """
+        Rebuild the keyword index without evicted entries.
+        """
+        self._index = KeywordIndex()
+        for entry in self._entries:
+            self._index.add(entry["id"], entry["insight"], entry["metadata"])
+        self._dead = 0
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    def query_insights(self,
+                       keyword: str,
+                       limit: int = 10,
+                       filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Query reflective entries by keyword, oldest first (served from the keyword index).
+        Values stored by reference are not searched.
         :param keyword: Search term.
         :param limit: Maximum number of entries to return.
+        :param filters: Optional metadata fields the entries must equal.
         """
-        matches = [e for e in self._entries
-                   if keyword.lower() in e["insight"].lower()
-                   or any(keyword.lower() in str(v).lower() for v in e["metadata"].values())]
-        return matches[:limit]
+        candidates = self._index.candidates(keyword, filters)
+        if candidates is None:
+            candidates = [e["id"] for e in self._entries]
+        found = []
+        for entry_id in candidates:
+            entry = self._by_id.get(entry_id)
+            if entry is not None and matches(keyword, entry["insight"], entry["metadata"], filters):
+                found.append(entry)
+                if len(found) >= limit:
+                    break
+        return found
 
     def get_all(self) -> List[Dict[str, Any]]:
         """
@@ -47,8 +260,62 @@ class ReflectiveMemory:
         """
         return list(self._entries)
 
+    def get_recent(self, count: int = 5) -> List[Dict[str, Any]]:
+        """
+        Retrieve the most recent reflective entries, oldest first.
+        :param count: Number of entries to return.
+        """
+        return self._entries[-count:] if count > 0 else []
+
+    def get_entry(self, entry_id: int) -> Dict[str, Any]:
+        """
+        Return the entry with an id.
+        :raises KeyError: the entry was evicted or never existed.
+        """
+        return self._by_id[entry_id]
+
+    def entry_ids(self) -> List[int]:
+        """
+        Ids of the stored entries, oldest first.
+        """
+        return [e["id"] for e in self._entries]
+
+    @property
+    def next_id(self) -> int:
+        """
+        Id the next new entry will get (a cursor for entries_since).
+        """
+        return self._next_id
+
+    def entries_since(self, cursor: int) -> List[Dict[str, Any]]:
+        """
+        Return stored entries with id >= cursor (for incremental indexing).
+        """
+        return self._entries[bisect.bisect_left(self._entries, cursor, key=lambda e: e["id"]):]
+
+    def __contains__(self, entry_id: Any) -> bool:
+        return entry_id in self._by_id
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Approximate bytes counted against max_bytes.
+        """
+        return self._bytes
+
     def clear(self) -> None:
         """
         Clear all reflective memory entries.
         """
         self._entries.clear()
+        self._by_id.clear()
+        self._sizes.clear()
+        self._blobs.clear()
+        self._bytes = 0
+        self._dead = 0
+        self._index.clear()
+        self._duplicates.clear()
+        self.changes.record("clear")
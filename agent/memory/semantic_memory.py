@@ -3,78 +3,172 @@ semantic_memory.py
 
 Semantic memory stores facts, entities, and concepts in a structured form.
 Supports adding, querying, persisting semantic triples or key-value facts.
+Facts live in a TripleStore, so lookups by subject, predicate or object are all indexed.
+With a database the store is persistent: facts are written in batches to an indexed SQLite
+table, subjects are loaded into the in-memory TripleStore on first use (read-through), and
+predicate/object lookups run against the table's indexes.
 """
 
 import json
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Iterator, List, Optional, Set, Tuple
+from .change_log import ChangeLog
+from .triple_store import ANY, Triple, TripleStore
+from .sqlite_triples import SQLiteTriples, encode_object
 
 class SemanticMemory:
     """
     Manages semantic facts for the agent.
     """
 
-    def __init__(self):
+    def __init__(self, db: Optional[Any] = None, table: str = "semantic_facts", batch_size: int = 1000):
         """
         Initialize the semantic memory store.
+        :param db: optional infra.db.Database; when given, facts persist in its `table`.
+        :param table: name of the SQLite table.
+        :param batch_size: queued inserts written per batch.
+        """
+        # Interned, deduplicated triples indexed by subject, predicate and object
+        self._store = TripleStore()
+        self._table = SQLiteTriples(db, table, batch_size) if db is not None else None
+        self._loaded: Set[str] = set()
+        self.changes = ChangeLog()
+
+    def _load_subject(self, subject: str) -> None:
+        """
+        Pull a subject's facts from the table into memory (once).
         """
-        # store as mapping from subject to list of (predicate, object)
-        self._store: Dict[str, List[Tuple[str, Any]]] = {}
+        if self._table is None or subject in self._loaded:
+            return
+        for subj, pred, obj in self._table.match(subject=subject):
+            self._store.add(subj, pred, obj)
+        self._loaded.add(subject)
 
-    def add_fact(self, subject: str, predicate: str, obj: Any) -> None:
+    def add_fact(self, subject: str, predicate: str, obj: Any) -> bool:
         """
         Add a semantic fact (subject, predicate, object).
-        """
-        facts = self._store.setdefault(subject, [])
-        facts.append((predicate, obj))
+        :return: False if the fact was already known (it is not stored twice).
+        """
+        if self._table is not None:
+            self._load_subject(subject)
+            obj = json.loads(encode_object(obj))  # the form it will be read back in
+        position = self._store.add(subject, predicate, obj)
+        if position is None:
+            return False
+        if self._table is not None:
+            self._table.insert(subject, predicate, obj)
+        self.changes.record("add", (subject, position))
+        return True
 
     def query_subject(self, subject: str) -> List[Tuple[str, Any]]:
         """
         Retrieve all predicate-object pairs for a subject.
         """
-        return self._store.get(subject, [])
+        self._load_subject(subject)
+        return [(pred, obj) for _, pred, obj in self._store.match(subject=subject)]
 
     def query_predicate(self, predicate: str) -> List[Tuple[str, Any]]:
         """
-        Retrieve all (subject, object) pairs matching a predicate.
+        Retrieve all (subject, object) pairs matching a predicate, in insertion order.
         """
-        results: List[Tuple[str, Any]] = []
-        for subj, facts in self._store.items():
-            for pred, obj in facts:
-                if pred == predicate:
-                    results.append((subj, obj))
-        return results
+        return [(subj, obj) for subj, _, obj in self.match(predicate=predicate)]
 
     def query_object(self, obj_value: Any) -> List[Tuple[str, str]]:
         """
-        Retrieve all (subject, predicate) pairs with the given object value.
+        Retrieve all (subject, predicate) pairs with the given object value, in insertion order.
+        """
+        return [(subj, pred) for subj, pred, _ in self.match(obj=obj_value)]
+
+    def match(self, subject: Any = ANY, predicate: Any = ANY, obj: Any = ANY) -> Iterator[Triple]:
+        """
+        Yield (subject, predicate, object) facts matching a pattern; positions left as ANY
+        are wildcards.
+        """
+        if self._table is None:
+            return self._store.match(subject, predicate, obj)
+        if subject is not ANY:
+            self._load_subject(subject)
+            return self._store.match(subject, predicate, obj)
+        return self._table.match(subject, predicate, obj)
+
+    def has_fact(self, subject: str, predicate: str, obj: Any) -> bool:
+        """
+        Return True if the fact is stored.
+        """
+        self._load_subject(subject)
+        if self._table is not None:
+            obj = json.loads(encode_object(obj))
+        return self._store.contains(subject, predicate, obj)
+
+    def get_fact(self, subject: str, position: int) -> Tuple[str, Any]:
+        """
+        Return the (predicate, object) pair stored at a position for subject.
         """
-        results: List[Tuple[str, str]] = []
-        for subj, facts in self._store.items():
-            for pred, obj in facts:
-                if obj == obj_value:
-                    results.append((subj, pred))
-        return results
+        self._load_subject(subject)
+        _, pred, obj = self._store.subject_fact(subject, position)
+        return pred, obj
+
+    def all_facts(self) -> List[Tuple[str, str, Any]]:
+        """
+        Return every fact as a (subject, predicate, object) triple.
+        """
+        return list(self.match())
+
+    def __len__(self) -> int:
+        return self._table.count() if self._table is not None else len(self._store)
+
+    def flush(self) -> None:
+        """
+        Write queued facts to the database (no-op without one).
+        """
+        if self._table is not None:
+            self._table.flush()
 
     def clear(self) -> None:
         """
-        Clear all semantic facts.
+        Clear all semantic facts (including the database table, if any).
         """
         self._store.clear()
+        self._loaded.clear()
+        if self._table is not None:
+            self._table.clear()
+        self.changes.record("clear")
+
+    def _subjects(self) -> Iterator[str]:
+        return self._table.subjects() if self._table is not None else self._store.subjects()
 
     def save_to_file(self, path: str) -> None:
         """
-        Persist semantic memory to JSON file.
-        TODO: implement using infra.file_manager.
+        Export semantic memory to a JSON file ({subject: [[predicate, object], ...]}).
         """
+        data = {}
+        for subj in list(self._subjects()):
+            data[subj] = self.query_subject(subj)
         with open(path, 'w', encoding='utf-8') as f:
-            json.dump(self._store, f, indent=2)
+            json.dump(data, f)
 
     def load_from_file(self, path: str) -> None:
         """
-        Load semantic memory from JSON file.
-        TODO: implement using infra.file_manager.
+        Replace semantic memory with the contents of a JSON file written by save_to_file.
+        """
+        self.clear()
+        self.import_json(path)
+
+    def import_json(self, path: str) -> int:
+        """
+        One-shot import of a JSON fact file into the store. With a database the facts are
+        inserted in batches in one transaction without being loaded into memory, and change
+        consumers are reset to rescan.
+        :return: number of facts read from the file.
         """
         with open(path, 'r', encoding='utf-8') as f:
             data = json.load(f)
-        # Ensure correct types
-        self._store = {str(k): [(pred, obj) for pred, obj in v] for k, v in data.items()}
+        facts = [(str(subject), pred, obj) for subject, pairs in data.items() for pred, obj in pairs]
+        if self._table is None:
+            for fact in facts:
+                self.add_fact(*fact)
+            return len(facts)
+        self._table.insert_many(facts)
+        self._store.clear()
+        self._loaded.clear()
+        self.changes.reset()
+        return len(facts)
@@ -0,0 +1,85 @@
+"""
+simhash.py
+
+SimHash fingerprints for near-duplicate text detection. Similar texts get fingerprints that
+differ in few bits; a banded index finds every stored fingerprint within a Hamming distance
+below the number of bands by exact lookups (pigeonhole: at least one band must be identical).
+"""
+
+import re
+import hashlib
+from typing import Dict, Iterable, List, Set, Tuple
+
+_WORD_RE = re.compile(r"\w+")
+
+def _features(text: str) -> Iterable[str]:
+    words = _WORD_RE.findall(text.lower())
+    yield from words
+    yield from (f"{a} {b}" for a, b in zip(words, words[1:]))
+
+def simhash(text: str, bits: int = 64) -> int:
+    """
+    Fingerprint of text from its words and word bigrams.
+    """
+    weights = [0] * bits
+    for feature in _features(text):
+        h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=bits // 8).digest(), "big")
+        for bit in range(bits):
+            weights[bit] += 1 if h >> bit & 1 else -1
+    return sum(1 << bit for bit, w in enumerate(weights) if w > 0)
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class SimHashIndex:
+    """
+    Banded index of fingerprints for near-duplicate lookup.
+    """
+
+    def __init__(self, bits: int = 64, bands: int = 4):
+        """
+        :param bits: fingerprint width.
+        :param bands: bit bands; lookups are exact up to a distance of bands - 1.
+        """
+        self.bits = bits
+        self.bands = bands
+        self._width = bits // bands
+        self._tables: List[Dict[int, Set[int]]] = [{} for _ in range(bands)]
+        self._fingerprints: Dict[int, int] = {}
+
+    def _keys(self, fingerprint: int) -> Iterable[Tuple[int, int]]:
+        mask = (1 << self._width) - 1
+        for band in range(self.bands):
+            yield band, fingerprint >> (band * self._width) & mask
+
+    def add(self, item: int, fingerprint: int) -> None:
+        self._fingerprints[item] = fingerprint
+        for band, key in self._keys(fingerprint):
+            self._tables[band].setdefault(key, set()).add(item)
+
+    def remove(self, item: int) -> None:
+        fingerprint = self._fingerprints.pop(item, None)
+        if fingerprint is None:
+            return
+        for band, key in self._keys(fingerprint):
+            bucket = self._tables[band].get(key)
+            if bucket is not None:
+                bucket.discard(item)
+                if not bucket:
+                    del self._tables[band][key]
+
+    def nearest(self, fingerprint: int, max_distance: int) -> List[Tuple[int, int]]:
+        """
+        Return (distance, item) pairs within max_distance, closest first.
+        """
+        candidates: Set[int] = set()
+        for band, key in self._keys(fingerprint):
+            candidates.update(self._tables[band].get(key, ()))
+        found = [(hamming(fingerprint, self._fingerprints[item]), item) for item in candidates]
+        return sorted(f for f in found if f[0] <= max_distance)
+
+    def clear(self) -> None:
+        for table in self._tables:
+            table.clear()
+        self._fingerprints.clear()
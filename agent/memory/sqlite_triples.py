@@ -0,0 +1,123 @@
+"""
+sqlite_triples.py
+
+SQLite table of semantic triples (via infra.db), the persistent backend of SemanticMemory.
+Facts are one row each with a UNIQUE (subject, predicate, object) constraint; indexes on
+(predicate, object) and (object) make every lookup position indexed. Inserts are queued and
+written in batches; objects are stored as canonical JSON.
+"""
+
+import json
+from typing import Any, Iterable, Iterator, List, Optional, Tuple
+from .triple_store import ANY, Triple
+
+def encode_object(value: Any) -> str:
+    """
+    Canonical JSON of an object value (1, 1.0 and True stay distinct).
+    """
+    return json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+
+
+class SQLiteTriples:
+    """
+    Triple table with batched inserts and pattern queries in insertion order.
+    """
+
+    def __init__(self, db: Any, table: str = "semantic_facts", batch_size: int = 1000):
+        """
+        :param db: infra.db.Database instance used for storage.
+        :param table: name of the SQLite table.
+        :param batch_size: queued inserts that trigger a write.
+        """
+        self.db = db
+        self.table = table
+        self.batch_size = max(1, batch_size)
+        self._pending: List[Tuple[str, str, str]] = []
+        self._init_schema()
+
+    def _init_schema(self) -> None:
+        self.db.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "subject TEXT NOT NULL, "
+            "predicate TEXT NOT NULL, "
+            "object TEXT NOT NULL, "
+            "UNIQUE (subject, predicate, object))"
+        )
+        self.db.execute(
+            f"CREATE INDEX IF NOT EXISTS {self.table}_predicate ON {self.table} (predicate, object)"
+        )
+        self.db.execute(
+            f"CREATE INDEX IF NOT EXISTS {self.table}_object ON {self.table} (object)"
+        )
+        self.db.commit()
+
+    def insert(self, subject: str, predicate: str, obj: Any) -> None:
+        """
+        Queue a fact for insertion (duplicates are ignored by the table).
+        """
+        self._pending.append((subject, predicate, encode_object(obj)))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def insert_many(self, facts: Iterable[Triple]) -> None:
+        """
+        Insert facts in batches within a single transaction.
+        """
+        for subject, predicate, obj in facts:
+            self._pending.append((subject, predicate, encode_object(obj)))
+            if len(self._pending) >= self.batch_size:
+                self._write()
+        self.flush()
+
+    def _write(self) -> None:
+        if self._pending:
+            self.db.executemany(
+                f"INSERT OR IGNORE INTO {self.table} (subject, predicate, object) VALUES (?, ?, ?)",
+                self._pending
+            )
+            self._pending = []
+
+    def flush(self) -> None:
+        """
+        Write queued inserts and commit.
+        """
+        if self._pending:
+            self._write()
+            self.db.commit()
+
+    def match(self, subject: Any = ANY, predicate: Any = ANY, obj: Any = ANY) -> Iterator[Triple]:
+        """
+        Yield facts matching a pattern, in insertion order; ANY matches every term.
+        """
+        self.flush()
+        clauses, params = [], []
+        for column, value in (("subject", subject), ("predicate", predicate), ("object", obj)):
+            if value is not ANY:
+                clauses.append(f"{column} = ?")
+                params.append(encode_object(value) if column == "object" else value)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        cursor = self.db.execute(
+            f"SELECT subject, predicate, object FROM {self.table}{where} ORDER BY id", tuple(params)
+        )
+        for row in cursor:
+            yield row[0], row[1], json.loads(row[2])
+
+    def count(self) -> int:
+        self.flush()
+        return self.db.fetchone(self.db.execute(f"SELECT COUNT(*) FROM {self.table}"))[0]
+
+    def subjects(self) -> Iterator[str]:
+        """
+        Subjects in order of their first fact.
+        """
+        self.flush()
+        cursor = self.db.execute(
+            f"SELECT subject FROM {self.table} GROUP BY subject ORDER BY MIN(id)"
+        )
+        return (row[0] for row in cursor)
+
+    def clear(self) -> None:
+        self._pending = []
+        self.db.execute(f"DELETE FROM {self.table}")
+        self.db.commit()
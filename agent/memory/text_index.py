@@ -0,0 +1,174 @@
+"""
+text_index.py
+
+Incremental inverted text index with BM25 relevance and recency scoring.
+Documents are appended in arrival order; queries only touch the postings of their own terms,
+so lookup cost does not grow with the number of unrelated documents. Tokens and postings
+(with term frequencies) come from keyword_index, the same as the stores' keyword indexes;
+this module adds stopwords, document lengths and the scoring. Removed documents leave a
+tombstone that searches skip, so they only ever return live documents.
+"""
+
+import math
+import heapq
+from typing import Any, Dict, List, Optional, Set, Tuple
+from .keyword_index import KeywordIndex, tokens
+
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have in is it its of on or that the this to was "
+    "were will with not no do does did so if then than into about over after before".split()
+)
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercase word tokens of text, without stopwords.
+    """
+    return [t for t in tokens(text or "") if t not in STOPWORDS]
+
+
+class TextIndex:
+    """
+    BM25 index over short texts, each carrying an arbitrary payload.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        """
+        :param k1: BM25 term-frequency saturation.
+        :param b: BM25 length normalization.
+        """
+        self.k1 = k1
+        self.b = b
+        self._postings = KeywordIndex(frequencies=True)
+        # token -> removed documents still in its posting list
+        self._removed_counts: Dict[str, int] = {}
+        self._lengths: List[int] = []
+        self._payloads: List[Any] = []
+        self._terms: List[Tuple[str, ...]] = []
+        self._removed: Set[int] = set()
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        """
+        Number of live (not removed) documents.
+        """
+        return len(self._payloads) - len(self._removed)
+
+    @property
+    def dead(self) -> int:
+        """
+        Number of removed documents still holding a slot.
+        """
+        return len(self._removed)
+
+    def add(self, text: str, payload: Any) -> int:
+        """
+        Index text and return its document id (ids increase with arrival order).
+        """
+        doc_id = len(self._payloads)
+        terms = tokenize(text)
+        counts: Dict[str, int] = {}
+        for token in terms:
+            counts[token] = counts.get(token, 0) + 1
+        self._postings.add_counts(doc_id, counts)
+        self._lengths.append(len(terms))
+        self._payloads.append(payload)
+        self._terms.append(tuple(counts))
+        self._total_length += len(terms)
+        return doc_id
+
+    def remove(self, doc_id: int) -> bool:
+        """
+        Remove a document, leaving a tombstone in the postings (ids of later documents,
+        and the recency of every document, are unchanged).
+        :return: False if doc_id was unknown or already removed.
+        """
+        if not 0 <= doc_id < len(self._payloads) or doc_id in self._removed:
+            return False
+        for token in self._terms[doc_id]:
+            self._removed_counts[token] = self._removed_counts.get(token, 0) + 1
+        self._removed.add(doc_id)
+        self._total_length -= self._lengths[doc_id]
+        self._payloads[doc_id] = None
+        self._terms[doc_id] = ()
+        return True
+
+    def _newest(self, count: int) -> List[int]:
+        """
+        Ids of the count most recent live documents, newest first.
+        """
+        newest: List[int] = []
+        doc_id = len(self._payloads) - 1
+        while doc_id >= 0 and len(newest) < count:
+            if doc_id not in self._removed:
+                newest.append(doc_id)
+            doc_id -= 1
+        return newest
+
+    def relevance(self, query: str) -> Dict[int, float]:
+        """
+        BM25 scores for every document containing at least one query term.
+        """
+        n = len(self)
+        if not n:
+            return {}
+        avg_length = self._total_length / n or 1.0
+        scores: Dict[int, float] = {}
+        for token in set(tokenize(query)):
+            ids, counts = self._postings.postings(token)
+            live = len(ids) - self._removed_counts.get(token, 0)
+            if live <= 0:
+                continue
+            idf = math.log(1.0 + (n - live + 0.5) / (live + 0.5))
+            for doc_id, tf in zip(ids, counts):
+                if doc_id in self._removed:
+                    continue
+                norm = self.k1 * (1.0 - self.b + self.b * self._lengths[doc_id] / avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1.0) / (tf + norm)
+        return scores
+
+    def recency(self, doc_id: int, half_life: float) -> float:
+        """
+        Recency in (0, 1]: halves every half_life documents added after doc_id.
+        """
+        age = len(self._payloads) - 1 - doc_id
+        return 0.5 ** (age / half_life) if half_life > 0 else 1.0
+
+    def search(self,
+               query: Optional[str],
+               top_k: int = 5,
+               recency_weight: float = 0.3,
+               half_life: float = 200.0) -> List[Tuple[float, Any]]:
+        """
+        Return the top_k (score, payload) pairs, best first.
+        Score blends normalized BM25 relevance with recency; with no query terms the most
+        recent documents are returned.
+        :param recency_weight: share of the score given to recency (0 = relevance only).
+        :param half_life: recency half-life measured in documents.
+        """
+        if top_k <= 0 or not len(self):
+            return []
+        relevance = self.relevance(query or "")
+        if not relevance:
+            return [(recency_weight * self.recency(i, half_life), self._payloads[i]) for i in self._newest(top_k)]
+        top = max(relevance.values())
+        # Recent documents compete too, so a strong recent match can beat an old exact one
+        candidates = set(relevance)
+        candidates.update(self._newest(top_k))
+        scored = (
+            ((1.0 - recency_weight) * relevance.get(i, 0.0) / top
+             + recency_weight * self.recency(i, half_life), i)
+            for i in candidates
+        )
+        return [(score, self._payloads[i]) for score, i in heapq.nlargest(top_k, scored)]
+
+    def clear(self) -> None:
+        """
+        Remove all documents.
+        """
+        self._postings.clear()
+        self._removed_counts.clear()
+        self._lengths.clear()
+        self._payloads.clear()
+        self._terms.clear()
+        self._removed.clear()
+        self._total_length = 0
@@ -0,0 +1,147 @@
+"""
+triple_store.py
+
+In-memory triple store. Terms (subjects, predicates, objects) are interned to integer ids;
+facts are (s, p, o) id triples numbered in insertion order, and three hash indexes map each
+subject, predicate and object id to the facts that contain it. A pattern with any positions
+wildcarded is answered from the shortest posting list of its bound positions, so lookups by
+object cost the same as lookups by subject. Duplicate triples are stored once.
+"""
+
+import json
+from array import array
+from typing import Any, Dict, Hashable, Iterator, List, Optional, Tuple
+
+class _Any:
+    """
+    Wildcard marker for pattern queries (None is a valid object value).
+    """
+
+    def __repr__(self) -> str:
+        return "ANY"
+
+ANY = _Any()
+
+Triple = Tuple[Any, Any, Any]
+
+def term_key(value: Any) -> Hashable:
+    """
+    Interning key of a term. Keys are typed so that 1, 1.0 and True stay distinct terms;
+    unhashable values (lists, dicts from JSON) are keyed by their canonical JSON.
+    """
+    try:
+        hash(value)
+        return type(value), value
+    except TypeError:
+        return type(value), json.dumps(value, sort_keys=True, default=str)
+
+
+class TripleStore:
+    """
+    Deduplicated (subject, predicate, object) facts with subject, predicate and object indexes.
+    """
+
+    def __init__(self):
+        self._ids: Dict[Hashable, int] = {}
+        self._terms: List[Any] = []
+        self._facts: List[Tuple[int, int, int]] = []
+        self._fact_ids: Dict[Tuple[int, int, int], int] = {}
+        self._by_subject: Dict[int, array] = {}
+        self._by_predicate: Dict[int, array] = {}
+        self._by_object: Dict[int, array] = {}
+
+    def __len__(self) -> int:
+        return len(self._facts)
+
+    def _intern(self, value: Any) -> int:
+        key = term_key(value)
+        term = self._ids.get(key)
+        if term is None:
+            term = self._ids[key] = len(self._terms)
+            self._terms.append(value)
+        return term
+
+    def _lookup(self, value: Any) -> Optional[int]:
+        return self._ids.get(term_key(value))
+
+    def add(self, subject: Any, predicate: Any, obj: Any) -> Optional[int]:
+        """
+        Add a triple and return its position among the subject's facts,
+        or None if the triple is already stored.
+        """
+        triple = (self._intern(subject), self._intern(predicate), self._intern(obj))
+        if triple in self._fact_ids:
+            return None
+        fact = len(self._facts)
+        self._facts.append(triple)
+        self._fact_ids[triple] = fact
+        for index, term in zip((self._by_subject, self._by_predicate, self._by_object), triple):
+            postings = index.get(term)
+            if postings is None:
+                postings = index[term] = array("L")
+            postings.append(fact)
+        return len(self._by_subject[triple[0]]) - 1
+
+    def contains(self, subject: Any, predicate: Any, obj: Any) -> bool:
+        triple = (self._lookup(subject), self._lookup(predicate), self._lookup(obj))
+        return None not in triple and triple in self._fact_ids
+
+    def _decode(self, fact: int) -> Triple:
+        s, p, o = self._facts[fact]
+        return self._terms[s], self._terms[p], self._terms[o]
+
+    def match(self, subject: Any = ANY, predicate: Any = ANY, obj: Any = ANY) -> Iterator[Triple]:
+        """
+        Yield triples matching a pattern, in insertion order; ANY matches every term.
+        """
+        bound: List[Tuple[int, int]] = []  # (position, term id)
+        postings: List[array] = []
+        for position, (value, index) in enumerate(((subject, self._by_subject),
+                                                   (predicate, self._by_predicate),
+                                                   (obj, self._by_object))):
+            if value is ANY:
+                continue
+            term = self._lookup(value)
+            if term is None or term not in index:
+                return
+            bound.append((position, term))
+            postings.append(index[term])
+        if not bound:
+            for fact in range(len(self._facts)):
+                yield self._decode(fact)
+            return
+        if len(bound) == 3:
+            fact = self._fact_ids.get(tuple(term for _, term in bound))
+            if fact is not None:
+                yield self._decode(fact)
+            return
+        for fact in min(postings, key=len):
+            triple = self._facts[fact]
+            if all(triple[position] == term for position, term in bound):
+                yield self._decode(fact)
+
+    def subject_fact(self, subject: Any, position: int) -> Triple:
+        """
+        Return the position-th fact of a subject (in insertion order).
+        :raises KeyError: unknown subject.
+        :raises IndexError: position out of range.
+        """
+        term = self._lookup(subject)
+        if term is None or term not in self._by_subject:
+            raise KeyError(subject)
+        return self._decode(self._by_subject[term][position])
+
+    def subjects(self) -> Iterator[Any]:
+        """
+        Subjects in order of their first fact.
+        """
+        return (self._terms[term] for term in self._by_subject)
+
+    def clear(self) -> None:
+        self._ids.clear()
+        self._terms.clear()
+        self._facts.clear()
+        self._fact_ids.clear()
+        self._by_subject.clear()
+        self._by_predicate.clear()
+        self._by_object.clear()
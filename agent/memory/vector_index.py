@@ -0,0 +1,488 @@
+"""
+vector_index.py
+
+In-process exact vector index. Embeddings live in one contiguous float32 matrix (grown by
+doubling) with a parallel table of ids and metadata; search is a single matmul followed by
+an argpartition top-k. Persistence writes a raw .npy matrix plus a JSON sidecar, and loading
+memory-maps the matrix so startup does not parse or copy it. Removed entries become
+tombstones that are skipped by search and dropped by compaction.
+"""
+
+import os
+import json
+import numpy as np
+from typing import Any, Dict, List, Optional, Sequence
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+def _atomic_write(path: str, write) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        write(f)
+    os.replace(tmp, path)
+
+
+class FlatIndex:
+    """
+    Brute-force cosine-similarity index over float32 vectors.
+    """
+
+    kind = "flat"
+
+    def __init__(self, dim: Optional[int] = None, capacity: int = 1024):
+        """
+        :param dim: vector dimension; inferred from the first insert when None.
+        :param capacity: initial number of rows allocated.
+        """
+        self.dim = dim
+        self._capacity = max(1, capacity)
+        self._matrix: Optional[np.ndarray] = None
+        self._count = 0
+        self._alive: Optional[np.ndarray] = None
+        self._deleted = 0
+        self._row_of: Dict[str, int] = {}
+        self.ids: List[str] = []
+        self.metadata: List[Dict[str, Any]] = []
+        self.version = 0
+
+    def __len__(self) -> int:
+        return self._count - self._deleted
+
+    def __contains__(self, entry_id: str) -> bool:
+        return entry_id in self._row_of
+
+    @property
+    def tombstone_ratio(self) -> float:
+        """
+        Share of stored rows that are removed but not yet compacted away.
+        """
+        return self._deleted / self._count if self._count else 0.0
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """
+        View of the stored (unit-normalized) vectors.
+        """
+        if self._matrix is None:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        return self._matrix[:self._count]
+
+    def _reserve(self, rows: int) -> None:
+        """
+        Ensure room for `rows` more vectors. A memory-mapped matrix is copied into memory
+        on the first write.
+        """
+        needed = self._count + rows
+        writable = isinstance(self._matrix, np.ndarray) and not isinstance(self._matrix, np.memmap)
+        if self._matrix is not None and writable and needed <= self._matrix.shape[0]:
+            return
+        capacity = self._matrix.shape[0] if self._matrix is not None else self._capacity
+        while capacity < needed:
+            capacity *= 2
+        grown = np.empty((capacity, self.dim), dtype=np.float32)
+        alive = np.zeros(capacity, dtype=bool)
+        if self._count:
+            grown[:self._count] = self._matrix[:self._count]
+            alive[:self._count] = self._alive[:self._count]
+        self._matrix = grown
+        self._alive = alive
+
+    def add(self,
+            vectors: Any,
+            ids: Sequence[str],
+            metadata: Optional[Sequence[Dict[str, Any]]] = None) -> None:
+        """
+        Append vectors with their ids and metadata. An id already present is replaced
+        (its old row becomes a tombstone).
+        :param vectors: array-like of shape (n, dim).
+        """
+        block = np.asarray(vectors, dtype=np.float32)
+        if block.ndim == 1:
+            block = block[None, :]
+        if len(block) != len(ids):
+            raise ValueError("vectors and ids must have the same length.")
+        if not len(block):
+            return
+        if self.dim is None:
+            self.dim = block.shape[1]
+        elif block.shape[1] != self.dim:
+            raise ValueError(f"Expected vectors of dimension {self.dim}, got {block.shape[1]}.")
+        for entry_id in ids:
+            self.remove(entry_id)
+        self._reserve(len(block))
+        start = self._count
+        self._matrix[start:start + len(block)] = _normalize(block)
+        self._alive[start:start + len(block)] = True
+        self._count += len(block)
+        self.ids.extend(ids)
+        self.metadata.extend(metadata if metadata is not None else [{} for _ in ids])
+        for offset, entry_id in enumerate(ids):
+            self._row_of[entry_id] = start + offset
+        self.version += 1
+
+    def remove(self, entry_id: str) -> bool:
+        """
+        Tombstone an entry. Returns False if the id is unknown.
+        """
+        row = self._row_of.pop(entry_id, None)
+        if row is None:
+            return False
+        self._alive[row] = False
+        self._deleted += 1
+        self.version += 1
+        return True
+
+    def get_metadata(self, entry_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Return the metadata stored for an id, or None.
+        """
+        row = self._row_of.get(entry_id)
+        return None if row is None else self.metadata[row]
+
+    def get_vector(self, entry_id: str) -> Optional[np.ndarray]:
+        """
+        Return the stored (normalized) vector for an id, or None.
+        """
+        row = self._row_of.get(entry_id)
+        return None if row is None else self._matrix[row]
+
+    def search(self, query: Any, top_k: int = 5) -> List[Dict[str, Any]]:
+        """
+        Return up to top_k entries most similar to query as {id, score, metadata}, best first.
+        """
+        if not len(self) or top_k <= 0:
+            return []
+        q = np.asarray(query, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(q)
+        if norm == 0:
+            return []
+        scores = self.vectors @ (q / norm)
+        if self._deleted:
+            scores[~self._alive[:self._count]] = -np.inf
+        k = min(top_k, len(self))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [{"id": self.ids[i], "score": float(scores[i]), "metadata": self.metadata[i]} for i in top]
+
+    def compacted(self) -> "FlatIndex":
+        """
+        Return a copy without tombstones. Safe to call from another thread while this
+        index keeps receiving inserts; the copy reflects the rows present when it started.
+        """
+        matrix, alive, count = self._matrix, self._alive, self._count
+        ids, metadata = self.ids[:count], self.metadata[:count]
+        index = self._empty_like(max(1, count - self._deleted))
+        if count:
+            keep = np.flatnonzero(alive[:count])
+            index.add(matrix[keep], [ids[i] for i in keep], [metadata[i] for i in keep])
+        return index
+
+    def _empty_like(self, capacity: int) -> "FlatIndex":
+        """
+        New empty index with the same configuration.
+        """
+        return type(self)(self.dim, capacity=capacity)
+
+    def clear(self) -> None:
+        """
+        Remove all vectors.
+        """
+        self._matrix = None
+        self._alive = None
+        self._count = 0
+        self._deleted = 0
+        self._row_of = {}
+        self.ids = []
+        self.metadata = []
+        self.version += 1
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def stem(base: str) -> str:
+        return base[:-4] if base.endswith(".npy") else base
+
+    @classmethod
+    def paths(cls, base: str) -> tuple:
+        """
+        (matrix path, sidecar path) for a base path with or without a .npy suffix.
+        """
+        stem = cls.stem(base)
+        return f"{stem}.npy", f"{stem}.json"
+
+    def _sidecar(self) -> Dict[str, Any]:
+        return {"kind": self.kind, "dim": self.dim, "count": self._count,
+                "ids": self.ids, "metadata": self.metadata}
+
+    def save(self, base: str) -> None:
+        """
+        Write the matrix as .npy and ids/metadata as a JSON sidecar next to it.
+        Tombstones are compacted away in the written copy.
+        """
+        if self._deleted:
+            self.compacted().save(base)
+            return
+        matrix_path, sidecar_path = self.paths(base)
+        directory = os.path.dirname(matrix_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        _atomic_write(matrix_path, lambda f: np.save(f, np.ascontiguousarray(self.vectors)))
+        self._save_extra(base)
+        # Sidecar last: a reader never sees a sidecar that is newer than its arrays
+        _atomic_write(sidecar_path, lambda f: f.write(json.dumps(self._sidecar()).encode("utf-8")))
+
+    def _save_extra(self, base: str) -> None:
+        """
+        Hook for subclasses persisting additional arrays.
+        """
+
+    def _restore(self, sidecar: Dict[str, Any], matrix: Optional[np.ndarray], base: str, mmap: bool) -> None:
+        self.dim = sidecar["dim"]
+        self._count = sidecar["count"]
+        self.ids = list(sidecar["ids"])
+        self.metadata = list(sidecar["metadata"])
+        self._matrix = matrix if self._count else None
+        self._alive = np.ones(self._count, dtype=bool) if self._count else None
+        self._deleted = 0
+        self._row_of = {entry_id: row for row, entry_id in enumerate(self.ids)}
+
+    @classmethod
+    def load(cls, base: str, mmap: bool = True) -> "FlatIndex":
+        """
+        Load an index written by save(). With mmap the matrix stays on disk (read-only)
+        until the first insert copies it into memory.
+        """
+        matrix_path, sidecar_path = cls.paths(base)
+        with open(sidecar_path, "r", encoding="utf-8") as f:
+            sidecar = json.load(f)
+        index = cls(**sidecar.get("options", {}))
+        matrix = np.load(matrix_path, mmap_mode="r" if mmap else None) if sidecar["count"] else None
+        index._restore(sidecar, matrix, base, mmap)
+        return index
+
+
+def _nearest(vectors: np.ndarray, centroids: np.ndarray, chunk: int = 65536) -> np.ndarray:
+    """
+    Index of the most similar centroid for each (normalized) vector, computed in chunks.
+    """
+    assign = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), chunk):
+        assign[start:start + chunk] = np.argmax(vectors[start:start + chunk] @ centroids.T, axis=1)
+    return assign
+
+def kmeans(data: np.ndarray, k: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """
+    Spherical k-means over unit vectors; returns k unit-norm centroids.
+    Empty clusters are re-seeded from random points.
+    """
+    rng = np.random.default_rng(seed)
+    k = min(k, len(data))
+    centroids = data[rng.choice(len(data), k, replace=False)].astype(np.float32)
+    for _ in range(iterations):
+        assign = _nearest(data, centroids)
+        order = np.argsort(assign, kind="stable")
+        counts = np.bincount(assign, minlength=k)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        filled = np.flatnonzero(counts)
+        sums = np.add.reduceat(data[order], starts[filled], axis=0)
+        centroids[filled] = _normalize(sums)
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            centroids[empty] = data[rng.choice(len(data), len(empty), replace=False)]
+    return centroids
+
+
+class IVFIndex(FlatIndex):
+    """
+    Inverted-file approximate index: vectors are bucketed by their nearest k-means centroid,
+    and a query only scans the `nprobe` buckets whose centroids are closest to it.
+    Until enough vectors have been added to train the quantizer, search is exact.
+    """
+
+    kind = "ivf"
+
+    def __init__(self,
+                 dim: Optional[int] = None,
+                 capacity: int = 1024,
+                 nlist: Optional[int] = None,
+                 nprobe: int = 8,
+                 train_threshold: int = 4096,
+                 train_size: int = 65536,
+                 iterations: int = 10,
+                 retrain_factor: float = 4.0,
+                 seed: int = 0):
+        """
+        :param nlist: number of buckets; defaults to 4*sqrt(n) at training time.
+        :param nprobe: buckets scanned per query (higher = better recall, slower).
+        :param train_threshold: vectors needed before the quantizer is trained.
+        :param train_size: maximum sample size used for k-means.
+        :param iterations: k-means iterations.
+        :param retrain_factor: retrain once the index has grown this much since the last training.
+        :param seed: random seed for sampling and initialization.
+        """
+        super().__init__(dim, capacity)
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_threshold = train_threshold
+        self.train_size = train_size
+        self.iterations = iterations
+        self.retrain_factor = retrain_factor
+        self.seed = seed
+        self.centroids: Optional[np.ndarray] = None
+        # Bucket membership: Python lists take inserts, arrays serve queries; either may be
+        # None until needed (loaded indexes start with arrays only).
+        self._lists: List[Optional[List[int]]] = []
+        self._list_arrays: List[Optional[np.ndarray]] = []
+        self._trained_at = 0
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    def _options(self) -> Dict[str, Any]:
+        return {"nlist": self.nlist, "nprobe": self.nprobe, "train_threshold": self.train_threshold,
+                "train_size": self.train_size, "iterations": self.iterations,
+                "retrain_factor": self.retrain_factor, "seed": self.seed}
+
+    def _empty_like(self, capacity: int) -> "IVFIndex":
+        index = type(self)(self.dim, capacity=capacity, **self._options())
+        if self.trained:
+            index.centroids = self.centroids.copy()
+            index._lists = [[] for _ in range(len(self.centroids))]
+            index._list_arrays = [None] * len(self.centroids)
+            index._trained_at = self._trained_at
+        return index
+
+    def _assign_rows(self, start: int, end: int) -> None:
+        assign = _nearest(self._matrix[start:end], self.centroids)
+        for row, bucket in zip(range(start, end), assign.tolist()):
+            if self._lists[bucket] is None:
+                self._lists[bucket] = self._list_arrays[bucket].tolist()
+            self._lists[bucket].append(row)
+            self._list_arrays[bucket] = None
+
+    def train(self) -> None:
+        """
+        (Re)train the coarse quantizer on a sample of live vectors and reassign every row.
+        """
+        live = np.flatnonzero(self._alive[:self._count])
+        if not len(live):
+            return
+        rng = np.random.default_rng(self.seed)
+        sample = live if len(live) <= self.train_size else rng.choice(live, self.train_size, replace=False)
+        nlist = self.nlist or max(1, int(4 * np.sqrt(len(live))))
+        self.centroids = kmeans(np.asarray(self._matrix[np.sort(sample)]), nlist, self.iterations, self.seed)
+        self._lists = [[] for _ in range(len(self.centroids))]
+        self._list_arrays = [None] * len(self.centroids)
+        self._assign_rows(0, self._count)
+        self._trained_at = len(live)
+        self.version += 1
+
+    def add(self, vectors: Any, ids, metadata=None) -> None:
+        start = self._count
+        super().add(vectors, ids, metadata)
+        if self.trained and len(self) < self._trained_at * self.retrain_factor:
+            self._assign_rows(start, self._count)
+        elif len(self) >= self.train_threshold:
+            self.train()
+
+    def _bucket(self, bucket: int) -> np.ndarray:
+        rows = self._list_arrays[bucket]
+        if rows is None:
+            rows = np.asarray(self._lists[bucket], dtype=np.int64)
+            self._list_arrays[bucket] = rows
+        return rows
+
+    def search(self, query: Any, top_k: int = 5, nprobe: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Approximate search over the nprobe closest buckets (exact until trained).
+        :param nprobe: per-query override of the instance nprobe.
+        """
+        if not self.trained:
+            return super().search(query, top_k)
+        if not len(self) or top_k <= 0:
+            return []
+        q = np.asarray(query, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(q)
+        if norm == 0:
+            return []
+        q = q / norm
+        probe = min(nprobe or self.nprobe, len(self.centroids))
+        closest = np.argpartition(-(self.centroids @ q), probe - 1)[:probe]
+        rows = np.concatenate([self._bucket(b) for b in closest])
+        if self._deleted and len(rows):
+            rows = rows[self._alive[rows]]
+        if not len(rows):
+            return []
+        scores = self._matrix[rows] @ q
+        k = min(top_k, len(rows))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [{"id": self.ids[rows[i]], "score": float(scores[i]), "metadata": self.metadata[rows[i]]}
+                for i in top]
+
+    def clear(self) -> None:
+        super().clear()
+        self.centroids = None
+        self._lists = []
+        self._list_arrays = []
+        self._trained_at = 0
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+
+    def _sidecar(self) -> Dict[str, Any]:
+        sidecar = super()._sidecar()
+        sidecar["options"] = self._options()
+        sidecar["trained_at"] = self._trained_at
+        return sidecar
+
+    def _save_extra(self, base: str) -> None:
+        stem = self.stem(base)
+        if not self.trained:
+            return
+        assign = np.full(self._count, -1, dtype=np.int32)
+        for bucket in range(len(self.centroids)):
+            assign[self._bucket(bucket)] = bucket
+        _atomic_write(f"{stem}.centroids.npy", lambda f: np.save(f, self.centroids))
+        _atomic_write(f"{stem}.assign.npy", lambda f: np.save(f, assign))
+
+    def _restore(self, sidecar: Dict[str, Any], matrix: Optional[np.ndarray], base: str, mmap: bool) -> None:
+        super()._restore(sidecar, matrix, base, mmap)
+        stem = self.stem(base)
+        if not sidecar.get("trained_at") or not os.path.exists(f"{stem}.centroids.npy"):
+            return
+        self.centroids = np.load(f"{stem}.centroids.npy")
+        assign = np.load(f"{stem}.assign.npy")
+        rows = np.flatnonzero(assign >= 0)
+        order = rows[np.argsort(assign[rows], kind="stable")]
+        counts = np.bincount(assign[rows], minlength=len(self.centroids))
+        bounds = np.concatenate(([0], np.cumsum(counts)))
+        self._list_arrays = [order[bounds[b]:bounds[b + 1]] for b in range(len(self.centroids))]
+        self._lists = [None] * len(self.centroids)
+        self._trained_at = sidecar["trained_at"]
+
+
+INDEX_TYPES = {FlatIndex.kind: FlatIndex, IVFIndex.kind: IVFIndex}
+
+def create_index(index_type: str = "flat", **options) -> FlatIndex:
+    """
+    Build an empty index by name ("flat" or "ivf").
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type '{index_type}'.")
+    return INDEX_TYPES[index_type](**options)
+
+def load_index(base: str, mmap: bool = True) -> FlatIndex:
+    """
+    Load an index of whichever type was saved at base.
+    """
+    with open(FlatIndex.paths(base)[1], "r", encoding="utf-8") as f:
+        kind = json.load(f).get("kind", FlatIndex.kind)
+    return INDEX_TYPES[kind].load(base, mmap)
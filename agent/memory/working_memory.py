@@ -3,54 +3,255 @@ working_memory.py
 
 Working memory provides short-term, temporary cache for current context and attention.
 Supports add, retrieve, and clear operations with optional capacity limit.
+
+Besides the entry capacity, the cache can be bounded by an approximate size in bytes
+(see approx_size), entries can carry a time-to-live after which they are dropped lazily
+(when next touched, or when room is needed), and pinned entries are never evicted to make
+room. Hits, misses, evictions and expirations are counted in `stats`.
 """
 
+import sys
+import time
 from collections import OrderedDict
-from typing import Any, Optional
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from .change_log import ChangeLog
+
+def approx_size(value: Any, max_items: int = 10000) -> int:
+    """
+    Approximate memory footprint of a value in bytes: sys.getsizeof of the value plus that
+    of everything reachable through containers and instance __dict__s, each object counted
+    once. Stops descending after max_items objects so huge structures stay cheap to size.
+    """
+    seen: Set[int] = set()
+    stack = [value]
+    total = 0
+    while stack and len(seen) < max_items:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        try:
+            total += sys.getsizeof(obj)
+        except TypeError:
+            continue
+        if isinstance(obj, (str, bytes, bytearray, int, float, bool, type(None))):
+            continue
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        elif hasattr(obj, "__dict__") and not isinstance(obj, type):
+            stack.append(vars(obj))
+    return total
+
 
 class WorkingMemory:
     """
-    Manages short-term memory entries with optional capacity (LRU eviction).
+    Manages short-term memory entries with optional capacity (LRU eviction),
+    byte budget, per-entry TTLs and pinning.
     """
 
-    def __init__(self, capacity: int = 50):
+    def __init__(self,
+                 capacity: int = 50,
+                 max_bytes: Optional[int] = None,
+                 default_ttl: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic):
         """
         Initialize working memory with an optional capacity.
         :param capacity: max number of entries to store (LRU eviction if full).
+        :param max_bytes: optional budget for the approximate size of the stored values.
+        :param default_ttl: seconds an entry lives when add() is given no ttl (None: no expiry).
+        :param clock: time source for TTLs, in seconds.
         """
         self.capacity = capacity
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.clock = clock
         self._store: OrderedDict[str, Any] = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._expires: Dict[str, float] = {}
+        self._pinned: Set[str] = set()
+        self._bytes = 0
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "rejected": 0}
+        self.changes = ChangeLog()
+
+    # ------------------------------------------------------------------
+    # Internal bookkeeping
+    # ------------------------------------------------------------------
+
+    def _drop(self, key: str) -> None:
+        del self._store[key]
+        self._bytes -= self._sizes.pop(key)
+        self._expires.pop(key, None)
+        self._pinned.discard(key)
+        self.changes.record("remove", key)
+
+    def _expired(self, key: str, now: Optional[float] = None) -> bool:
+        expires = self._expires.get(key)
+        return expires is not None and (self.clock() if now is None else now) >= expires
+
+    def _expire(self, key: str) -> bool:
+        """
+        Drop key if its TTL has passed; return whether it was dropped.
+        """
+        if key in self._store and self._expired(key):
+            self._drop(key)
+            self.stats["expirations"] += 1
+            return True
+        return False
+
+    def expire(self) -> int:
+        """
+        Drop every expired entry now and return how many were dropped.
+        """
+        now = self.clock()
+        expired = [key for key, expires in self._expires.items() if now >= expires]
+        for key in expired:
+            self._drop(key)
+        self.stats["expirations"] += len(expired)
+        return len(expired)
+
+    def _over_budget(self) -> bool:
+        return (len(self._store) > self.capacity
+                or (self.max_bytes is not None and self._bytes > self.max_bytes))
 
-    def add(self, key: str, value: Any) -> None:
+    def _evict(self) -> None:
+        """
+        Make room: expired entries go first, then unpinned entries from least recently used.
+        Pinned entries are kept even if they alone exceed the budget.
+        """
+        if self._expires and self.expire() and not self._over_budget():
+            return
+        victims = (key for key in list(self._store) if key not in self._pinned)
+        while self._over_budget():
+            key = next(victims, None)
+            if key is None:
+                return
+            self._drop(key)
+            self.stats["evictions"] += 1
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def add(self, key: str, value: Any, ttl: Optional[float] = None, pinned: Optional[bool] = None) -> None:
         """
         Add or update a key-value entry in working memory.
         New entries are added to the end (most recent).
-        If capacity exceeded, evict the oldest entry.
+        If capacity or byte budget is exceeded, evict expired, then least recently used, entries.
+        An unpinned value larger than max_bytes on its own is not stored.
+        :param ttl: seconds until the entry expires (defaults to default_ttl; None: never).
+        :param pinned: protect the entry from eviction (None keeps an existing entry's pin).
         """
+        if pinned is None:
+            pinned = key in self._pinned
+        size = approx_size(value)
+        if self.max_bytes is not None and size > self.max_bytes and not pinned:
+            if key in self._store:
+                self._drop(key)
+            self.stats["rejected"] += 1
+            return
         if key in self._store:
             self._store.move_to_end(key)
+            self._bytes -= self._sizes[key]
         self._store[key] = value
-        if len(self._store) > self.capacity:
-            self._store.popitem(last=False)
+        self._sizes[key] = size
+        self._bytes += size
+        ttl = self.default_ttl if ttl is None else ttl
+        if ttl is None:
+            self._expires.pop(key, None)
+        else:
+            self._expires[key] = self.clock() + ttl
+        if pinned:
+            self._pinned.add(key)
+        else:
+            self._pinned.discard(key)
+        self.changes.record("add", key)
+        if self._over_budget():
+            self._evict()
 
     def get(self, key: str) -> Optional[Any]:
         """
         Retrieve value by key, updating recency.
-        Returns None if key not found.
+        Returns None if key not found (or expired).
         """
-        if key in self._store:
+        if key in self._store and not self._expire(key):
             self._store.move_to_end(key)
+            self.stats["hits"] += 1
             return self._store[key]
+        self.stats["misses"] += 1
         return None
 
+    def peek(self, key: str) -> Optional[Any]:
+        """
+        Retrieve value by key without updating recency or statistics.
+        """
+        self._expire(key)
+        return self._store.get(key)
+
+    def pin(self, key: str) -> bool:
+        """
+        Protect an entry from eviction; return False if the key is not stored.
+        """
+        if key not in self._store or self._expire(key):
+            return False
+        self._pinned.add(key)
+        return True
+
+    def unpin(self, key: str) -> None:
+        """
+        Make a pinned entry evictable again (it is evicted at once if over budget).
+        """
+        self._pinned.discard(key)
+        if key in self._store and self._over_budget():
+            self._evict()
+
+    def remove(self, key: str) -> bool:
+        """
+        Delete an entry; return whether it was present.
+        """
+        if key not in self._store:
+            return False
+        self._drop(key)
+        return True
+
     def clear(self) -> None:
         """
         Clear all entries from working memory.
         """
         self._store.clear()
+        self._sizes.clear()
+        self._expires.clear()
+        self._pinned.clear()
+        self._bytes = 0
+        self.changes.record("clear")
 
-    def items(self):
+    def items(self) -> List[Tuple[str, Any]]:
         """
         Return all key-value pairs in order from oldest to newest.
         """
+        if self._expires:
+            self.expire()
         return list(self._store.items())
+
+    def __contains__(self, key: Any) -> bool:
+        return key in self._store and not self._expired(key)
+
+    def __len__(self) -> int:
+        return len(self._store)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Approximate size of the stored values, counted against max_bytes.
+        """
+        return self._bytes
+
+    @property
+    def hit_rate(self) -> float:
+        """
+        Fraction of get() calls that found a live entry.
+        """
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / lookups if lookups else 0.0
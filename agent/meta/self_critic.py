@@ -4,37 +4,47 @@ self_critic.py
 Analyzes agent decisions and behaviors to provide critical feedback and identify improvement opportunities.
 """
 
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from ..memory.reflective_memory import ReflectiveMemory
+from ..memory.context_builder import ContextBuilder
 from ..reasoning.llm_interface import LLMInterface
+from ..reasoning.token_budget import PromptSection
 
 class SelfCritic:
     """
     Generates critiques for past actions and outcomes to guide self-improvement.
     """
 
-    def __init__(self, llm: LLMInterface, reflective_memory: ReflectiveMemory):
+    def __init__(self,
+                 llm: LLMInterface,
+                 reflective_memory: ReflectiveMemory,
+                 context_builder: Optional[ContextBuilder] = None):
         """
         :param llm: LLMInterface for critique generation.
         :param reflective_memory: ReflectiveMemory to store criticism insights.
+        :param context_builder: selects relevant entries; defaults to the builder shared by
+            all components over reflective_memory (ContextBuilder.shared).
         """
         self.llm = llm
         self.reflective = reflective_memory
+        self.context = context_builder or ContextBuilder.shared(reflective_memory, llm.token_counter)
 
     def critique_action(self, action_summary: str, outcome_summary: str) -> str:
         """
         Use LLM to critique a specific action vs its outcome.
         """
-        prompt = (
-            "Please provide a critical analysis of the following action and outcome:\n"
-            f"Action: {action_summary}\nOutcome: {outcome_summary}\n"
-        )
-        critique = self.llm.generate(prompt)
+        prompt = [
+            PromptSection("Please provide a critical analysis of the following action and outcome:",
+                          priority=100, name="instructions"),
+            PromptSection(f"Action: {action_summary}", priority=20, name="action", keep="middle"),
+            PromptSection(f"Outcome: {outcome_summary}", priority=10, name="outcome", keep="middle"),
+        ]
+        critique = self.llm.generate(prompt, cache=True, call_site="self_critic.critique_action")
         self.reflective.add_insight(critique, {"type": "critique"})
         return critique
 
-    def review_recent(self, limit: int = 5) -> List[Dict[str, Any]]:
+    def review_recent(self, limit: int = 5, query: Optional[str] = None) -> List[Dict[str, Any]]:
         """
-        Retrieve recent reflective or critique entries.
+        Retrieve recent reflective or critique entries, newest (or, with a query, most relevant) first.
         """
-        return self.reflective.query_insights("", limit)
+        return self.context.select_insights(query, limit)
@@ -5,7 +5,7 @@ Performs continual self-reflection by analyzing past actions and outcomes.
 Stores reflective insights to memory.
 """
 
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from ..memory.reflective_memory import ReflectiveMemory
 
 class SelfReflector:
@@ -13,18 +13,46 @@ class SelfReflector:
     Generates reflective insights based on agent behavior and memory.
     """
 
+    FAILURE_STATUSES = ("error", "failed", "failure")
+
     def __init__(self, reflective_memory: ReflectiveMemory):
         """
         :param reflective_memory: ReflectiveMemory instance for storing insights.
         """
         self.reflective = reflective_memory
 
-    def reflect(self, action_log: List[Dict[str, Any]], outcome_log: List[Dict[str, Any]]) -> None:
+    @classmethod
+    def _failed(cls, outcome: Any) -> bool:
+        if not isinstance(outcome, dict):
+            return False
+        return (outcome.get("success") is False or outcome.get("ok") is False
+                or str(outcome.get("status", "")).lower() in cls.FAILURE_STATUSES)
+
+    def reflect(self,
+                action_log: List[Dict[str, Any]],
+                outcome_log: List[Dict[str, Any]],
+                since: int = 0) -> Optional[int]:
         """
-        Analyze action and outcome logs to produce insights.
+        Analyze the actions and outcomes from position `since` on and store one insight about
+        them. Only that slice is attached as metadata (the memory stores large values by
+        reference), so callers keeping cumulative logs pass the position they reflected up to
+        last time and entry size does not grow with the logs.
         :param action_log: list of action descriptors taken.
         :param outcome_log: list of outcome summaries.
+        :param since: position in both logs of the first entry to reflect on.
+        :return: id of the stored (or merged) insight, or None if there was nothing to reflect on.
         """
-        # TODO: implement reflection logic to generate insights
-        insight = "Reflection placeholder"
-        self.reflective.add_insight(insight, {"actions": action_log, "outcomes": outcome_log})
+        actions, outcomes = list(action_log[since:]), list(outcome_log[since:])
+        if not actions and not outcomes:
+            return None
+        failures = sum(1 for o in outcomes if self._failed(o))
+        kinds = sorted({str(a.get("type") or a.get("action") or a.get("name"))
+                        for a in actions if isinstance(a, dict)} - {"None"})
+        insight = f"Reflected on {len(actions)} action(s)"
+        if kinds:
+            insight += f" ({', '.join(kinds[:5])})"
+        insight += f" with {len(outcomes)} outcome(s), {failures} failed."
+        importance = 1.0 + (failures / len(outcomes) if outcomes else 0.0)
+        return self.reflective.add_insight(insight,
+                                           {"type": "reflection", "actions": actions, "outcomes": outcomes},
+                                           importance=importance)
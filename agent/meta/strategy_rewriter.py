@@ -4,9 +4,12 @@ strategy_rewriter.py
 Proposes modifications to the agent’s global strategy based on reflective insights and performance feedback.
 """
 
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Callable
 from ..reasoning.llm_interface import LLMInterface
+from ..reasoning.token_budget import PromptSection
+from ..reasoning.structured_output import StructuredOutput, StructuredOutputError
 from ..memory.reflective_memory import ReflectiveMemory
+from ..memory.context_builder import ContextBuilder
 
 class StrategyRewriter:
     """
@@ -15,30 +18,52 @@ class StrategyRewriter:
 
     def __init__(self,
                  llm: LLMInterface,
-                 reflective_memory: ReflectiveMemory):
+                 reflective_memory: ReflectiveMemory,
+                 context_builder: Optional[ContextBuilder] = None,
+                 max_insights: int = 20,
+                 context_tokens: int = 1500):
         """
         :param llm: LLMInterface for generating strategy rewrite suggestions.
         :param reflective_memory: ReflectiveMemory instance with past insights.
+        :param context_builder: selects relevant insights; defaults to the builder shared by
+            all components over reflective_memory (ContextBuilder.shared).
+        :param max_insights: maximum number of insights included in the prompt.
+        :param context_tokens: token budget for the insight context.
         """
         self.llm = llm
         self.reflective = reflective_memory
+        self.context = context_builder or ContextBuilder.shared(reflective_memory, llm.token_counter)
+        self.max_insights = max_insights
+        self.context_tokens = context_tokens
+        self.structured = StructuredOutput(llm, schema={"type": "object"})
 
-    def rewrite(self, current_strategy: Dict[str, Any]) -> Dict[str, Any]:
+    def rewrite(self,
+                current_strategy: Dict[str, Any],
+                on_field: Optional[Callable[[str, Any], None]] = None) -> Dict[str, Any]:
         """
         Generate a revised strategy plan.
+        The response is streamed and parsed incrementally; malformed output is abandoned and
+        retried early instead of after the full generation.
         :param current_strategy: existing global strategy dict.
+        :param on_field: optional callback(key, value) receiving each top-level strategy field
+                         as soon as it has been generated.
         :return: modified strategy dict.
         """
-        insights = self.reflective.get_all()
-        prompt = (
-            "Based on these reflective insights and the current strategy, suggest improvements:\n\n"
-            f"Insights: {insights}\n"
-            f"Current Strategy: {current_strategy}\n\n"
-            "Provide a JSON-formatted revised strategy."
-        )
-        response = self.llm.generate(prompt)
+        # Only the insights most relevant to the current strategy (and most recent) are used,
+        # so the prompt stays bounded as reflective memory grows.
+        context = self.context.build(str(current_strategy), self.context_tokens, k=self.max_insights)
+        insight_lines = "\n".join(self.context.format_item("insights", e) for e in context["insights"])
+        prompt = [
+            PromptSection("Based on these reflective insights and the current strategy, suggest improvements:",
+                          priority=100, name="instructions"),
+            PromptSection(f"Insights:\n{insight_lines}", priority=10, name="insights",
+                          summarize=True),
+            PromptSection(f"Current Strategy: {current_strategy}", priority=50, name="strategy",
+                          min_tokens=256),
+            PromptSection("Provide the revised strategy as a single JSON object and nothing else.",
+                          priority=100, name="format"),
+        ]
         try:
-            import json
-            return json.loads(response)
-        except Exception:
-            return {"raw_rewrite": response}
+            return self.structured.generate(prompt, on_field=on_field, call_site="strategy_rewriter.rewrite")
+        except StructuredOutputError as exc:
+            return {"raw_rewrite": exc.text}
@@ -4,12 +4,13 @@ upgrade_engine.py
 Coordinates self-improvement cycle: reflection, critique, rewriting of strategy and constitution, and code updates.
 """
 
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 from ..meta.self_reflector import SelfReflector
 from ..meta.self_critic import SelfCritic
 from ..meta.strategy_rewriter import StrategyRewriter
 from ..meta.constitution_rewriter import ConstitutionRewriter
 from ..meta.agent_editor import AgentEditor
+from ..ace.global_strategy import GlobalStrategyLayer
 
 class UpgradeEngine:
     """
@@ -21,42 +22,57 @@ class UpgradeEngine:
                  critic: SelfCritic,
                  strat_rewriter: StrategyRewriter,
                  const_rewriter: ConstitutionRewriter,
-                 editor: AgentEditor):
+                 editor: AgentEditor,
+                 strategy_layer: Optional[GlobalStrategyLayer] = None):
         """
         :param reflector: generates reflective insights
         :param critic: produces critiques of actions
         :param strat_rewriter: adjusts global strategy
         :param const_rewriter: updates moral constitution
         :param editor: applies code or config patches
+        :param strategy_layer: optional strategy layer receiving rewritten strategy fields as they stream in
         """
         self.reflector = reflector
         self.critic = critic
         self.strat_rewriter = strat_rewriter
         self.const_rewriter = const_rewriter
         self.editor = editor
+        self.strategy_layer = strategy_layer
 
     def run_upgrade_cycle(self,
                           action_log: Any,
                           outcome_log: Any,
                           current_strategy: Dict[str, Any],
-                          workspace_dir: str) -> None:
+                          workspace_dir: str,
+                          since: int = 0) -> None:
         """
         Perform a full self-improvement cycle.
         :param action_log: history of actions taken.
         :param outcome_log: corresponding outcomes or metrics.
         :param current_strategy: existing global strategy state.
         :param workspace_dir: path to codebase root for potential edits.
+        :param since: position in the logs up to which previous cycles already looked;
+            only later entries are reflected on and critiqued.
         """
         # Reflection: generate insights
-        self.reflector.reflect(action_log, outcome_log)
+        self.reflector.reflect(action_log, outcome_log, since=since)
 
         # Critique: analyze key actions
-        for action, outcome in zip(action_log, outcome_log):
+        for action, outcome in zip(action_log[since:], outcome_log[since:]):
             self.critic.critique_action(str(action), str(outcome))
 
         # Strategy rewrite: propose improved strategy
-        new_strategy = self.strat_rewriter.rewrite(current_strategy)
-        # TODO: integrate new_strategy into execution pipeline
+        if self.strategy_layer is not None:
+            previous = self.strategy_layer.current_strategy
+            new_strategy = self.strat_rewriter.rewrite(current_strategy,
+                                                       on_field=self.strategy_layer.update_strategy_field)
+            if "raw_rewrite" in new_strategy:
+                # Unparsable rewrite: drop any fields streamed before the failure
+                self.strategy_layer.current_strategy = previous
+            else:
+                self.strategy_layer.adopt_strategy(new_strategy)
+        else:
+            new_strategy = self.strat_rewriter.rewrite(current_strategy)
 
         # Constitution rewrite: adjust moral imperatives
         self.const_rewriter.rewrite()
@@ -2,41 +2,289 @@
 evaluator.py
 
 Evaluates candidate actions or content using a scoring function or LLM-based evaluator.
+Supports pointwise scoring (one LLM call per item, issued concurrently), batched scoring
+(up to K items per structured prompt, with per-item fallback for anything the parser misses),
+and pairwise tournament ranking with memoized comparisons for top-k selection.
 """
 
-from typing import Any, Dict, List
+import re
+import json
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
 from .llm_interface import LLMInterface
 
+DEFAULT_BATCH_PROMPT = (
+    "Evaluate each of the following {count} items independently and score each from 0 to 1.\n"
+    "Respond with exactly one line per item in the form `<number>: <score>`, e.g. `1: 0.75`.\n\n"
+    "{items}"
+)
+
+DEFAULT_COMPARE_PROMPT = (
+    "Compare the two items below and decide which one is better.\n"
+    "Answer with a single letter: A or B.\n\n"
+    "A:\n{a}\n\nB:\n{b}"
+)
+
+_NUMBER = r"-?\d+(?:\.\d+)?"
+_SCORE_RE = re.compile(rf"({_NUMBER})\s*(?:(/)\s*({_NUMBER})|(%))?")
+_BATCH_LINE_RE = re.compile(
+    rf"^\W*(?:item\s*)?\[?(\d+)\]?\s*(?:[:.)=\-]\s*|\s+)(?:score\s*[:=]?\s*)?({_NUMBER}\s*(?:/\s*{_NUMBER}|%)?)",
+    re.IGNORECASE | re.MULTILINE
+)
+
+def _parse_score(text: str) -> Optional[float]:
+    """
+    Extract a score in [0, 1] from free-form text.
+    Accepts plain decimals, fractions ("7/10") and percentages ("80%"); returns None if absent.
+    """
+    match = _SCORE_RE.search(text or "")
+    if not match:
+        return None
+    value = float(match.group(1))
+    if match.group(2):
+        denominator = float(match.group(3))
+        if denominator <= 0:
+            return None
+        value /= denominator
+    elif match.group(4):
+        value /= 100.0
+    if 0.0 <= value <= 1.0:
+        return value
+    return None
+
+def _parse_batch_scores(text: str, count: int) -> Dict[int, float]:
+    """
+    Parse a batched scoring response into {zero-based index: score}.
+    Understands `n: score` lines, a JSON list of scores, or a JSON object keyed by item number.
+    """
+    scores: Dict[int, float] = {}
+    for number, raw in _BATCH_LINE_RE.findall(text or ""):
+        index = int(number) - 1
+        score = _parse_score(raw)
+        if 0 <= index < count and score is not None and index not in scores:
+            scores[index] = score
+    if len(scores) == count:
+        return scores
+
+    # Fall back to JSON payloads embedded anywhere in the response
+    for match in re.finditer(r"\[[^\[\]]*\]|\{[^{}]*\}", text or ""):
+        try:
+            payload = json.loads(match.group(0))
+        except ValueError:
+            continue
+        if isinstance(payload, list) and len(payload) == count:
+            pairs = enumerate(payload)
+        elif isinstance(payload, dict):
+            pairs = ((int(k) - 1, v) for k, v in payload.items() if str(k).strip().isdigit())
+        else:
+            continue
+        for index, value in pairs:
+            score = _parse_score(str(value))
+            if 0 <= index < count and score is not None:
+                scores.setdefault(index, score)
+    return scores
+
+def _parse_choice(text: str) -> Optional[str]:
+    """
+    Extract the chosen side ("A" or "B") from a pairwise comparison response.
+    """
+    match = re.search(r"\b([AB])\b", (text or "").strip())
+    return match.group(1) if match else None
+
+def _content_hash(item: str) -> str:
+    return hashlib.sha1(item.encode("utf-8")).hexdigest()
+
+
 class Evaluator:
     """
     Provides methods to evaluate and score items.
     """
 
-    def __init__(self, llm: LLMInterface, eval_prompt: str = None):
+    def __init__(self,
+                 llm: LLMInterface,
+                 eval_prompt: str = None,
+                 batch_prompt: str = None,
+                 batch_size: int = 10,
+                 compare_prompt: str = None,
+                 max_cached_comparisons: int = 10000):
         """
         :param llm: LLMInterface instance for evaluation prompts.
-        :param eval_prompt: optional custom prompt template.
+        :param eval_prompt: optional custom prompt template with an {item} field.
+        :param batch_prompt: optional batched prompt template with {count} and {items} fields.
+        :param batch_size: default number of items per batched prompt.
+        :param compare_prompt: optional pairwise prompt template with {a} and {b} fields.
+        :param max_cached_comparisons: bound on memoized pairwise outcomes (LRU).
         """
         self.llm = llm
         self.eval_prompt = eval_prompt or "Evaluate the following item and score it from 0 to 1:\n\n{item}"
+        self.batch_prompt = batch_prompt or DEFAULT_BATCH_PROMPT
+        self.batch_size = batch_size
+        self.compare_prompt = compare_prompt or DEFAULT_COMPARE_PROMPT
+        self.max_cached_comparisons = max_cached_comparisons
+        # (hash, hash) in sorted order -> hash of the preferred item
+        self._comparisons: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        self.comparison_stats = {"requested": 0, "cached": 0}
+
+    async def ascore(self, item: str) -> Optional[float]:
+        """
+        Score a single item asynchronously.
+        Returns a float between 0.0 and 1.0, or None if the response could not be parsed.
+        """
+        prompt = self.eval_prompt.format(item=item)
+        # Deterministic sampling keeps scores stable and lets repeat drafts hit the cache.
+        response = await self.llm.agenerate(prompt, temperature=0.0, call_site="evaluator.score")
+        return _parse_score(response)
 
     def score(self, item: str) -> float:
         """
         Score a single item by sending it to the LLM.
-        Returns a float between 0.0 and 1.0.
+        Returns a float between 0.0 and 1.0 (0.0 if the response is unparsable).
         """
-        prompt = self.eval_prompt.format(item=item)
-        response = self.llm.generate(prompt)
-        try:
-            return float(response.strip())
-        except ValueError:
-            # TODO: handle parsing more robustly
-            return 0.0
+        score = self.llm.run(self.ascore(item))
+        return 0.0 if score is None else score
+
+    async def _score_batch(self, items: List[str]) -> Dict[int, float]:
+        """
+        Score one chunk of items with a single structured prompt.
+        """
+        listing = "\n\n".join(f"[{i + 1}] {item}" for i, item in enumerate(items))
+        prompt = self.batch_prompt.format(count=len(items), items=listing)
+        response = await self.llm.agenerate(prompt, temperature=0.0, call_site="evaluator.score_batch")
+        return _parse_batch_scores(response, len(items))
+
+    async def ascore_many(self, items: List[str], batch_size: Optional[int] = None) -> List[Optional[float]]:
+        """
+        Score many items with batched prompts of up to batch_size items, issued concurrently.
+        Items the batch parser misses are re-scored individually, also concurrently.
+        :return: scores aligned with items; None where no score could be parsed.
+        """
+        size = max(1, batch_size or self.batch_size)
+        chunks = [items[i:i + size] for i in range(0, len(items), size)]
+        results = await asyncio.gather(*(self._score_batch(c) for c in chunks), return_exceptions=True)
+
+        scores: List[Optional[float]] = [None] * len(items)
+        for chunk_no, result in enumerate(results):
+            if isinstance(result, BaseException):
+                continue
+            for index, value in result.items():
+                scores[chunk_no * size + index] = value
+
+        missing = [i for i, s in enumerate(scores) if s is None]
+        if missing:
+            retried = await asyncio.gather(*(self.ascore(items[i]) for i in missing), return_exceptions=True)
+            for i, value in zip(missing, retried):
+                if not isinstance(value, BaseException):
+                    scores[i] = value
+        return scores
+
+    async def acompare(self, a: str, b: str) -> bool:
+        """
+        Ask the LLM whether a is better than b. Outcomes are memoized by content hash,
+        so each unordered pair is judged at most once.
+        :return: True if a is preferred (ties and unparsable answers favour a).
+        """
+        ha, hb = _content_hash(a), _content_hash(b)
+        if ha == hb:
+            return True
+        key = (ha, hb) if ha < hb else (hb, ha)
+        self.comparison_stats["requested"] += 1
+        winner = self._comparisons.get(key)
+        if winner is not None:
+            self.comparison_stats["cached"] += 1
+            self._comparisons.move_to_end(key)
+            return winner == ha
+        prompt = self.compare_prompt.format(a=a, b=b)
+        response = await self.llm.agenerate(prompt, temperature=0.0, call_site="evaluator.compare")
+        a_wins = _parse_choice(response) != "B"
+        self._comparisons[key] = ha if a_wins else hb
+        if len(self._comparisons) > self.max_cached_comparisons:
+            self._comparisons.popitem(last=False)
+        return a_wins
+
+    async def _knockout(self, pool: List[int], items: List[str], lost_to: Dict[int, Set[int]]) -> int:
+        """
+        Single-elimination bracket over pool; each round's matches run concurrently.
+        Records every loss in lost_to and returns the index of the champion.
+        """
+        while len(pool) > 1:
+            pairs = [(pool[i], pool[i + 1]) for i in range(0, len(pool) - 1, 2)]
+            outcomes = await asyncio.gather(*(self.acompare(items[x], items[y]) for x, y in pairs))
+            survivors = []
+            for (x, y), x_wins in zip(pairs, outcomes):
+                winner, loser = (x, y) if x_wins else (y, x)
+                lost_to[loser].add(winner)
+                survivors.append(winner)
+            if len(pool) % 2:
+                survivors.append(pool[-1])
+            pool = survivors
+        return pool[0]
+
+    async def atournament(self, items: List[str], top_k: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Rank items by pairwise comparisons, stopping once the top_k places are settled.
+        The first knockout finds the winner in n-1 comparisons; each subsequent place is decided
+        by a playoff among items that have only lost to already-placed items (about log n of them),
+        giving O(n + k log n) comparisons for top-k and O(n log n) for a full ranking.
+        :param top_k: number of leading places to settle (None ranks everything).
+        :return: list of dicts with keys 'item', 'rank' and 'score' (share of comparisons won).
+        """
+        n = len(items)
+        k = n if top_k is None else max(0, min(top_k, n))
+        lost_to: Dict[int, Set[int]] = {i: set() for i in range(n)}
+        placed: List[int] = []
+        placed_set: Set[int] = set()
+        candidates = list(range(n))
+        while len(placed) < k and candidates:
+            winner = await self._knockout(candidates, items, lost_to)
+            placed.append(winner)
+            placed_set.add(winner)
+            remaining = [i for i in range(n) if i not in placed_set]
+            candidates = [i for i in remaining if lost_to[i] <= placed_set] or remaining
+
+        wins = {i: 0 for i in range(n)}
+        played = {i: len(lost_to[i]) for i in range(n)}
+        for loser, winners in lost_to.items():
+            for w in winners:
+                wins[w] += 1
+                played[w] += 1
+        return [
+            {"item": items[i], "rank": r + 1, "score": wins[i] / played[i] if played[i] else 1.0}
+            for r, i in enumerate(placed)
+        ]
+
+    async def arank(self,
+                    items: List[str],
+                    strategy: str = "pointwise",
+                    batch_size: Optional[int] = None,
+                    top_k: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Asynchronous counterpart of rank().
+        """
+        if strategy == "tournament":
+            return await self.atournament(items, top_k=top_k)
+        if strategy == "batch":
+            scores = await self.ascore_many(items, batch_size)
+        elif strategy == "pointwise":
+            scores = await asyncio.gather(*(self.ascore(itm) for itm in items))
+        else:
+            raise ValueError(f"Unknown ranking strategy '{strategy}'.")
+        scored = [{"item": itm, "score": 0.0 if s is None else s} for itm, s in zip(items, scores)]
+        ranked = sorted(scored, key=lambda x: x["score"], reverse=True)
+        return ranked if top_k is None else ranked[:top_k]
 
-    def rank(self, items: List[str]) -> List[Dict[str, Any]]:
+    def rank(self,
+             items: List[str],
+             strategy: str = "pointwise",
+             batch_size: Optional[int] = None,
+             top_k: Optional[int] = None) -> List[Dict[str, Any]]:
         """
         Evaluate and rank multiple items.
+        :param strategy: "pointwise" (one concurrent call per item), "batch" (K items per call),
+                         or "tournament" (memoized pairwise comparisons, see atournament()).
+        :param batch_size: items per prompt for the batch strategy.
+        :param top_k: only return the best top_k items; the tournament stops early once they are settled.
         Returns list of dicts with keys 'item' and 'score', sorted descending.
         """
-        scored = [{"item": itm, "score": self.score(itm)} for itm in items]
-        return sorted(scored, key=lambda x: x["score"], reverse=True)
+        return self.llm.run(self.arank(items, strategy=strategy, batch_size=batch_size, top_k=top_k))
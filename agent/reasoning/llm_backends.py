@@ -0,0 +1,381 @@
+"""
+llm_backends.py
+
+Pluggable transport backends for LLMInterface.
+OpenAIBackend talks to the provider; RecordingBackend wraps another backend and writes a JSONL
+cassette of prompt -> response with observed latency; ReplayBackend serves a cassette offline with
+optional simulated latency; StubBackend returns fast deterministic responses for tests and benchmarks.
+"""
+
+import os
+import json
+import time
+import asyncio
+import hashlib
+import threading
+import aiohttp
+import openai
+from abc import ABC, abstractmethod
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+from .llm_cache import LLMCache
+
+Completion = Tuple[str, Optional[Dict[str, int]]]
+
+def request_key(messages: List[Dict[str, str]], params: Dict[str, Any]) -> str:
+    """
+    Stable key identifying a request by the parameters that determine its output.
+    """
+    return LLMCache.make_key(params.get("model"), messages, params.get("temperature"),
+                             params.get("stop"), params.get("max_tokens"))
+
+
+class LLMBackend(ABC):
+    """
+    Transport used by LLMInterface. All methods run on LLMInterface's I/O event loop.
+    """
+
+    name = "backend"
+
+    @abstractmethod
+    async def complete(self,
+                       messages: List[Dict[str, str]],
+                       params: Dict[str, Any],
+                       call_site: Optional[str] = None) -> Completion:
+        """
+        Return (text, usage dict or None) for a chat completion request.
+        """
+
+    @abstractmethod
+    def stream(self,
+               messages: List[Dict[str, str]],
+               params: Dict[str, Any],
+               call_site: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        Return an async iterator over content chunks. Closing it cancels the request.
+        """
+
+    async def embed(self, texts: List[str], model: str) -> List[List[float]]:
+        """
+        Return embedding vectors for texts.
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support embeddings.")
+
+    async def close(self) -> None:
+        """
+        Release any resources (connections, files).
+        """
+
+
+class OpenAIBackend(LLMBackend):
+    """
+    OpenAI chat completion backend sharing one pooled aiohttp session.
+    """
+
+    name = "openai"
+
+    def __init__(self,
+                 api_key: Optional[str] = None,
+                 api_base: Optional[str] = None,
+                 model: Optional[str] = None,
+                 pool_size: int = 16):
+        """
+        :param api_key: OpenAI API key. Falls back to OPENAI_API_KEY env var.
+        :param api_base: Optional endpoint override (e.g. a proxy or compatible server).
+        :param model: Optional model override applied to every request.
+        :param pool_size: Maximum number of pooled HTTP connections.
+        """
+        self.api_key = api_key or os.getenv("OPENAI_API_KEY")
+        self.api_base = api_base
+        self.model = model
+        self.pool_size = pool_size
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def _prepare(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size)
+            self._session = aiohttp.ClientSession(connector=connector)
+        openai.aiosession.set(self._session)
+        request = dict(params)
+        if self.model:
+            request["model"] = self.model
+        if self.api_key:
+            request["api_key"] = self.api_key
+        if self.api_base:
+            request["api_base"] = self.api_base
+        return request
+
+    async def complete(self, messages, params, call_site=None) -> Completion:
+        request = await self._prepare(params)
+        response = await openai.ChatCompletion.acreate(messages=messages, **request)
+        usage = getattr(response, "usage", None)
+        # Extract generated content
+        try:
+            return response.choices[0].message.content.strip(), usage
+        except (IndexError, AttributeError):
+            return "", usage
+
+    async def stream(self, messages, params, call_site=None) -> AsyncIterator[str]:
+        request = await self._prepare(params)
+        response = await openai.ChatCompletion.acreate(messages=messages, stream=True, **request)
+        try:
+            async for chunk in response:
+                content = chunk.choices[0].delta.get("content", "")
+                if content:
+                    yield content
+        finally:
+            aclose = getattr(response, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+    async def embed(self, texts: List[str], model: str) -> List[List[float]]:
+        request = await self._prepare({"model": model})
+        response = await openai.Embedding.acreate(input=texts, **request)
+        return [item["embedding"] for item in sorted(response["data"], key=lambda d: d["index"])]
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+class RecordingBackend(LLMBackend):
+    """
+    Wraps another backend and appends every exchange to a JSONL cassette.
+    """
+
+    name = "record"
+
+    def __init__(self, inner: LLMBackend, cassette_path: str):
+        """
+        :param inner: backend that actually serves the requests.
+        :param cassette_path: JSONL file to append recordings to.
+        """
+        self.inner = inner
+        self.cassette_path = cassette_path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(cassette_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        with self._lock:
+            with open(self.cassette_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def _record(self, kind, messages, params, call_site, response, usage, latency, **extra) -> None:
+        record = {
+            "kind": kind,
+            "key": request_key(messages, params),
+            "call_site": call_site,
+            "messages": messages,
+            "params": {k: v for k, v in params.items() if k not in ("api_key",)},
+            "response": response,
+            "usage": dict(usage) if usage else None,
+            "latency": latency,
+        }
+        record.update(extra)
+        self._write(record)
+
+    async def complete(self, messages, params, call_site=None) -> Completion:
+        started = time.monotonic()
+        text, usage = await self.inner.complete(messages, params, call_site)
+        self._record("complete", messages, params, call_site, text, usage, time.monotonic() - started)
+        return text, usage
+
+    async def stream(self, messages, params, call_site=None) -> AsyncIterator[str]:
+        started = time.monotonic()
+        first_chunk = None
+        parts: List[str] = []
+        complete = False
+        inner = self.inner.stream(messages, params, call_site)
+        try:
+            async for chunk in inner:
+                if first_chunk is None:
+                    first_chunk = time.monotonic() - started
+                parts.append(chunk)
+                yield chunk
+            complete = True
+        finally:
+            await inner.aclose()
+            self._record("stream", messages, params, call_site, "".join(parts), None,
+                         time.monotonic() - started, first_chunk_latency=first_chunk, complete=complete)
+
+    async def embed(self, texts: List[str], model: str) -> List[List[float]]:
+        started = time.monotonic()
+        vectors = await self.inner.embed(texts, model)
+        messages = [{"role": "embed", "content": t} for t in texts]
+        self._record("embed", messages, {"model": model}, None, vectors, None, time.monotonic() - started)
+        return vectors
+
+    async def close(self) -> None:
+        await self.inner.close()
+
+
+class CassetteMiss(KeyError):
+    """
+    Raised by ReplayBackend when a request has no recording.
+    """
+
+
+class ReplayBackend(LLMBackend):
+    """
+    Serves responses from a cassette written by RecordingBackend.
+    Repeated recordings of the same request are replayed in order, cycling once exhausted.
+    """
+
+    name = "replay"
+
+    def __init__(self,
+                 cassette_path: str,
+                 simulate_latency: bool = False,
+                 latency_scale: float = 1.0,
+                 fallback: Optional[LLMBackend] = None,
+                 chunk_size: int = 16):
+        """
+        :param cassette_path: JSONL cassette to load.
+        :param simulate_latency: sleep for the recorded latency before answering.
+        :param latency_scale: multiplier applied to recorded latencies.
+        :param fallback: backend used for requests missing from the cassette (None raises CassetteMiss).
+        :param chunk_size: characters per chunk when replaying streams.
+        """
+        self.cassette_path = cassette_path
+        self.simulate_latency = simulate_latency
+        self.latency_scale = latency_scale
+        self.fallback = fallback
+        self.chunk_size = chunk_size
+        self.misses = 0
+        self._recordings: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        self._cursor: Dict[Tuple[str, str], int] = {}
+        with open(cassette_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    kind = "embed" if record["kind"] == "embed" else "text"
+                    self._recordings.setdefault((kind, record["key"]), []).append(record)
+
+    def _next(self, kind: str, key: str) -> Optional[Dict[str, Any]]:
+        records = self._recordings.get((kind, key))
+        if not records:
+            self.misses += 1
+            return None
+        index = self._cursor.get((kind, key), 0)
+        self._cursor[(kind, key)] = index + 1
+        return records[index % len(records)]
+
+    async def _delay(self, seconds: Optional[float]) -> None:
+        if self.simulate_latency and seconds:
+            await asyncio.sleep(seconds * self.latency_scale)
+
+    async def complete(self, messages, params, call_site=None) -> Completion:
+        record = self._next("text", request_key(messages, params))
+        if record is None:
+            if self.fallback is None:
+                raise CassetteMiss(f"No recording for request from call site '{call_site}'.")
+            return await self.fallback.complete(messages, params, call_site)
+        await self._delay(record.get("latency"))
+        return record["response"], record.get("usage")
+
+    async def stream(self, messages, params, call_site=None) -> AsyncIterator[str]:
+        record = self._next("text", request_key(messages, params))
+        if record is None:
+            if self.fallback is None:
+                raise CassetteMiss(f"No recording for request from call site '{call_site}'.")
+            async for chunk in self.fallback.stream(messages, params, call_site):
+                yield chunk
+            return
+        text = record["response"]
+        chunks = [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)] or [""]
+        first = record.get("first_chunk_latency")
+        await self._delay(first if first is not None else record.get("latency"))
+        per_chunk = None
+        if first is not None and record.get("latency"):
+            per_chunk = max(0.0, record["latency"] - first) / len(chunks)
+        for chunk in chunks:
+            if chunk:
+                yield chunk
+            await self._delay(per_chunk)
+
+    async def embed(self, texts: List[str], model: str) -> List[List[float]]:
+        messages = [{"role": "embed", "content": t} for t in texts]
+        record = self._next("embed", request_key(messages, {"model": model}))
+        if record is None:
+            if self.fallback is None:
+                raise CassetteMiss("No recording for embedding request.")
+            return await self.fallback.embed(texts, model)
+        await self._delay(record.get("latency"))
+        return record["response"]
+
+    async def close(self) -> None:
+        if self.fallback is not None:
+            await self.fallback.close()
+
+
+class StubBackend(LLMBackend):
+    """
+    Fast deterministic backend: the response is a pure function of the request.
+    """
+
+    name = "stub"
+
+    def __init__(self,
+                 responder: Optional[Callable[[List[Dict[str, str]], Dict[str, Any]], str]] = None,
+                 latency: float = 0.0,
+                 embedding_dim: int = 64,
+                 chunk_size: int = 16):
+        """
+        :param responder: optional fn(messages, params) -> text; defaults to a hash-derived reply.
+        :param latency: fixed delay in seconds per request.
+        :param embedding_dim: dimension of the deterministic embeddings.
+        :param chunk_size: characters per chunk when streaming.
+        """
+        self.responder = responder
+        self.latency = latency
+        self.embedding_dim = embedding_dim
+        self.chunk_size = chunk_size
+        self.calls = 0
+
+    def _respond(self, messages, params) -> str:
+        self.calls += 1
+        if self.responder is not None:
+            return self.responder(messages, params)
+        return f"stub-{request_key(messages, params)[:12]}"
+
+    async def complete(self, messages, params, call_site=None) -> Completion:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        text = self._respond(messages, params)
+        return text, None
+
+    async def stream(self, messages, params, call_site=None) -> AsyncIterator[str]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        text = self._respond(messages, params)
+        for i in range(0, len(text), self.chunk_size):
+            yield text[i:i + self.chunk_size]
+
+    async def embed(self, texts: List[str], model: str) -> List[List[float]]:
+        vectors = []
+        for text in texts:
+            digest = hashlib.sha256(text.encode("utf-8")).digest()
+            while len(digest) < self.embedding_dim:
+                digest += hashlib.sha256(digest).digest()
+            vectors.append([b / 127.5 - 1.0 for b in digest[:self.embedding_dim]])
+        return vectors
+
+
+def create_backend(kind: str,
+                   api_key: Optional[str] = None,
+                   cassette_path: Optional[str] = None,
+                   simulate_latency: bool = False) -> LLMBackend:
+    """
+    Build a backend by name: "openai", "record", "replay" or "stub".
+    """
+    if kind == "openai":
+        return OpenAIBackend(api_key=api_key)
+    if kind == "record":
+        return RecordingBackend(OpenAIBackend(api_key=api_key), cassette_path)
+    if kind == "replay":
+        return ReplayBackend(cassette_path, simulate_latency=simulate_latency)
+    if kind == "stub":
+        return StubBackend()
+    raise ValueError(f"Unknown LLM backend '{kind}'.")
@@ -0,0 +1,226 @@
+"""
+llm_cache.py
+
+Persistent prompt/response cache for LLMInterface.
+Entries are stored in SQLite via infra.db, keyed on a hash of the request parameters,
+and evicted by TTL (lazily on read) and by least-recent use once the cache exceeds its size bound.
+
+The cache should get a Database of its own: it commits on its connection, which would also
+commit other components' open transactions. The async aget/aput run the SQLite work on a
+single worker thread, so the event loop never waits on disk I/O. Hits do not write: access
+times are kept in memory and written in batches (before every eviction, so LRU order holds).
+"""
+
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+class LLMCache:
+    """
+    Size-bounded LRU + TTL cache of LLM completions backed by a SQLite table.
+    """
+
+    def __init__(self,
+                 db: Any,
+                 max_entries: int = 10000,
+                 ttl: Optional[float] = 7 * 24 * 3600,
+                 table: str = "llm_cache",
+                 touch_batch: int = 256):
+        """
+        :param db: infra.db.Database instance used for storage (not shared with other components).
+        :param max_entries: maximum number of cached responses before LRU eviction.
+        :param ttl: default time-to-live in seconds (None keeps entries until evicted).
+        :param table: name of the SQLite table.
+        :param touch_batch: hits whose access times are buffered before they are written.
+        """
+        self.db = db
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.table = table
+        self.touch_batch = max(1, touch_batch)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._lock = threading.Lock()
+        self._touched: Dict[str, float] = {}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="llm-cache")
+        self._init_schema()
+        cursor = self.db.execute(f"SELECT COUNT(*) FROM {self.table}")
+        self._size = self.db.fetchone(cursor)[0]
+
+    def _init_schema(self) -> None:
+        self.db.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} ("
+            "key TEXT PRIMARY KEY, "
+            "model TEXT, "
+            "response TEXT NOT NULL, "
+            "created_at REAL NOT NULL, "
+            "last_access REAL NOT NULL, "
+            "expires_at REAL)"
+        )
+        self.db.execute(
+            f"CREATE INDEX IF NOT EXISTS {self.table}_last_access ON {self.table} (last_access)"
+        )
+        self.db.commit()
+
+    @staticmethod
+    def make_key(model: str,
+                 messages: List[Dict[str, str]],
+                 temperature: Optional[float],
+                 stop: Optional[list],
+                 max_tokens: Optional[int]) -> str:
+        """
+        Build a stable cache key from the request parameters that affect the output.
+        """
+        payload = json.dumps(
+            [model, messages, temperature, stop, max_tokens],
+            sort_keys=True, ensure_ascii=False, separators=(",", ":")
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Return the cached response for key, or None on miss or expiry.
+        """
+        now = time.time()
+        with self._lock:
+            row = self.db.fetchone(self.db.execute(
+                f"SELECT response, expires_at FROM {self.table} WHERE key = ?", (key,)
+            ))
+            if row is None:
+                self.misses += 1
+                return None
+            if row["expires_at"] is not None and row["expires_at"] <= now:
+                self.db.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                self.db.commit()
+                self._size -= 1
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._touched[key] = now
+            if len(self._touched) >= self.touch_batch:
+                self._write_touches()
+                self.db.commit()
+            self.hits += 1
+            return row["response"]
+
+    def put(self, key: str, response: str, model: Optional[str] = None, ttl: Optional[float] = None) -> None:
+        """
+        Store a response, evicting least-recently-used entries if over capacity.
+        :param ttl: optional per-entry TTL overriding the default.
+        """
+        now = time.time()
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = now + ttl if ttl is not None else None
+        with self._lock:
+            exists = self.db.fetchone(self.db.execute(
+                f"SELECT 1 FROM {self.table} WHERE key = ?", (key,)
+            )) is not None
+            self.db.execute(
+                f"INSERT OR REPLACE INTO {self.table} "
+                "(key, model, response, created_at, last_access, expires_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, response, now, now, expires_at)
+            )
+            self._touched.pop(key, None)
+            if not exists:
+                self._size += 1
+            overflow = self._size - self.max_entries
+            if overflow > 0:
+                self._evict(overflow)
+            self.db.commit()
+
+    async def aget(self, key: str) -> Optional[str]:
+        """
+        get() on the cache's worker thread.
+        """
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self.get, key)
+
+    async def aput(self, key: str, response: str, model: Optional[str] = None, ttl: Optional[float] = None) -> None:
+        """
+        put() on the cache's worker thread.
+        """
+        await asyncio.get_running_loop().run_in_executor(self._executor, self.put, key, response, model, ttl)
+
+    def _write_touches(self) -> None:
+        """
+        Write buffered access times (without committing). Caller holds the lock.
+        """
+        if self._touched:
+            self.db.executemany(
+                f"UPDATE {self.table} SET last_access = ? WHERE key = ?",
+                [(at, key) for key, at in self._touched.items()]
+            )
+            self._touched = {}
+
+    def flush(self) -> None:
+        """
+        Write buffered access times.
+        """
+        with self._lock:
+            if self._touched:
+                self._write_touches()
+                self.db.commit()
+
+    def close(self) -> None:
+        """
+        Flush buffered access times and stop the worker thread.
+        """
+        self._executor.shutdown(wait=True)
+        self.flush()
+
+    def _evict(self, count: int) -> None:
+        """
+        Remove the count least-recently-used entries. Caller holds the lock.
+        """
+        self._write_touches()
+        cursor = self.db.execute(
+            f"DELETE FROM {self.table} WHERE key IN "
+            f"(SELECT key FROM {self.table} ORDER BY last_access ASC LIMIT ?)", (count,)
+        )
+        removed = cursor.rowcount
+        self._size -= removed
+        self.evictions += removed
+
+    def purge_expired(self) -> int:
+        """
+        Eagerly delete all expired entries. Returns the number removed.
+        """
+        with self._lock:
+            cursor = self.db.execute(
+                f"DELETE FROM {self.table} WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),)
+            )
+            self.db.commit()
+            removed = cursor.rowcount
+            self._size -= removed
+            self.expirations += removed
+            return removed
+
+    def clear(self) -> None:
+        """
+        Remove all cached entries and reset counters.
+        """
+        with self._lock:
+            self.db.execute(f"DELETE FROM {self.table}")
+            self.db.commit()
+            self._touched = {}
+            self._size = 0
+            self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return hit/miss/eviction counters and current size.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "size": self._size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
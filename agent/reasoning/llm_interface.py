@@ -2,11 +2,63 @@
 llm_interface.py
 
 Abstracts interaction with an LLM provider. Handles prompt construction, API calls, and response parsing.
+All network I/O runs on a dedicated event loop thread through a pluggable backend (see llm_backends),
+so synchronous and asynchronous callers share one connection pool and one in-flight limit.
+Concurrent identical deterministic requests are coalesced into a single provider call (see single_flight).
 """
 
 import os
-import openai
-from typing import Optional, Dict, Any
+import json
+import queue
+import asyncio
+import threading
+import concurrent.futures
+from typing import Optional, Dict, Any, List, Callable, AsyncIterator, Iterator, Awaitable
+from .llm_cache import LLMCache
+from .llm_backends import LLMBackend, OpenAIBackend, request_key
+from .single_flight import SingleFlight
+from .semantic_cache import SemanticCache
+from .token_budget import TokenCounter, TokenUsage, PromptSection, PromptInput, fit_sections
+
+SUMMARIZE_PROMPT = (
+    "Summarize the following text in at most {tokens} tokens. "
+    "Keep concrete facts, decisions and lessons; drop repetition.\n\n{text}"
+)
+
+class _LoopThread:
+    """
+    Daemon thread running the event loop that performs all LLM network I/O.
+    """
+
+    def __init__(self, name: str = "llm-io"):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def is_current(self) -> bool:
+        """
+        True when called from the loop thread itself.
+        """
+        return threading.current_thread() is self._thread
+
+    def submit(self, coro: Awaitable[Any]) -> concurrent.futures.Future:
+        """
+        Schedule a coroutine on the loop and return a thread-safe future.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def stop(self) -> None:
+        """
+        Stop the loop and wait for the thread to exit.
+        """
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
 
 class LLMInterface:
     """
@@ -17,60 +69,536 @@ class LLMInterface:
                  api_key: Optional[str] = None,
                  model: str = "gpt-4",
                  temperature: float = 0.7,
-                 max_tokens: int = 512):
+                 max_tokens: int = 512,
+                 max_in_flight: int = 8,
+                 timeout: Optional[float] = 60.0,
+                 pool_size: int = 16,
+                 cache: Optional[LLMCache] = None,
+                 semantic_cache: Optional[SemanticCache] = None,
+                 embedding_model: str = "text-embedding-ada-002",
+                 context_window: int = 8192,
+                 max_prompt_tokens: Optional[int] = None,
+                 backend: Optional[LLMBackend] = None,
+                 coalesce: bool = True):
         """
         :param api_key: OpenAI API key. Falls back to OPENAI_API_KEY env var.
         :param model: Model identifier.
         :param temperature: Sampling temperature.
         :param max_tokens: Maximum tokens for completion.
+        :param max_in_flight: Maximum number of concurrent requests to the provider.
+        :param timeout: Default per-call timeout in seconds (None disables it).
+        :param pool_size: Maximum number of pooled HTTP connections for the default backend.
+        :param cache: Optional persistent response cache consulted before each call.
+        :param semantic_cache: Optional near-duplicate prompt cache for opted-in call sites.
+        :param embedding_model: Model identifier used by embed().
+        :param context_window: Model context size in tokens.
+        :param max_prompt_tokens: Prompt budget; defaults to context_window - max_tokens.
+        :param backend: Transport backend; defaults to OpenAIBackend.
+        :param coalesce: Share one provider call between concurrent identical requests.
         """
         self.api_key = api_key or os.getenv("OPENAI_API_KEY")
-        openai.api_key = self.api_key
+        self.backend = backend or OpenAIBackend(api_key=self.api_key, pool_size=pool_size)
         self.model = model
         self.temperature = temperature
         self.max_tokens = max_tokens
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.cache = cache
+        self.semantic_cache = semantic_cache
+        self.embedding_model = embedding_model
+        self.context_window = context_window
+        self.max_prompt_tokens = max_prompt_tokens
+        self.token_counter = TokenCounter(model)
+        self.usage = TokenUsage()
+        self.coalesce = coalesce
+        self._flights = SingleFlight()
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._io: Optional[_LoopThread] = None
+        self._io_lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Event loop and connection pool management
+    # ------------------------------------------------------------------
+
+    def _loop_thread(self) -> _LoopThread:
+        """
+        Lazily start the I/O loop thread.
+        """
+        with self._io_lock:
+            if self._io is None:
+                self._io = _LoopThread()
+            return self._io
+
+    def run(self, coro: Awaitable[Any]) -> Any:
+        """
+        Run a coroutine on the I/O loop and block until it completes.
+        Used by the synchronous wrappers; must not be called from the I/O loop itself.
+        """
+        io = self._loop_thread()
+        if io.is_current():
+            raise RuntimeError("LLMInterface.run() cannot be called from the LLM I/O loop.")
+        return io.submit(coro).result()
+
+    async def _dispatch(self, coro: Awaitable[Any]) -> Any:
+        """
+        Await a coroutine on the I/O loop from any event loop.
+        Cancelling the caller cancels the underlying request.
+        """
+        io = self._loop_thread()
+        if io.is_current():
+            return await coro
+        return await asyncio.wrap_future(io.submit(coro))
+
+    def close(self) -> None:
+        """
+        Close the backend and stop the I/O loop.
+        """
+        with self._io_lock:
+            io, self._io = self._io, None
+        if io is None:
+            return
+        io.submit(self.backend.close()).result()
+        io.stop()
+
+    # ------------------------------------------------------------------
+    # Request construction
+    # ------------------------------------------------------------------
+
+    def _messages(self, prompt: str) -> List[Dict[str, str]]:
+        return [{"role": "user", "content": prompt}]
+
+    def count_tokens(self, text: str) -> int:
+        """
+        Count tokens in text with the interface's tokenizer.
+        """
+        return self.token_counter.count(text)
+
+    def prompt_budget(self, max_tokens: Optional[int] = None) -> int:
+        """
+        Maximum prompt size in tokens for a call producing up to max_tokens.
+        """
+        if self.max_prompt_tokens is not None:
+            return self.max_prompt_tokens
+        return self.context_window - (max_tokens or self.max_tokens)
+
+    async def _summarize(self, text: str, target_tokens: int) -> str:
+        """
+        Summarize an oversize prompt section down to roughly target_tokens (runs on the I/O loop).
+        """
+        overhead = self.count_tokens(SUMMARIZE_PROMPT) + 16
+        source = self.token_counter.truncate(text, self.prompt_budget(target_tokens) - overhead, "middle")
+        prompt = SUMMARIZE_PROMPT.format(tokens=target_tokens, text=source)
+        params = self._params(None, {"temperature": 0.0, "max_tokens": target_tokens})
+        return await self._generate(prompt, params, self.timeout, None, "llm.summarize")
+
+    async def _fit_prompt(self, prompt: PromptInput, params: Dict[str, Any]) -> tuple:
+        """
+        Enforce the prompt budget, trimming or summarizing sections by priority.
+        A plain string is treated as one section that keeps its head and tail.
+        :return: (prompt text, tokens removed).
+        """
+        sections = [PromptSection(prompt, keep="middle")] if isinstance(prompt, str) else prompt
+        return await fit_sections(sections, self.prompt_budget(params.get("max_tokens")),
+                                  self.token_counter, summarizer=self._summarize)
+
+    def _params(self, stop: Optional[list], kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Merge default sampling parameters with per-call overrides.
+        """
+        params = {
+            "model": self.model,
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+            "stop": stop,
+        }
+        params.update(kwargs)
+        return params
+
+    def _timeout(self, timeout: Optional[float]) -> Optional[float]:
+        return self.timeout if timeout is None else timeout
+
+    def _cacheable(self, params: Dict[str, Any], cache: Optional[bool]) -> bool:
+        """
+        Decide whether a request may use the response cache.
+        By default only deterministic (temperature 0) requests are cached; pass
+        cache=True to opt a sampled call in, or cache=False to bypass.
+        """
+        if self.cache is None or cache is False:
+            return False
+        if cache is True:
+            return True
+        return not params.get("temperature")
+
+    def _coalescable(self, params: Dict[str, Any], cache: Optional[bool]) -> bool:
+        """
+        Decide whether a request may share an in-flight call with identical concurrent requests.
+        Follows the cache policy but does not require a cache: sampled calls stay independent
+        unless the caller opted into caching, since they are expected to differ.
+        """
+        if not self.coalesce or cache is False:
+            return False
+        return cache is True or not params.get("temperature")
+
+    @staticmethod
+    def _flight_key(messages: List[Dict[str, str]], params: Dict[str, Any]) -> str:
+        extra = {k: v for k, v in params.items() if k not in ("model", "temperature", "stop", "max_tokens")}
+        key = request_key(messages, params)
+        if extra:
+            key += json.dumps(extra, sort_keys=True, default=str)
+        return key
+
+    def coalescing_stats(self) -> Dict[str, Any]:
+        """
+        Return single-flight counters: calls seen, calls collapsed onto an identical in-flight call.
+        """
+        return self._flights.stats()
+
+    # ------------------------------------------------------------------
+    # Provider calls (run on the I/O loop)
+    # ------------------------------------------------------------------
+
+    async def _complete(self,
+                        messages: List[Dict[str, str]],
+                        params: Dict[str, Any],
+                        timeout: Optional[float],
+                        call_site: Optional[str] = None) -> tuple:
+        """
+        Perform a single non-streaming completion under the in-flight limit.
+        :return: (text, provider usage dict or None).
+        """
+        async with self._semaphore:
+            return await asyncio.wait_for(self.backend.complete(messages, params, call_site), timeout)
+
+    async def _cache_lookup(self,
+                            messages: List[Dict[str, str]],
+                            params: Dict[str, Any],
+                            cache: Optional[bool],
+                            call_site: Optional[str]) -> tuple:
+        """
+        Consult the exact and semantic caches.
+        :return: (cached response or None, exact-cache key, semantic-cache probe) for _cache_store().
+        """
+        key = None
+        if self._cacheable(params, cache):
+            key = LLMCache.make_key(params.get("model"), messages, params.get("temperature"),
+                                    params.get("stop"), params.get("max_tokens"))
+            cached = await self.cache.aget(key)
+            if cached is not None:
+                return cached, key, None
+
+        vector = None
+        if self.semantic_cache is not None and cache is not False and self.semantic_cache.enabled(call_site):
+            prompt = "\n".join(m["content"] for m in messages)
+            loop = asyncio.get_running_loop()
+            similar, vector = await loop.run_in_executor(
+                None, self.semantic_cache.lookup, call_site, params.get("model"), prompt
+            )
+            if similar is not None:
+                return similar, key, vector
+        return None, key, vector
+
+    async def _cache_store(self,
+                           response: str,
+                           key: Optional[str],
+                           vector: Any,
+                           params: Dict[str, Any],
+                           call_site: Optional[str]) -> None:
+        if not response:
+            return
+        if key is not None:
+            await self.cache.aput(key, response, model=params.get("model"))
+        if vector is not None:
+            self.semantic_cache.store(call_site, params.get("model"), response, vector)
+
+    async def _generate(self,
+                        prompt: PromptInput,
+                        params: Dict[str, Any],
+                        timeout: Optional[float],
+                        cache: Optional[bool],
+                        call_site: Optional[str]) -> str:
+        """
+        Fit the prompt to budget, then serve it from the exact or semantic cache when allowed,
+        otherwise call the provider, joining an identical call already in flight when allowed.
+        Token usage is recorded against call_site.
+        """
+        text, trimmed = await self._fit_prompt(prompt, params)
+        messages = self._messages(text)
+        cached, key, vector = await self._cache_lookup(messages, params, cache, call_site)
+        if cached is not None:
+            self.usage.record(call_site, trimmed_tokens=trimmed, cache_hit=True)
+            return cached
+        call = lambda: self._call_provider(messages, params, timeout, call_site, trimmed, key, vector)
+        if not self._coalescable(params, cache):
+            return await call()
+        response, leader = await self._flights.do(self._flight_key(messages, params), call)
+        if not leader:
+            self.usage.record(call_site, trimmed_tokens=trimmed, coalesced=True)
+        return response
+
+    async def _call_provider(self,
+                             messages: List[Dict[str, str]],
+                             params: Dict[str, Any],
+                             timeout: Optional[float],
+                             call_site: Optional[str],
+                             trimmed: int,
+                             key: Optional[str],
+                             vector: Any) -> str:
+        """
+        Call the provider, record token usage and write the response back to the caches.
+        """
+        response, usage = await self._complete(messages, params, timeout, call_site)
+        if usage:
+            prompt_tokens, completion_tokens = usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+        else:
+            prompt_tokens = self.token_counter.count_messages(messages)
+            completion_tokens = self.count_tokens(response)
+        self.usage.record(call_site, prompt_tokens, completion_tokens, trimmed)
+        await self._cache_store(response, key, vector, params, call_site)
+        return response
+
+    async def _stream_chunks(self,
+                             prompt: PromptInput,
+                             params: Dict[str, Any],
+                             timeout: Optional[float],
+                             emit: Callable[[tuple], None],
+                             cache: Optional[bool] = None,
+                             call_site: Optional[str] = None,
+                             until: Optional[Callable[[str], bool]] = None) -> None:
+        """
+        Perform a streaming completion, forwarding ("chunk", text), ("error", exc)
+        and finally ("done", None) events through emit.
+        A cache hit is delivered as a single chunk. If `until` returns True for the text
+        accumulated so far, generation is cancelled and that text is treated as the full response
+        of this call; being truncated, it is not cached (neither is a stream the consumer closed).
+        """
+        parts: List[str] = []
+        stopped = False
+
+        async def pump() -> None:
+            nonlocal stopped
+            chunks = self.backend.stream(messages, params, call_site)
+            try:
+                async for content in chunks:
+                    parts.append(content)
+                    emit(("chunk", content))
+                    if until is not None and until("".join(parts)):
+                        stopped = True
+                        break
+            finally:
+                await chunks.aclose()
+
+        try:
+            text, trimmed = await self._fit_prompt(prompt, params)
+            messages = self._messages(text)
+            cached, key, vector = await self._cache_lookup(messages, params, cache, call_site)
+            if cached is not None:
+                self.usage.record(call_site, trimmed_tokens=trimmed, cache_hit=True)
+                emit(("chunk", cached))
+            else:
+                try:
+                    async with self._semaphore:
+                        await asyncio.wait_for(pump(), timeout)
+                finally:
+                    self.usage.record(call_site, self.token_counter.count_messages(messages),
+                                      self.count_tokens("".join(parts)), trimmed)
+                if not stopped:
+                    await self._cache_store("".join(parts).strip(), key, vector, params, call_site)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            emit(("error", exc))
+            return
+        emit(("done", None))
+
+    async def _embed(self, texts: List[str], timeout: Optional[float]) -> List[List[float]]:
+        """
+        Request embeddings for a batch of texts under the in-flight limit.
+        """
+        async with self._semaphore:
+            return await asyncio.wait_for(self.backend.embed(texts, self.embedding_model), timeout)
+
+    # ------------------------------------------------------------------
+    # Async API
+    # ------------------------------------------------------------------
+
+    async def agenerate(self,
+                        prompt: PromptInput,
+                        stop: Optional[list] = None,
+                        timeout: Optional[float] = None,
+                        cache: Optional[bool] = None,
+                        call_site: Optional[str] = None,
+                        **kwargs) -> str:
+        """
+        Asynchronously send a completion request to the LLM.
+        :param prompt: The text prompt, or prioritized PromptSections trimmed to the prompt budget.
+        :param stop: Optional list of stop sequences.
+        :param timeout: Per-call timeout in seconds; defaults to the instance timeout.
+        :param cache: None caches deterministic calls only; True forces, False bypasses the cache.
+        :param call_site: Label of the calling component, used for per-site caching and metrics.
+        :return: Generated text response.
+        """
+        return await self._dispatch(
+            self._generate(prompt, self._params(stop, kwargs),
+                           self._timeout(timeout), cache, call_site)
+        )
+
+    async def agenerate_many(self,
+                             prompts: List[PromptInput],
+                             stop: Optional[list] = None,
+                             timeout: Optional[float] = None,
+                             return_exceptions: bool = False,
+                             cache: Optional[bool] = None,
+                             call_site: Optional[str] = None,
+                             **kwargs) -> List[Any]:
+        """
+        Generate completions for several prompts concurrently.
+        Concurrency is bounded by max_in_flight; results preserve prompt order.
+        :param prompts: Prompts to send.
+        :param return_exceptions: If True, failed calls yield their exception instead of raising.
+        :return: List of responses (or exceptions) in the same order as prompts.
+        """
+        return await asyncio.gather(
+            *(self.agenerate(p, stop=stop, timeout=timeout, cache=cache, call_site=call_site, **kwargs)
+              for p in prompts),
+            return_exceptions=return_exceptions
+        )
+
+    async def astream(self,
+                      prompt: PromptInput,
+                      stop: Optional[list] = None,
+                      timeout: Optional[float] = None,
+                      cache: Optional[bool] = None,
+                      call_site: Optional[str] = None,
+                      until: Optional[Callable[[str], bool]] = None,
+                      **kwargs) -> AsyncIterator[str]:
+        """
+        Asynchronously stream response chunks from the LLM.
+        Closing the iterator early cancels the underlying request.
+        :param prompt: The text prompt, or prioritized PromptSections trimmed to the prompt budget.
+        :param cache: Cache policy as in agenerate(); a hit is yielded as one chunk.
+        :param call_site: Label of the calling component.
+        :param until: Predicate over the accumulated text; once it returns True the
+                      generation is cancelled and the stream ends (an early stop sequence).
+        :return: Async iterator over content chunks.
+        """
+        loop = asyncio.get_running_loop()
+        events: asyncio.Queue = asyncio.Queue()
+
+        def emit(event: tuple) -> None:
+            try:
+                loop.call_soon_threadsafe(events.put_nowait, event)
+            except RuntimeError:
+                # Consumer loop already closed; nothing left to deliver to.
+                pass
+
+        future = self._loop_thread().submit(
+            self._stream_chunks(prompt, self._params(stop, kwargs),
+                                self._timeout(timeout), emit, cache, call_site, until)
+        )
+        try:
+            while True:
+                kind, value = await events.get()
+                if kind == "chunk":
+                    yield value
+                elif kind == "error":
+                    raise value
+                else:
+                    break
+        finally:
+            future.cancel()
+
+    # ------------------------------------------------------------------
+    # Sync API
+    # ------------------------------------------------------------------
 
     def generate(self,
-                 prompt: str,
+                 prompt: PromptInput,
                  stop: Optional[list] = None,
+                 timeout: Optional[float] = None,
+                 cache: Optional[bool] = None,
+                 call_site: Optional[str] = None,
                  **kwargs) -> str:
         """
         Send a completion request to the LLM with the given prompt.
-        :param prompt: The text prompt to send.
+        Blocking wrapper around agenerate().
+        :param prompt: The text prompt, or prioritized PromptSections trimmed to the prompt budget.
         :param stop: Optional list of stop sequences.
+        :param timeout: Per-call timeout in seconds; defaults to the instance timeout.
+        :param cache: None caches deterministic calls only; True forces, False bypasses the cache.
+        :param call_site: Label of the calling component, used for per-site caching and metrics.
         :return: Generated text response.
         """
-        response = openai.ChatCompletion.create(
-            model=self.model,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=self.temperature,
-            max_tokens=self.max_tokens,
-            stop=stop,
-            **kwargs
+        return self.run(self.agenerate(prompt, stop=stop, timeout=timeout, cache=cache,
+                                       call_site=call_site, **kwargs))
+
+    def generate_many(self,
+                      prompts: List[PromptInput],
+                      stop: Optional[list] = None,
+                      timeout: Optional[float] = None,
+                      cache: Optional[bool] = None,
+                      call_site: Optional[str] = None,
+                      **kwargs) -> List[str]:
+        """
+        Blocking wrapper around agenerate_many().
+        """
+        return self.run(self.agenerate_many(prompts, stop=stop, timeout=timeout, cache=cache,
+                                            call_site=call_site, **kwargs))
+
+    def embed(self, text: str, timeout: Optional[float] = None) -> List[float]:
+        """
+        Return the embedding vector for a single text.
+        """
+        return self.embed_many([text], timeout=timeout)[0]
+
+    def embed_many(self, texts: List[str], timeout: Optional[float] = None) -> List[List[float]]:
+        """
+        Return embedding vectors for several texts in one request.
+        """
+        return self.run(self._embed(list(texts), self._timeout(timeout)))
+
+    def iter_stream(self,
+                    prompt: PromptInput,
+                    stop: Optional[list] = None,
+                    timeout: Optional[float] = None,
+                    cache: Optional[bool] = None,
+                    call_site: Optional[str] = None,
+                    until: Optional[Callable[[str], bool]] = None,
+                    **kwargs) -> Iterator[str]:
+        """
+        Blocking iterator over streamed chunks. Closing it early cancels the request.
+        See astream() for the cache, call_site and until options.
+        """
+        events: "queue.Queue[tuple]" = queue.Queue()
+        future = self._loop_thread().submit(
+            self._stream_chunks(prompt, self._params(stop, kwargs),
+                                self._timeout(timeout), events.put, cache, call_site, until)
         )
-        # Extract generated content
         try:
-            return response.choices[0].message.content.strip()
-        except (IndexError, AttributeError):
-            return ""
+            while True:
+                kind, value = events.get()
+                if kind == "chunk":
+                    yield value
+                elif kind == "error":
+                    raise value
+                else:
+                    break
+        finally:
+            future.cancel()
 
     def stream(self,
-               prompt: str,
+               prompt: PromptInput,
                callback: Optional[Any] = None,
-               **kwargs) -> None:
+               **kwargs) -> str:
         """
         Stream responses from the LLM for real-time applications.
-        :param prompt: The text prompt to send.
+        :param prompt: The text prompt, or prioritized PromptSections trimmed to the prompt budget.
         :param callback: Function to call with each chunk.
+        :return: The full concatenated response.
         """
-        for chunk in openai.ChatCompletion.create(
-            model=self.model,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=self.temperature,
-            max_tokens=self.max_tokens,
-            stream=True,
-            **kwargs
-        ):
-            content = chunk.choices[0].delta.get("content", "")
+        parts = []
+        for content in self.iter_stream(prompt, **kwargs):
+            parts.append(content)
             if callback:
                 callback(content)
+        return "".join(parts)
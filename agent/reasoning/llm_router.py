@@ -0,0 +1,424 @@
+"""
+llm_router.py
+
+Latency-aware routing across several LLM backends. Each route pairs a backend with a model,
+a cost and an optional latency SLA; the router tracks rolling latency percentiles and error
+rates per route, picks a route per call by policy, and hedges slow calls by sending a duplicate
+request to the next-best route once the primary has run past its own p95. A route whose error
+rate passes the limit has its circuit breaker opened: it is only used as a last resort until a
+cooldown has passed, then a single probe call decides whether the breaker closes again.
+"""
+
+import time
+import asyncio
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Set, Tuple
+from .llm_backends import LLMBackend, OpenAIBackend, Completion
+
+POLICIES = ("cheapest_within_sla", "fastest")
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+class Route:
+    """
+    A backend plus the model, price and latency target used when routing to it.
+    """
+
+    def __init__(self,
+                 name: str,
+                 backend: LLMBackend,
+                 model: Optional[str] = None,
+                 cost: float = 0.0,
+                 sla: Optional[float] = None,
+                 window: int = 200):
+        """
+        :param name: route label used in overrides and stats.
+        :param backend: transport serving this route.
+        :param model: model override applied to requests sent through this route.
+        :param cost: relative price (e.g. USD per 1k tokens); lower is preferred.
+        :param sla: target p95 latency in seconds (None means any latency is acceptable).
+        :param window: number of recent calls kept for latency and error statistics.
+        """
+        self.name = name
+        self.backend = backend
+        self.model = model
+        self.cost = cost
+        self.sla = sla
+        self._latencies: Deque[float] = deque(maxlen=window)
+        self._outcomes: Deque[bool] = deque(maxlen=window)
+        self._first_chunk: Deque[float] = deque(maxlen=window)
+        self.calls = 0
+        self.errors = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.breaker_opened: Optional[float] = None  # monotonic time the breaker (re)opened
+
+    def params(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Apply this route's model override to request parameters.
+        """
+        if self.model is None:
+            return params
+        routed = dict(params)
+        routed["model"] = self.model
+        return routed
+
+    def record(self, latency: Optional[float], ok: bool, first_chunk: Optional[float] = None) -> None:
+        """
+        Record one finished call. Cancelled calls are not recorded.
+        A success closes an open breaker (forgetting the failures); a failure restarts its cooldown.
+        :param latency: time to the complete response.
+        :param first_chunk: time to first streamed chunk, for streaming calls.
+        """
+        self.calls += 1
+        if not ok:
+            self.errors += 1
+            self._outcomes.append(False)
+            if self.breaker_opened is not None:
+                self.breaker_opened = time.monotonic()
+            return
+        if self.breaker_opened is not None:
+            self.breaker_opened = None
+            self._outcomes.clear()
+        self._outcomes.append(True)
+        if first_chunk is not None:
+            self._first_chunk.append(first_chunk)
+        self._latencies.append(latency)
+
+    @property
+    def samples(self) -> int:
+        return len(self._latencies)
+
+    def percentile(self, q: float) -> Optional[float]:
+        return _percentile(list(self._latencies), q)
+
+    @property
+    def first_chunk_samples(self) -> int:
+        return len(self._first_chunk)
+
+    def first_chunk_p95(self) -> Optional[float]:
+        return _percentile(list(self._first_chunk), 0.95)
+
+    @property
+    def p50(self) -> Optional[float]:
+        return self.percentile(0.5)
+
+    @property
+    def p95(self) -> Optional[float]:
+        return self.percentile(0.95)
+
+    @property
+    def error_rate(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return self._outcomes.count(False) / len(self._outcomes)
+
+    def within_sla(self) -> bool:
+        p95 = self.p95
+        return self.sla is None or p95 is None or p95 <= self.sla
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "error_rate": self.error_rate,
+            "p50": self.p50,
+            "p95": self.p95,
+            "first_chunk_p95": self.first_chunk_p95(),
+            "cost": self.cost,
+            "sla": self.sla,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "breaker": "closed" if self.breaker_opened is None else "open",
+        }
+
+
+class LLMRouter(LLMBackend):
+    """
+    Backend that routes each request to one of several routes and hedges slow calls.
+    """
+
+    name = "router"
+
+    def __init__(self,
+                 routes: List[Route],
+                 policy: str = "cheapest_within_sla",
+                 call_site_routes: Optional[Dict[str, str]] = None,
+                 hedge: bool = True,
+                 hedge_min_samples: int = 20,
+                 max_error_rate: float = 0.5,
+                 breaker_min_calls: int = 5,
+                 breaker_cooldown: float = 30.0):
+        """
+        :param routes: candidate routes; at least one is required.
+        :param policy: "cheapest_within_sla" or "fastest".
+        :param call_site_routes: optional {call_site: route name} overrides tried first.
+        :param hedge: send a duplicate request to the next route once the primary exceeds its p95.
+        :param hedge_min_samples: latency samples a route needs before its p95 is trusted for hedging.
+        :param max_error_rate: a route above this rolling error rate has its breaker opened and is
+            only used as a last resort.
+        :param breaker_min_calls: calls in the window before the error rate can open the breaker.
+        :param breaker_cooldown: seconds an open breaker waits before letting one probe call through.
+        """
+        if not routes:
+            raise ValueError("LLMRouter needs at least one route.")
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown routing policy '{policy}'.")
+        self.routes: Dict[str, Route] = {r.name: r for r in routes}
+        self.policy = policy
+        self.call_site_routes = dict(call_site_routes or {})
+        self.hedge = hedge
+        self.hedge_min_samples = hedge_min_samples
+        self.max_error_rate = max_error_rate
+        self.breaker_min_calls = breaker_min_calls
+        self.breaker_cooldown = breaker_cooldown
+
+    @classmethod
+    def from_config(cls,
+                    config: List[Dict[str, Any]],
+                    api_key: Optional[str] = None,
+                    **kwargs) -> "LLMRouter":
+        """
+        Build OpenAI-compatible routes from dicts with name, model, api_base, cost and sla keys.
+        """
+        routes = [
+            Route(c.get("name") or c.get("model", f"route{i}"),
+                  OpenAIBackend(api_key=c.get("api_key", api_key), api_base=c.get("api_base")),
+                  model=c.get("model"),
+                  cost=float(c.get("cost", 0.0)),
+                  sla=c.get("sla"))
+            for i, c in enumerate(config)
+        ]
+        return cls(routes, **kwargs)
+
+    # ------------------------------------------------------------------
+    # Route selection
+    # ------------------------------------------------------------------
+
+    def _available(self, route: Route, now: float) -> bool:
+        """
+        Whether a route's breaker lets a call through, opening it when the error rate is over
+        the limit. After the cooldown one call is let through as a probe (the cooldown restarts,
+        so concurrent calls do not all probe).
+        """
+        if route.breaker_opened is None:
+            if len(route._outcomes) < self.breaker_min_calls or route.error_rate <= self.max_error_rate:
+                return True
+            route.breaker_opened = now
+            return False
+        if now - route.breaker_opened < self.breaker_cooldown:
+            return False
+        route.breaker_opened = now
+        return True
+
+    def ranked(self, call_site: Optional[str] = None) -> List[Route]:
+        """
+        Order routes for a call: call-site override first, then routes with a closed (or probing)
+        breaker by policy, then routes with an open breaker.
+        """
+        now = time.monotonic()
+        routes = list(self.routes.values())
+        available = {r.name: self._available(r, now) for r in routes}
+        healthy = [r for r in routes if available[r.name]]
+        failing = sorted((r for r in routes if not available[r.name]), key=lambda r: r.error_rate)
+        if self.policy == "fastest":
+            # Routes without samples sort first so every route gets measured.
+            ordered = sorted(healthy, key=lambda r: (r.p50 or 0.0, r.cost))
+        else:
+            within = sorted((r for r in healthy if r.within_sla()), key=lambda r: (r.cost, r.p95 or 0.0))
+            outside = sorted((r for r in healthy if not r.within_sla()), key=lambda r: r.p95)
+            ordered = within + outside
+        ordered += failing
+        override = self.call_site_routes.get(call_site) if call_site else None
+        if override in self.routes:
+            ordered.remove(self.routes[override])
+            ordered.insert(0, self.routes[override])
+        return ordered
+
+    def _hedge_delay(self, route: Route, streaming: bool = False) -> Optional[float]:
+        if not self.hedge:
+            return None
+        if streaming:
+            if route.first_chunk_samples < self.hedge_min_samples:
+                return None
+            return route.first_chunk_p95()
+        if route.samples < self.hedge_min_samples:
+            return None
+        return route.p95
+
+    # ------------------------------------------------------------------
+    # Calls
+    # ------------------------------------------------------------------
+
+    async def _timed(self, route: Route, messages, params, call_site) -> Completion:
+        started = time.monotonic()
+        try:
+            result = await route.backend.complete(messages, route.params(params), call_site)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            route.record(None, False)
+            raise
+        route.record(time.monotonic() - started, True)
+        return result
+
+    async def _race(self, primary: Route, backup: Route, delay: float,
+                    messages, params, call_site, tried: Set[str]) -> Completion:
+        """
+        Run primary; if it has not answered after delay seconds, also run backup.
+        The first successful answer wins and the other request is cancelled.
+        :param tried: names of the routes tried; backup is added only if it was started.
+        """
+        first = asyncio.ensure_future(self._timed(primary, messages, params, call_site))
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done:
+            return first.result()
+        primary.hedges += 1
+        tried.add(backup.name)
+        second = asyncio.ensure_future(self._timed(backup, messages, params, call_site))
+        pending = {first, second}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            primary.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def complete(self, messages, params, call_site=None) -> Completion:
+        """
+        Send the request to the best route, hedging to the next one when the primary is slow
+        and falling through the remaining routes on errors.
+        """
+        ranked = self.ranked(call_site)
+        error: Optional[BaseException] = None
+        tried: Set[str] = set()
+        for route in ranked:
+            if route.name in tried:
+                continue  # already failed as the backup of a race
+            tried.add(route.name)
+            untried = [r for r in ranked if r.name not in tried]
+            backup = untried[0] if untried else None
+            delay = self._hedge_delay(route) if backup is not None else None
+            try:
+                if delay is None:
+                    return await self._timed(route, messages, params, call_site)
+                return await self._race(route, backup, delay, messages, params, call_site, tried)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                error = exc
+        raise error
+
+    async def _open(self, route: Route, messages, params, call_site) -> Tuple[AsyncIterator[str], Any, float]:
+        """
+        Start a stream on route and wait for its first chunk (None if the stream is empty).
+        """
+        started = time.monotonic()
+        stream = route.backend.stream(messages, route.params(params), call_site)
+        try:
+            first = await stream.__anext__()
+        except StopAsyncIteration:
+            first = None
+        except BaseException:
+            await stream.aclose()
+            raise
+        return stream, first, started
+
+    async def stream(self, messages, params, call_site=None) -> AsyncIterator[str]:
+        """
+        Stream from the best route. Hedging applies to the time to first chunk: if the primary
+        has produced nothing by its p95, the next route is started and whichever speaks first
+        is kept. Routes that fail before their first chunk are skipped.
+        """
+        ranked = self.ranked(call_site)
+        opened = None
+        error: Optional[BaseException] = None
+        tried = set()
+        for route in ranked:
+            if route.name in tried:
+                continue  # already failed as the backup of a race
+            tried.add(route.name)
+            untried = [r for r in ranked if r.name not in tried]
+            backup = untried[0] if untried else None
+            delay = self._hedge_delay(route, streaming=True) if backup is not None else None
+            tasks = {asyncio.ensure_future(self._open(route, messages, params, call_site)): route}
+            try:
+                done, _ = await asyncio.wait(set(tasks), timeout=delay)
+                if not done:
+                    route.hedges += 1
+                    tried.add(backup.name)
+                    tasks[asyncio.ensure_future(self._open(backup, messages, params, call_site))] = backup
+                pending = set(tasks)
+                while pending and opened is None:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        if task.exception() is None and opened is None:
+                            opened = (tasks[task],) + task.result()
+                            if tasks[task] is not route:
+                                route.hedge_wins += 1
+                        elif task.exception() is not None:
+                            tasks[task].record(None, False)
+                            error = task.exception()
+                        else:
+                            await task.result()[0].aclose()
+            finally:
+                for task in tasks:
+                    if not task.done():
+                        task.cancel()
+            if opened is not None:
+                break
+        if opened is None:
+            raise error
+
+        route, stream, first, started = opened
+        first_chunk = time.monotonic() - started
+        try:
+            if first is not None:
+                yield first
+            async for chunk in stream:
+                yield chunk
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            route.record(None, False)
+            raise
+        else:
+            route.record(time.monotonic() - started, True, first_chunk=first_chunk)
+        finally:
+            await stream.aclose()
+
+    async def embed(self, texts: List[str], model: str) -> List[List[float]]:
+        """
+        Embed with the first route whose backend supports embeddings.
+        """
+        error: Optional[BaseException] = None
+        for route in self.ranked():
+            try:
+                return await route.backend.embed(texts, model)
+            except NotImplementedError as exc:
+                error = exc
+        raise error
+
+    async def close(self) -> None:
+        for route in self.routes.values():
+            await route.backend.close()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Return rolling latency, error and hedging statistics per route.
+        """
+        return {name: route.stats() for name, route in self.routes.items()}
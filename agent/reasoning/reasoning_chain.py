@@ -4,10 +4,73 @@ reasoning_chain.py
 Defines reusable reasoning chain patterns (e.g. ReAct, ToT) leveraging LLMInterface and Evaluator.
 """
 
-from typing import List, Dict, Any
+import re
+import time
+import asyncio
+from typing import List, Dict, Any, Optional, Callable
 from .llm_interface import LLMInterface
 from .evaluator import Evaluator
 
+REACT_PROMPT = (
+    "You are choosing the agent's next action.\n\n"
+    "Context:\n{prompt}\n\n"
+    "Available actions: {actions}\n\n"
+    "{history}"
+    "Think briefly, then commit to exactly one available action using this format:\n"
+    "Thought: <your reasoning>\n"
+    "Action: <action name>\n"
+)
+
+_ACTION_RE = re.compile(r"^\s*action\s*:\s*(.*)$", re.IGNORECASE | re.MULTILINE)
+_THOUGHT_RE = re.compile(r"thought\s*:\s*(.*?)(?=^\s*action\s*:|\Z)", re.IGNORECASE | re.MULTILINE | re.DOTALL)
+
+TOT_EXPAND_PROMPT = (
+    "Problem:\n{prompt}\n\n"
+    "Reasoning so far:\n{path}\n\n"
+    "Propose the single next reasoning step toward a solution. "
+    "Be concise and do not repeat earlier steps."
+)
+
+def _candidate(prompt: str, path: List[str]) -> str:
+    """
+    Text the evaluator scores for a reasoning path.
+    """
+    return f"Problem: {prompt}\nReasoning:\n" + "\n".join(path)
+
+def _normalize_thought(text: str) -> str:
+    return " ".join(text.lower().split())
+
+def _match_action(raw: str, actions: List[str]) -> Optional[str]:
+    """
+    Map the text after "Action:" onto one of the available action names.
+    """
+    candidate = raw.strip().strip("`'\"*.[]()").strip().lower()
+    by_name = {a.lower(): a for a in actions}
+    if candidate in by_name:
+        return by_name[candidate]
+    head = re.split(r"[\s(\[:,]", candidate, maxsplit=1)[0]
+    return by_name.get(head)
+
+def _action_complete(actions: List[str]) -> Callable[[str], bool]:
+    """
+    Build a stream predicate that fires as soon as the Action line is settled:
+    either the line is terminated, or it already names an action that no other
+    action name extends.
+    """
+    names = [a.lower() for a in actions]
+
+    def settled(text: str) -> bool:
+        match = _ACTION_RE.search(text)
+        if not match:
+            return False
+        if "\n" in text[match.start(1):]:
+            return True
+        candidate = match.group(1).strip().lower()
+        return candidate in names and not any(n != candidate and n.startswith(candidate) for n in names)
+
+    return settled
+
+
 class ReasoningChain:
     """
     Implements a generic reasoning chain: think, act, observe loop.
@@ -21,24 +84,249 @@ class ReasoningChain:
         self.llm = llm
         self.evaluator = evaluator
 
-    def react(self, prompt: str, actions: List[str]) -> Dict[str, Any]:
+    async def areact(self,
+                     prompt: str,
+                     actions: List[str],
+                     max_steps: int = 3,
+                     token_budget: Optional[int] = 2000,
+                     time_budget: Optional[float] = 20.0) -> Dict[str, Any]:
+        """
+        Asynchronous ReAct loop over LLMInterface.astream.
+        Each step streams a Thought/Action completion; generation is cut off as soon as the
+        Action line is settled. A valid action ends the loop; otherwise an observation
+        explaining the problem is fed back for the next step.
+        :param max_steps: maximum think/act/observe iterations.
+        :param token_budget: prompt+completion token budget (None for unlimited).
+        :param time_budget: wall-clock budget in seconds (None for unlimited).
+        :return: dict with 'action', 'trace' (per-step thought, action, observation and timings)
+                 and 'stop_reason'.
+        """
+        trace: List[Dict[str, Any]] = []
+        history: List[str] = []
+        tokens_used = 0
+        started = time.monotonic()
+        deadline = started + time_budget if time_budget is not None else None
+        until = _action_complete(actions)
+
+        for step in range(1, max_steps + 1):
+            if token_budget is not None and tokens_used >= token_budget:
+                return {"action": None, "trace": trace, "stop_reason": "tokens"}
+            left = None if deadline is None else deadline - time.monotonic()
+            if left is not None and left <= 0:
+                return {"action": None, "trace": trace, "stop_reason": "time"}
+
+            step_prompt = REACT_PROMPT.format(
+                prompt=prompt,
+                actions=", ".join(actions),
+                history="".join(history),
+            )
+            step_started = time.monotonic()
+            timing = {"first_token": None}
+            parts: List[str] = []
+
+            async def consume() -> None:
+                stream = self.llm.astream(step_prompt, stop=["\nObservation:"],
+                                          call_site="reasoning.react", until=until)
+                try:
+                    async for chunk in stream:
+                        if timing["first_token"] is None:
+                            timing["first_token"] = time.monotonic() - step_started
+                        parts.append(chunk)
+                finally:
+                    await stream.aclose()
+
+            timed_out = False
+            try:
+                await asyncio.wait_for(consume(), left)
+            except asyncio.TimeoutError:
+                timed_out = True
+            text = "".join(parts)
+            step_tokens = self.llm.count_tokens(step_prompt) + self.llm.count_tokens(text)
+            tokens_used += step_tokens
+
+            action_match = _ACTION_RE.search(text)
+            thought_match = _THOUGHT_RE.search(text)
+            raw_action = action_match.group(1).split("\n")[0].strip() if action_match else None
+            action = _match_action(raw_action, actions) if raw_action else None
+            if action:
+                observation = None
+            elif raw_action:
+                observation = f"'{raw_action}' is not an available action. Choose one of: {', '.join(actions)}."
+            else:
+                observation = "No action was given. Reply with an 'Action:' line naming one available action."
+
+            record = {
+                "step": step,
+                "thought": thought_match.group(1).strip() if thought_match else text.strip(),
+                "action": action,
+                "observation": observation,
+                "latency": time.monotonic() - step_started,
+                "first_token_latency": timing["first_token"],
+                "tokens": step_tokens,
+            }
+            trace.append(record)
+            if action:
+                return {"action": action, "trace": trace, "stop_reason": "action"}
+            if timed_out:
+                return {"action": None, "trace": trace, "stop_reason": "time"}
+            history.append(f"Thought: {record['thought']}\nAction: {raw_action or ''}\n"
+                           f"Observation: {observation}\n\n")
+
+        return {"action": None, "trace": trace, "stop_reason": "max_steps"}
+
+    def react(self, prompt: str, actions: List[str], **kwargs) -> Dict[str, Any]:
         """
         Perform ReAct chain: generate thoughts and actions iteratively.
         :param prompt: initial context prompt.
         :param actions: list of possible actions to choose from.
-        :return: selected action and reasoning trace.
+        :return: selected action and reasoning trace (see areact for budget options).
         """
-        trace = []
-        # TODO: implement iterative ReAct: generate thought, choose action, simulate, evaluate
-        return {"action": None, "trace": trace}
+        return self.llm.run(self.areact(prompt, actions, **kwargs))
+
+    async def atree_of_thoughts(self,
+                                prompt: str,
+                                depth: int = 3,
+                                width: int = 2,
+                                beam: Optional[int] = None,
+                                time_budget: Optional[float] = 30.0,
+                                token_budget: Optional[int] = 8000) -> Dict[str, Any]:
+        """
+        Asynchronous beam-search Tree-of-Thoughts.
+        Each level expands every frontier node `width` times concurrently, drops duplicate
+        thoughts, scores the new nodes with one batched Evaluator pass and keeps the best `beam`.
+        Search stops early when the wall-clock or token budget is exhausted; the best node found
+        so far is returned. Expansions are only launched while their estimated cost (prompt plus
+        the average completion seen so far, and the cost of scoring the child) fits the
+        remaining token budget.
+        :param beam: number of nodes kept per level (defaults to width).
+        :param time_budget: wall-clock budget in seconds (None for unlimited).
+        :param token_budget: prompt+completion token budget (None for unlimited).
+        :return: dict with 'solution', 'score', 'tree' (all nodes, pruned ones flagged) and 'stop_reason'.
+        """
+        beam = beam or width
+        deadline = time.monotonic() + time_budget if time_budget is not None else None
+        tokens_used = 0
+        tree: List[Dict[str, Any]] = []
+        seen = set()
+        frontier: List[Dict[str, Any]] = [{"id": 0, "parent": None, "depth": 0, "thought": "",
+                                           "path": [], "score": None, "pruned": False}]
+        tree.append(frontier[0])
+        best: Optional[Dict[str, Any]] = None
+        stop_reason = "depth"
+        # Expected completion tokens per expansion: max_tokens until completions are observed
+        completion_estimate: float = getattr(self.llm, "max_tokens", 0) or 0
+        completions, completion_total = 0, 0
+
+        def remaining_time() -> Optional[float]:
+            return None if deadline is None else deadline - time.monotonic()
+
+        for level in range(1, depth + 1):
+            if token_budget is not None and tokens_used >= token_budget:
+                stop_reason = "tokens"
+                break
+            left = remaining_time()
+            if left is not None and left <= 0:
+                stop_reason = "time"
+                break
+
+            # Expand: all frontier nodes x width samples in concurrent waves. Each wave is cut
+            # to the expansions whose estimated cost (expansion plus scoring the child) still
+            # fits the token budget.
+            requests = []
+            for node in frontier:
+                path_text = "\n".join(f"{i + 1}. {t}" for i, t in enumerate(node["path"])) or "(none)"
+                expand_prompt = TOT_EXPAND_PROMPT.format(prompt=prompt, path=path_text)
+                prompt_tokens = self.llm.count_tokens(expand_prompt)
+                prefix_tokens = self.llm.count_tokens(_candidate(prompt, node["path"]))
+                requests.extend((node, expand_prompt, prompt_tokens, prefix_tokens) for _ in range(width))
+            children = []
+            scoring_reserved = 0  # estimated cost of scoring the children expanded so far
+            while requests:
+                wave = requests
+                if token_budget is not None:
+                    room = token_budget - tokens_used - scoring_reserved
+                    admitted = 0
+                    for _, _, prompt_tokens, prefix_tokens in requests:
+                        room -= prompt_tokens + prefix_tokens + 2 * completion_estimate
+                        if room < 0:
+                            break
+                        admitted += 1
+                    if not admitted:
+                        stop_reason = "tokens"
+                        break
+                    wave = requests[:admitted]
+                requests = requests[len(wave):]
+                left = remaining_time()
+                try:
+                    responses = await asyncio.wait_for(
+                        self.llm.agenerate_many([r[1] for r in wave], return_exceptions=True,
+                                                call_site="reasoning.tot_expand"),
+                        left
+                    )
+                except asyncio.TimeoutError:
+                    stop_reason = "time"
+                    break
+                for (parent, _, prompt_tokens, prefix_tokens), thought in zip(wave, responses):
+                    if isinstance(thought, BaseException) or not thought:
+                        continue
+                    completion_tokens = self.llm.count_tokens(thought)
+                    tokens_used += prompt_tokens + completion_tokens
+                    completions += 1
+                    completion_total += completion_tokens
+                    completion_estimate = completion_total / completions
+                    key = _normalize_thought(" ".join(parent["path"] + [thought]))
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    child = {"id": len(tree), "parent": parent["id"], "depth": level, "thought": thought,
+                             "path": parent["path"] + [thought], "score": None, "pruned": False}
+                    tree.append(child)
+                    children.append(child)
+                    scoring_reserved += prefix_tokens + completion_tokens
+            if stop_reason == "time" and not children:
+                break
+            if not children:
+                if stop_reason == "depth":
+                    stop_reason = "exhausted"
+                break
+
+            # Score the whole level in batched evaluator calls
+            candidates = [_candidate(prompt, c["path"]) for c in children]
+            try:
+                scores = await asyncio.wait_for(self.evaluator.ascore_many(candidates), remaining_time())
+            except asyncio.TimeoutError:
+                scores = [None] * len(children)
+                stop_reason = "time"
+            tokens_used += sum(self.llm.count_tokens(c) for c in candidates)
+            for child, score in zip(children, scores):
+                child["score"] = 0.0 if score is None else score
+
+            # Prune to the beam
+            children.sort(key=lambda c: c["score"], reverse=True)
+            for pruned in children[beam:]:
+                pruned["pruned"] = True
+            frontier = children[:beam]
+            if best is None or frontier[0]["score"] > best["score"]:
+                best = frontier[0]
+            if stop_reason in ("time", "tokens"):
+                break
+
+        if token_budget is not None and tokens_used >= token_budget and stop_reason == "depth":
+            stop_reason = "tokens"
+        return {
+            "solution": "\n".join(best["path"]) if best else None,
+            "score": best["score"] if best else None,
+            "tree": [{k: v for k, v in node.items() if k != "path"} for node in tree],
+            "tokens_used": tokens_used,
+            "stop_reason": stop_reason,
+        }
 
-    def tree_of_thoughts(self, prompt: str, depth: int = 3, width: int = 2) -> Dict[str, Any]:
+    def tree_of_thoughts(self, prompt: str, depth: int = 3, width: int = 2, **kwargs) -> Dict[str, Any]:
         """
         Perform Tree-of-Thoughts search on a prompt.
         :param prompt: initial prompt string.
         :param depth: search depth.
         :param width: number of branches per level.
-        :return: best solution and thought tree.
+        :return: best solution and thought tree (see atree_of_thoughts for budget options).
         """
-        # TODO: implement ToT search logic using evaluator
-        return {"solution": None, "tree": []}
+        return self.llm.run(self.atree_of_thoughts(prompt, depth=depth, width=width, **kwargs))
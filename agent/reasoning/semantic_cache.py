@@ -0,0 +1,192 @@
+"""
+semantic_cache.py
+
+Embedding-similarity cache for near-duplicate LLM prompts.
+Prompts are normalized, embedded, and compared against previously answered prompts from the
+same call site; a stored answer is returned when the cosine similarity clears the call site's
+threshold and the prompts agree on every number. Normalization masks volatile tokens
+(timestamps, uuids) outright; dates, times of day and other numbers are masked for the
+embedding but kept as an exact-match guard, so "the last 5 posts" never answers "the last 50
+posts" however close their embeddings are. Call sites must opt in explicitly.
+"""
+
+import re
+import threading
+import numpy as np
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+# Replaced before embedding and otherwise ignored
+_VOLATILE = [
+    (re.compile(r"\d{4}-\d{2}-\d{2}[t ]\d{2}:\d{2}(:\d{2}(\.\d+)?)?(z|[+-]\d{2}:?\d{2})?"), "<ts>"),
+    (re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}"), "<uuid>"),
+]
+
+# Replaced before embedding; the values must match exactly for a hit
+_GUARDED = [
+    (re.compile(r"\d{4}-\d{2}-\d{2}"), "<date>"),
+    (re.compile(r"\d{1,2}:\d{2}(:\d{2})?"), "<time>"),
+    (re.compile(r"\d+(\.\d+)?"), "<num>"),
+]
+
+_WHITESPACE = re.compile(r"\s+")
+
+Guard = Tuple[str, ...]
+
+
+class Probe(NamedTuple):
+    """
+    A looked-up prompt: its unit embedding and its guarded values, passed back to store().
+    """
+    vector: np.ndarray
+    guard: Guard
+
+
+class _Partition:
+    """
+    Fixed-capacity ring buffer of unit-normalized prompt embeddings and their responses.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.vectors: Optional[np.ndarray] = None
+        self.responses: List[Optional[str]] = [None] * capacity
+        self.guards: List[Optional[Guard]] = [None] * capacity
+        self.count = 0
+        self.next = 0
+
+    def nearest(self, vector: np.ndarray, guard: Guard) -> Tuple[float, Optional[str]]:
+        """
+        Most similar stored prompt among those with the same guarded values.
+        """
+        if self.count == 0 or self.vectors is None or self.vectors.shape[1] != vector.shape[0]:
+            return -1.0, None
+        rows = [i for i in range(self.count) if self.guards[i] == guard]
+        if not rows:
+            return -1.0, None
+        sims = self.vectors[rows] @ vector
+        best = int(np.argmax(sims))
+        return float(sims[best]), self.responses[rows[best]]
+
+    def add(self, vector: np.ndarray, guard: Guard, response: str) -> None:
+        if self.vectors is None or self.vectors.shape[1] != vector.shape[0]:
+            self.vectors = np.zeros((self.capacity, vector.shape[0]), dtype=np.float32)
+            self.count = self.next = 0
+        self.vectors[self.next] = vector
+        self.guards[self.next] = guard
+        self.responses[self.next] = response
+        self.next = (self.next + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+
+class SemanticCache:
+    """
+    Nearest-neighbour cache over embedded prompts, partitioned by call site and model.
+    """
+
+    def __init__(self,
+                 embed_fn: Callable[[str], Sequence[float]],
+                 threshold: float = 0.95,
+                 max_entries: int = 2048,
+                 call_sites: Optional[Dict[str, Optional[float]]] = None):
+        """
+        :param embed_fn: function that converts text to a vector embedding.
+        :param threshold: default cosine similarity required for a hit.
+        :param max_entries: maximum prompts remembered per (call site, model) partition.
+        :param call_sites: call sites to opt in, mapped to an optional threshold override.
+        """
+        self.embed_fn = embed_fn
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._thresholds: Dict[str, Optional[float]] = dict(call_sites or {})
+        self._partitions: Dict[Tuple[str, str], _Partition] = {}
+        self._stats: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(prompt: str) -> Tuple[str, Guard]:
+        """
+        Mask timestamps, ids, dates, times and numbers and collapse whitespace.
+        :return: (normalized text, the masked dates, times and numbers in order of kind).
+        """
+        text = prompt.lower()
+        for pattern, replacement in _VOLATILE:
+            text = pattern.sub(replacement, text)
+        guard: List[str] = []
+        for pattern, replacement in _GUARDED:
+            guard.extend(m.group(0) for m in pattern.finditer(text))
+            text = pattern.sub(replacement, text)
+        return _WHITESPACE.sub(" ", text).strip(), tuple(guard)
+
+    def opt_in(self, call_site: str, threshold: Optional[float] = None) -> None:
+        """
+        Enable semantic caching for a call site, optionally with its own threshold.
+        """
+        self._thresholds[call_site] = threshold
+
+    def opt_out(self, call_site: str) -> None:
+        """
+        Disable semantic caching for a call site.
+        """
+        self._thresholds.pop(call_site, None)
+
+    def enabled(self, call_site: Optional[str]) -> bool:
+        return call_site is not None and call_site in self._thresholds
+
+    def _probe(self, prompt: str) -> Probe:
+        text, guard = self.normalize(prompt)
+        vector = np.asarray(self.embed_fn(text), dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        return Probe(vector / norm if norm > 0 else vector, guard)
+
+    def lookup(self, call_site: str, model: str, prompt: str) -> Tuple[Optional[str], Probe]:
+        """
+        Find a stored response for a semantically equivalent prompt with the same numbers.
+        :return: (response or None, probe for a subsequent store()).
+        """
+        probe = self._probe(prompt)
+        threshold = self._thresholds.get(call_site)
+        threshold = self.threshold if threshold is None else threshold
+        with self._lock:
+            partition = self._partitions.get((call_site, model))
+            similarity, response = partition.nearest(*probe) if partition else (-1.0, None)
+            stats = self._stats.setdefault(call_site, {"lookups": 0, "hits": 0, "similarity_sum": 0.0})
+            stats["lookups"] += 1
+            if response is not None and similarity >= threshold:
+                stats["hits"] += 1
+                stats["similarity_sum"] += similarity
+                return response, probe
+        return None, probe
+
+    def store(self, call_site: str, model: str, response: str, probe: Probe) -> None:
+        """
+        Remember a response under the probe returned by lookup().
+        """
+        with self._lock:
+            partition = self._partitions.get((call_site, model))
+            if partition is None:
+                partition = self._partitions[(call_site, model)] = _Partition(self.max_entries)
+            partition.add(probe.vector, probe.guard, response)
+
+    def clear(self) -> None:
+        """
+        Drop all stored prompts and reset statistics.
+        """
+        with self._lock:
+            self._partitions.clear()
+            self._stats.clear()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Per-call-site lookup/hit counts, hit ratio and mean similarity of hits.
+        """
+        with self._lock:
+            report = {}
+            for site, s in self._stats.items():
+                report[site] = {
+                    "lookups": int(s["lookups"]),
+                    "hits": int(s["hits"]),
+                    "hit_ratio": s["hits"] / s["lookups"] if s["lookups"] else 0.0,
+                    "mean_hit_similarity": s["similarity_sum"] / s["hits"] if s["hits"] else 0.0,
+                    "threshold": self._thresholds.get(site) or self.threshold,
+                }
+            return report
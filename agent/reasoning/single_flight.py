@@ -0,0 +1,68 @@
+"""
+single_flight.py
+
+Request coalescing: concurrent callers asking for the same key share one in-flight task
+instead of each starting their own. Independent of caching; nothing is kept once the task finishes.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+class SingleFlight:
+    """
+    Deduplicates concurrent identical async calls. Must be used from a single event loop.
+    """
+
+    def __init__(self):
+        """
+        Initialize empty in-flight registry and counters.
+        """
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._waiters: Dict[str, int] = {}
+        self.calls = 0
+        self.collapsed = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Run fn() for key, or join the call already in flight for the same key.
+        The shared task is cancelled only when every waiter has been cancelled.
+        :return: (result, True if this caller started the call, False if it was collapsed).
+        """
+        self.calls += 1
+        task = self._inflight.get(key)
+        leader = task is None
+        if leader:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            self._waiters[key] = 0
+            task.add_done_callback(lambda _t, k=key: self._forget(k, _t))
+        else:
+            self.collapsed += 1
+        self._waiters[key] += 1
+        try:
+            return await asyncio.shield(task), leader
+        except asyncio.CancelledError:
+            if not task.done() and self._waiters.get(key) == 1:
+                task.cancel()
+            raise
+        finally:
+            if self._inflight.get(key) is task:
+                self._waiters[key] -= 1
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+            del self._waiters[key]
+        if not task.cancelled():
+            task.exception()  # mark retrieved so failures are not reported as unhandled
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return number of calls, how many were collapsed onto another call, and current in-flight keys.
+        """
+        return {
+            "calls": self.calls,
+            "collapsed": self.collapsed,
+            "collapse_ratio": self.collapsed / self.calls if self.calls else 0.0,
+            "in_flight": len(self._inflight),
+        }
@@ -0,0 +1,312 @@
+"""
+structured_output.py
+
+Structured (JSON) generation on top of LLMInterface streaming. The response is parsed
+incrementally: each top-level field of the JSON object is validated against a small
+JSON-schema subset and handed to the consumer as soon as it is complete, and a stream that
+is clearly malformed is aborted and retried without waiting for the rest of the generation.
+"""
+
+import json
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from .llm_interface import LLMInterface
+
+FieldCallback = Callable[[str, Any], None]
+
+_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "boolean": bool,
+    "null": type(None),
+}
+
+class StructuredOutputError(ValueError):
+    """
+    Raised when a response is not valid JSON or does not match the schema.
+    """
+
+    def __init__(self, message: str, text: str = ""):
+        super().__init__(message)
+        self.text = text
+
+
+def _is_type(value: Any, name: str) -> bool:
+    if name == "number":
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    if name == "integer":
+        return isinstance(value, int) and not isinstance(value, bool)
+    expected = _TYPES.get(name)
+    return expected is not None and isinstance(value, expected)
+
+def validate(value: Any, schema: Optional[Dict[str, Any]], path: str = "$") -> List[str]:
+    """
+    Validate value against a JSON-schema subset: type (name or list of names), enum,
+    properties, required, additionalProperties (bool) and items.
+    :return: list of error messages (empty when valid).
+    """
+    if not schema:
+        return []
+    errors: List[str] = []
+    types = schema.get("type")
+    if types is not None:
+        names = types if isinstance(types, list) else [types]
+        if not any(_is_type(value, n) for n in names):
+            return [f"{path}: expected {'/'.join(names)}, got {type(value).__name__}"]
+    if "enum" in schema and value not in schema["enum"]:
+        errors.append(f"{path}: {value!r} is not one of {schema['enum']}")
+    if isinstance(value, dict):
+        for key in schema.get("required", []):
+            if key not in value:
+                errors.append(f"{path}: missing required field '{key}'")
+        for key, item in value.items():
+            errors.extend(validate_field(key, item, schema, path))
+    if isinstance(value, list) and "items" in schema:
+        for i, item in enumerate(value):
+            errors.extend(validate(item, schema["items"], f"{path}[{i}]"))
+    return errors
+
+def validate_field(key: str, value: Any, schema: Optional[Dict[str, Any]], path: str = "$") -> List[str]:
+    """
+    Validate one field of an object against the object's schema.
+    """
+    if not schema:
+        return []
+    properties = schema.get("properties", {})
+    if key in properties:
+        return validate(value, properties[key], f"{path}.{key}")
+    if schema.get("additionalProperties") is False:
+        return [f"{path}: unexpected field '{key}'"]
+    return []
+
+
+class StreamingJSONParser:
+    """
+    Incremental parser for a single JSON object arriving in chunks.
+    Top-level fields are returned from feed() as soon as their value is complete; syntax
+    errors at the top level are reported on the character that breaks the structure.
+    Text before the opening brace (up to max_preamble characters, e.g. a code fence) and
+    anything after the closing brace are ignored.
+    """
+
+    # Top-level states
+    _START, _KEY_OR_END, _KEY, _COLON, _VALUE, _IN_VALUE, _COMMA_OR_END, _DONE = range(8)
+    _VALUE_START = set('"{[-0123456789tfn')
+
+    def __init__(self, max_preamble: int = 200):
+        """
+        :param max_preamble: characters tolerated before the opening brace.
+        """
+        self.max_preamble = max_preamble
+        self.text = ""
+        self.fields: Dict[str, Any] = {}
+        self._state = self._START
+        self._pos = 0
+        self._field_start = 0
+        self._depth = 0          # nesting depth inside the current value
+        self._in_string = False
+        self._escape = False
+        self._scalar = False     # current value is a bare number/literal
+
+    @property
+    def done(self) -> bool:
+        return self._state == self._DONE
+
+    def _fail(self, reason: str) -> None:
+        raise StructuredOutputError(f"Malformed JSON at offset {self._pos}: {reason}", self.text)
+
+    def _emit(self, end: int) -> Tuple[str, Any]:
+        chunk = self.text[self._field_start:end].strip()
+        try:
+            parsed = json.loads("{" + chunk + "}")
+        except ValueError as exc:
+            self._fail(f"invalid field ({exc})")
+        key, value = next(iter(parsed.items()))
+        self.fields[key] = value
+        return key, value
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """
+        Consume a chunk of text.
+        :return: (key, value) pairs for top-level fields completed by this chunk.
+        :raises StructuredOutputError: once the text cannot be a JSON object.
+        """
+        self.text += chunk
+        completed: List[Tuple[str, Any]] = []
+        text = self.text
+        while self._pos < len(text) and self._state != self._DONE:
+            c = text[self._pos]
+            state = self._state
+            if state == self._START:
+                if c == "{":
+                    self._state = self._KEY_OR_END
+                    self._field_start = self._pos + 1
+                elif self._pos >= self.max_preamble:
+                    self._fail("no JSON object found")
+            elif state == self._KEY_OR_END:
+                if c == '"':
+                    self._in_string = True
+                    self._state = self._KEY
+                elif c == "}" and not self.fields:
+                    self._state = self._DONE
+                elif not c.isspace():
+                    self._fail(f"expected a field name, got {c!r}")
+            elif state == self._KEY:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    self._state = self._COLON
+            elif state == self._COLON:
+                if c == ":":
+                    self._state = self._VALUE
+                elif not c.isspace():
+                    self._fail(f"expected ':', got {c!r}")
+            elif state == self._VALUE:
+                if c in self._VALUE_START:
+                    self._state = self._IN_VALUE
+                    self._scalar = c not in '"{['
+                    if c == '"':
+                        self._in_string = True
+                    elif c in "{[":
+                        self._depth = 1
+                elif not c.isspace():
+                    self._fail(f"expected a value, got {c!r}")
+            elif state == self._IN_VALUE:
+                if self._in_string:
+                    if self._escape:
+                        self._escape = False
+                    elif c == "\\":
+                        self._escape = True
+                    elif c == '"':
+                        self._in_string = False
+                        if self._depth == 0:
+                            self._state = self._COMMA_OR_END
+                elif c == '"':
+                    self._in_string = True
+                elif c in "{[":
+                    self._depth += 1
+                elif c in "}]" and self._depth > 0:
+                    self._depth -= 1
+                    if self._depth == 0:
+                        self._state = self._COMMA_OR_END
+                elif self._scalar and (c in ",}" or c.isspace()):
+                    self._state = self._COMMA_OR_END
+                    continue  # re-read the delimiter in the new state
+            elif state == self._COMMA_OR_END:
+                if c == ",":
+                    completed.append(self._emit(self._pos))
+                    self._field_start = self._pos + 1
+                    self._state = self._KEY_OR_END
+                elif c == "}":
+                    completed.append(self._emit(self._pos))
+                    self._state = self._DONE
+                elif not c.isspace():
+                    self._fail(f"expected ',' or '}}', got {c!r}")
+            self._pos += 1
+        return completed
+
+    def close(self) -> Dict[str, Any]:
+        """
+        Finish parsing.
+        :return: the complete object.
+        :raises StructuredOutputError: if the object was not closed.
+        """
+        if self._state != self._DONE:
+            self._fail("response ended before the JSON object was closed")
+        return self.fields
+
+
+class StructuredOutput:
+    """
+    Streams a JSON object from the LLM, delivering validated fields as they complete.
+    """
+
+    def __init__(self,
+                 llm: LLMInterface,
+                 schema: Optional[Dict[str, Any]] = None,
+                 retries: int = 1,
+                 max_preamble: int = 200):
+        """
+        :param llm: LLMInterface used for streaming.
+        :param schema: JSON-schema subset the object must satisfy (see validate()).
+        :param retries: additional attempts after a malformed or invalid response.
+        :param max_preamble: characters tolerated before the opening brace.
+        """
+        self.llm = llm
+        self.schema = schema
+        self.retries = retries
+        self.max_preamble = max_preamble
+        self.stats = {"attempts": 0, "aborted": 0, "fields": 0}
+
+    def _accept(self, parser: StreamingJSONParser, chunk: str, on_field: Optional[FieldCallback]) -> None:
+        for key, value in parser.feed(chunk):
+            errors = validate_field(key, value, self.schema)
+            if errors:
+                raise StructuredOutputError("; ".join(errors), parser.text)
+            self.stats["fields"] += 1
+            if on_field is not None:
+                on_field(key, value)
+
+    def _finish(self, parser: StreamingJSONParser) -> Dict[str, Any]:
+        result = parser.close()
+        errors = validate(result, self.schema)
+        if errors:
+            raise StructuredOutputError("; ".join(errors), parser.text)
+        return result
+
+    def generate(self,
+                 prompt: Any,
+                 on_field: Optional[FieldCallback] = None,
+                 **kwargs) -> Dict[str, Any]:
+        """
+        Stream a JSON object, calling on_field(key, value) for each completed top-level field.
+        A malformed or invalid stream is closed (cancelling the request) and retried with the
+        cache bypassed; fields delivered by an aborted attempt may be delivered again by the retry.
+        Keyword arguments are passed to LLMInterface.iter_stream().
+        :raises StructuredOutputError: when every attempt fails; .text holds the last response.
+        """
+        error: Optional[StructuredOutputError] = None
+        for attempt in range(self.retries + 1):
+            self.stats["attempts"] += 1
+            parser = StreamingJSONParser(self.max_preamble)
+            chunks = self.llm.iter_stream(prompt, **(dict(kwargs, cache=False) if attempt else kwargs))
+            try:
+                for chunk in chunks:
+                    self._accept(parser, chunk, on_field)
+                    if parser.done:
+                        break
+                return self._finish(parser)
+            except StructuredOutputError as exc:
+                self.stats["aborted"] += 1
+                error = exc
+            finally:
+                chunks.close()
+        raise error
+
+    async def agenerate(self,
+                        prompt: Any,
+                        on_field: Optional[FieldCallback] = None,
+                        **kwargs) -> Dict[str, Any]:
+        """
+        Asynchronous counterpart of generate(), built on LLMInterface.astream().
+        """
+        error: Optional[StructuredOutputError] = None
+        for attempt in range(self.retries + 1):
+            self.stats["attempts"] += 1
+            parser = StreamingJSONParser(self.max_preamble)
+            chunks = self.llm.astream(prompt, **(dict(kwargs, cache=False) if attempt else kwargs))
+            try:
+                async for chunk in chunks:
+                    self._accept(parser, chunk, on_field)
+                    if parser.done:
+                        break
+                return self._finish(parser)
+            except StructuredOutputError as exc:
+                self.stats["aborted"] += 1
+                error = exc
+            finally:
+                await chunks.aclose()
+        raise error
@@ -0,0 +1,220 @@
+"""
+token_budget.py
+
+Token counting, prompt-size governance and usage accounting for LLM calls.
+Prompts can be assembled from prioritized sections; when the total exceeds the budget the
+lowest-priority sections are trimmed (or summarized) first. Usage is tracked per call site
+and per tick for monitoring.
+"""
+
+import threading
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+try:
+    import tiktoken
+except ImportError:  # fall back to a character-based estimate
+    tiktoken = None
+
+TRUNCATION_MARKER = " …[truncated]… "
+
+class TokenCounter:
+    """
+    Counts and truncates text in model tokens (tiktoken when installed, ~4 chars/token otherwise).
+    """
+
+    def __init__(self, model: str = "gpt-4"):
+        """
+        :param model: model name used to select the tokenizer.
+        """
+        self.model = model
+        self._encoding = None
+        if tiktoken is not None:
+            try:
+                self._encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                self._encoding = tiktoken.get_encoding("cl100k_base")
+
+    def count(self, text: str) -> int:
+        """
+        Return the number of tokens in text.
+        """
+        if not text:
+            return 0
+        if self._encoding is not None:
+            return len(self._encoding.encode(text))
+        return max(1, (len(text) + 3) // 4)
+
+    def count_messages(self, messages: List[Dict[str, str]]) -> int:
+        """
+        Approximate prompt tokens for a chat message list (content plus per-message overhead).
+        """
+        return sum(self.count(m.get("content", "")) + 4 for m in messages) + 2
+
+    def truncate(self, text: str, max_tokens: int, keep: str = "head") -> str:
+        """
+        Shorten text to at most max_tokens.
+        :param keep: "head" keeps the beginning, "tail" the end, "middle" both ends.
+        """
+        if max_tokens <= 0:
+            return ""
+        if self.count(text) <= max_tokens:
+            return text
+        max_tokens = max(1, max_tokens - self.count(TRUNCATION_MARKER))
+        if self._encoding is not None:
+            tokens = self._encoding.encode(text)
+            decode = self._encoding.decode
+        else:
+            tokens = text
+            max_tokens *= 4
+            decode = lambda chunk: chunk
+        if keep == "tail":
+            return TRUNCATION_MARKER.lstrip() + decode(tokens[-max_tokens:])
+        if keep == "middle":
+            half = max_tokens // 2
+            return decode(tokens[:half]) + TRUNCATION_MARKER + decode(tokens[len(tokens) - (max_tokens - half):])
+        return decode(tokens[:max_tokens]) + TRUNCATION_MARKER.rstrip()
+
+
+class PromptSection:
+    """
+    A piece of a prompt with a priority; higher-priority sections are trimmed last.
+    """
+
+    def __init__(self,
+                 text: str,
+                 priority: int = 0,
+                 name: str = "",
+                 min_tokens: int = 0,
+                 keep: str = "head",
+                 summarize: bool = False):
+        """
+        :param text: section content.
+        :param priority: larger values survive trimming longer.
+        :param name: label used in usage reports.
+        :param min_tokens: the section is never trimmed below this size (0 allows dropping it).
+        :param keep: which part survives truncation: "head", "tail" or "middle".
+        :param summarize: summarize instead of truncating when a summarizer is available.
+        """
+        self.text = text
+        self.priority = priority
+        self.name = name
+        self.min_tokens = min_tokens
+        self.keep = keep
+        self.summarize = summarize
+
+    def __repr__(self):
+        return f"<PromptSection {self.name or '?'} priority={self.priority} chars={len(self.text)}>"
+
+
+Summarizer = Callable[[str, int], Awaitable[str]]
+
+async def fit_sections(sections: List[PromptSection],
+                       max_tokens: int,
+                       counter: TokenCounter,
+                       summarizer: Optional[Summarizer] = None,
+                       separator: str = "\n\n") -> Tuple[str, int]:
+    """
+    Assemble sections into a prompt of at most max_tokens, shrinking lowest-priority sections first.
+    :param summarizer: async fn(text, target_tokens) used for sections flagged summarize=True.
+    :return: (prompt text, number of tokens removed).
+    """
+    texts = [s.text for s in sections]
+    sizes = [counter.count(t) for t in texts]
+    overhead = counter.count(separator) * max(0, len(sections) - 1)
+    overflow = sum(sizes) + overhead - max_tokens
+    removed = 0
+    # Stable order: lowest priority first, later sections before earlier ones at equal priority
+    order = sorted(range(len(sections)), key=lambda i: (sections[i].priority, -i))
+    for i in order:
+        if overflow <= 0:
+            break
+        section = sections[i]
+        target = max(section.min_tokens, sizes[i] - overflow)
+        if target >= sizes[i]:
+            continue
+        if section.summarize and summarizer is not None and target > 0:
+            shrunk = await summarizer(texts[i], target)
+            if counter.count(shrunk) > target:
+                shrunk = counter.truncate(shrunk, target, section.keep)
+        else:
+            shrunk = counter.truncate(texts[i], target, section.keep)
+        new_size = counter.count(shrunk)
+        overflow -= sizes[i] - new_size
+        removed += sizes[i] - new_size
+        texts[i], sizes[i] = shrunk, new_size
+    return separator.join(t for t in texts if t), removed
+
+
+class TokenUsage:
+    """
+    Thread-safe token usage counters, kept per call site and for the current tick.
+    """
+
+    _FIELDS = ("calls", "cache_hits", "coalesced", "prompt_tokens", "completion_tokens", "trimmed_tokens")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_site: Dict[str, Dict[str, int]] = {}
+        self._tick: Dict[str, Dict[str, int]] = {}
+        self.tick_count = 0
+
+    def _new(self) -> Dict[str, int]:
+        return {f: 0 for f in self._FIELDS}
+
+    def record(self,
+               call_site: Optional[str],
+               prompt_tokens: int = 0,
+               completion_tokens: int = 0,
+               trimmed_tokens: int = 0,
+               cache_hit: bool = False,
+               coalesced: bool = False) -> None:
+        """
+        Add one call's usage to the call-site and current-tick counters.
+        :param coalesced: the call shared another caller's in-flight request (no tokens spent).
+        """
+        site = call_site or "default"
+        with self._lock:
+            for bucket in (self._by_site, self._tick):
+                row = bucket.setdefault(site, self._new())
+                row["calls"] += 1
+                row["cache_hits"] += int(cache_hit)
+                row["coalesced"] += int(coalesced)
+                row["prompt_tokens"] += prompt_tokens
+                row["completion_tokens"] += completion_tokens
+                row["trimmed_tokens"] += trimmed_tokens
+
+    def start_tick(self) -> Dict[str, Dict[str, int]]:
+        """
+        Close the current tick and start a new one.
+        :return: per-call-site usage of the tick that just ended.
+        """
+        with self._lock:
+            finished, self._tick = self._tick, {}
+            self.tick_count += 1
+            return finished
+
+    @staticmethod
+    def _totals(rows: Dict[str, Dict[str, int]]) -> Dict[str, int]:
+        totals = {f: 0 for f in TokenUsage._FIELDS}
+        for row in rows.values():
+            for f in TokenUsage._FIELDS:
+                totals[f] += row[f]
+        return totals
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Return cumulative and current-tick usage, per call site and in total.
+        """
+        with self._lock:
+            by_site = {k: dict(v) for k, v in self._by_site.items()}
+            tick = {k: dict(v) for k, v in self._tick.items()}
+        return {
+            "by_call_site": by_site,
+            "total": self._totals(by_site),
+            "tick": tick,
+            "tick_total": self._totals(tick),
+            "tick_count": self.tick_count,
+        }
+
+
+PromptInput = Union[str, List[PromptSection]]
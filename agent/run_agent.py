@@ -12,8 +12,12 @@ from infra.session_manager import SessionManager
 from tools.tool_manager import ToolManager
 from tools.web_search import WebSearch
 from tools.twitter.twitter_client import TwitterClient
-from ace.task_prosecution import TaskProsecution
+from ace.task_prosecution import TaskProsecutionLayer
 from reasoning.llm_interface import LLMInterface
+from reasoning.llm_backends import create_backend
+from reasoning.llm_router import LLMRouter
+from reasoning.llm_cache import LLMCache
+from reasoning.semantic_cache import SemanticCache
 from reasoning.evaluator import Evaluator
 from reasoning.reasoning_chain import ReasoningChain
 from core.identity import Identity
@@ -38,18 +42,33 @@ def main():
     tools.register("summarize", web.summarize)
 
     # Initialize ACE framework adapter and task prosecutor
-    prosecutor = TaskProsecution(tools)
-    tools.register("execute_action", prosecutor.execute_action)
+    prosecutor = TaskProsecutionLayer()
+    tools.register("execute_action", prosecutor.execute_task)
 
     # Initialize reasoning components
-    llm = LLMInterface(api_key=settings.OPENAI_API_KEY)
+    llm_cache = LLMCache(Database(settings.LLM_CACHE_FILE),
+                         max_entries=settings.LLM_CACHE_MAX_ENTRIES,
+                         ttl=settings.LLM_CACHE_TTL)
+    llm_backend = create_backend(settings.LLM_BACKEND,
+                                 api_key=settings.OPENAI_API_KEY,
+                                 cassette_path=settings.LLM_CASSETTE,
+                                 simulate_latency=settings.LLM_REPLAY_LATENCY)
+    if settings.LLM_ROUTES and settings.LLM_BACKEND == "openai":
+        llm_backend = LLMRouter.from_config(settings.LLM_ROUTES,
+                                            api_key=settings.OPENAI_API_KEY,
+                                            policy=settings.LLM_ROUTING_POLICY)
+    llm = LLMInterface(api_key=settings.OPENAI_API_KEY, cache=llm_cache, backend=llm_backend)
+    if settings.LLM_SEMANTIC_CACHE_THRESHOLD > 0:
+        llm.semantic_cache = SemanticCache(llm.embed,
+                                           threshold=settings.LLM_SEMANTIC_CACHE_THRESHOLD,
+                                           call_sites={"reasoning.react": None})
     evaluator = Evaluator(llm)
     reasoning_chain = ReasoningChain(llm, evaluator)
 
     # Initialize core agent
     identity = Identity()
     self_model = SelfModel(identity)
-    consciousness = ConsciousnessLoop(identity, self_model)
+    consciousness = ConsciousnessLoop(identity, self_model, llm=llm)
 
     # Start heartbeat and scheduler if needed (demo: run consciousness)
     consciousness.run_forever()
@@ -2,12 +2,18 @@
 sleep_wake.py
 
 Manages agent sleep/wake cycles based on configurable schedule or external triggers.
+on_sleep runs as a task of its own while the schedule keeps being checked, so long-running
+sleep work (e.g. memory consolidation) can be stopped from on_wake when wake time arrives.
+Errors raised by either callback are logged and counted; scheduling carries on.
 """
 
 import asyncio
+import logging
 from datetime import datetime, time
 from typing import Callable, Awaitable, Optional
 
+logger = logging.getLogger(__name__)
+
 class SleepWake:
     """
     Handles sleep-wake scheduling for the agent.
@@ -17,32 +23,66 @@ class SleepWake:
                  wake_time: time,
                  sleep_time: time,
                  on_wake: Callable[[], Awaitable[None]],
-                 on_sleep: Callable[[], Awaitable[None]]):
+                 on_sleep: Callable[[], Awaitable[None]],
+                 check_interval: float = 60.0):
         """
         :param wake_time: daily time to wake agent.
         :param sleep_time: daily time to put agent to sleep.
-        :param on_wake: async callback when waking.
-        :param on_sleep: async callback when sleeping.
+        :param on_wake: async callback, called at every check while awake (also while an
+            on_sleep run is still finishing).
+        :param on_sleep: async callback, started at a check while asleep unless the previous
+            run is still going.
+        :param check_interval: seconds between schedule checks.
         """
         self.wake_time = wake_time
         self.sleep_time = sleep_time
         self.on_wake = on_wake
         self.on_sleep = on_sleep
+        self.check_interval = check_interval
         self._task: Optional[asyncio.Task] = None
+        self._sleeping: Optional[asyncio.Task] = None
         self._running = False
+        self.errors = 0
+        self.last_error: Optional[BaseException] = None
+
+    def is_sleep_time(self, now: Optional[time] = None) -> bool:
+        """
+        Whether the schedule has the agent asleep at a time of day (default: now, UTC).
+        Long-running on_sleep work polls this to stop at wake time.
+        """
+        now = datetime.utcnow().time() if now is None else now
+        return not (self.wake_time <= now < self.sleep_time)
 
     async def _run(self) -> None:
         """
         Internal loop checking current time against wake/sleep schedule.
         """
         while self._running:
-            now = datetime.utcnow().time()
-            if now >= self.wake_time and now < self.sleep_time:
-                await self.on_wake()
+            if self._sleeping is not None and self._sleeping.done():
+                sleeping, self._sleeping = self._sleeping, None
+                if not sleeping.cancelled() and sleeping.exception() is not None:
+                    self._failed("on_sleep", sleeping.exception())
+            if self.is_sleep_time():
+                if self._sleeping is None:
+                    self._sleeping = asyncio.create_task(self.on_sleep())
             else:
-                await self.on_sleep()
-            # Sleep for a minute before next check
-            await asyncio.sleep(60)
+                try:
+                    await self.on_wake()
+                except Exception as exc:
+                    self._failed("on_wake", exc)
+            await asyncio.sleep(self.check_interval)
+
+    def _failed(self, callback: str, error: BaseException) -> None:
+        self.errors += 1
+        self.last_error = error
+        logger.error("SleepWake %s failed: %r", callback, error, exc_info=error)
+
+    @property
+    def sleeping(self) -> bool:
+        """
+        Whether an on_sleep run is in progress.
+        """
+        return self._sleeping is not None and not self._sleeping.done()
 
     def start(self) -> None:
         """
@@ -61,3 +101,6 @@ class SleepWake:
         if self._task:
             self._task.cancel()
             self._task = None
+        if self._sleeping:
+            self._sleeping.cancel()
+            self._sleeping = None
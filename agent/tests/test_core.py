@@ -1 +1,1191 @@
 # Core functionality tests
+
+import re
+import json
+import time
+import asyncio
+import datetime
+import threading
+import functools
+import itertools
+import types
+import concurrent.futures
+
+import pytest
+
+from agent.core.experience_synthesizer import ExperienceSynthesizer
+from agent.core.memory_consolidator import MemoryConsolidator
+from agent.memory.episodic_memory import EpisodicMemory
+from agent.memory.memory_indexer import MemoryIndexer
+from agent.memory.procedural_memory import ProceduralMemory
+from agent.memory.working_memory import WorkingMemory
+from agent.memory.reflective_memory import ReflectiveMemory
+from agent.memory.semantic_memory import SemanticMemory
+from agent.scheduler.sleep_wake import SleepWake
+from agent.infra.db import Database
+from agent.reasoning.llm_backends import (StubBackend, RecordingBackend, ReplayBackend, CassetteMiss,
+                                          create_backend)
+from agent.reasoning import llm_cache
+from agent.reasoning.llm_cache import LLMCache
+from agent.reasoning.llm_interface import LLMInterface
+from agent.reasoning.semantic_cache import SemanticCache
+from agent.reasoning.single_flight import SingleFlight
+from agent.reasoning.llm_router import LLMRouter, Route
+from agent.reasoning.evaluator import Evaluator, _parse_batch_scores
+from agent.reasoning.reasoning_chain import ReasoningChain, _action_complete
+from agent.reasoning.structured_output import StreamingJSONParser, StructuredOutputError
+from agent.reasoning.token_budget import TokenCounter, TokenUsage, PromptSection, fit_sections
+
+MESSAGES = [{"role": "user", "content": "hello"}]
+
+
+def _reply(text):
+    return lambda messages, params: text
+
+
+def _fail(messages, params):
+    raise ConnectionError("backend down")
+
+
+class _Switch:
+    """
+    Responder that fails until switched on.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.up = False
+
+    def __call__(self, messages, params):
+        if not self.up:
+            raise ConnectionError("backend down")
+        return self.text
+
+
+async def _collect(stream):
+    return "".join([chunk async for chunk in stream])
+
+
+@pytest.fixture
+def make_llm(tmp_path):
+    """
+    Factory of deterministic LLMInterfaces over a StubBackend, with a response cache on a
+    temporary database; everything is closed at teardown.
+    """
+    created = []
+
+    def make(responder=None, cache=True, **kwargs):
+        options = dict(temperature=0.0, timeout=5.0)
+        options.update(kwargs)
+        if cache:
+            options["cache"] = LLMCache(Database(str(tmp_path / f"cache{len(created)}.db")))
+        backend = options.pop("backend", None) or StubBackend(responder, **options.pop("stub", {}))
+        llm = LLMInterface(backend=backend, **options)
+        created.append(llm)
+        return llm
+
+    yield make
+    for llm in created:
+        llm.close()
+        if llm.cache is not None:
+            llm.cache.close()
+
+
+# ----------------------------------------------------------------------
+# LLMRouter
+# ----------------------------------------------------------------------
+
+def test_router_hedge_win():
+    slow = Route("slow", StubBackend(_reply("slow answer")), cost=0.1)
+    fast = Route("fast", StubBackend(_reply("fast answer")), cost=1.0)
+    router = LLMRouter([slow, fast], hedge_min_samples=3)
+    for _ in range(3):
+        slow.record(0.01, True)
+    slow.backend.latency = 1.0
+
+    started = time.monotonic()
+    text, _ = asyncio.run(router.complete(MESSAGES, {}))
+
+    assert text == "fast answer"
+    assert time.monotonic() - started < 0.5
+    assert slow.hedges == 1 and slow.hedge_wins == 1
+    assert fast.calls == 1 and slow.calls == 3  # the cancelled primary is not recorded
+
+
+def test_router_failover_after_error():
+    broken = Route("broken", StubBackend(_fail), cost=0.1)
+    backup = Route("backup", StubBackend(_reply("backup answer")), cost=1.0)
+    router = LLMRouter([broken, backup])
+
+    text, _ = asyncio.run(router.complete(MESSAGES, {}))
+
+    assert text == "backup answer"
+    assert broken.errors == 1 and backup.calls == 1
+
+
+def test_router_fast_failing_warmed_primary_fails_over():
+    primary = Route("primary", StubBackend(_fail), cost=0.1)
+    backup = Route("backup", StubBackend(_reply("backup answer")), cost=1.0)
+    router = LLMRouter([primary, backup], hedge_min_samples=3)
+    for _ in range(3):
+        primary.record(0.5, True)  # hedging is on, with a delay the failure comes well before
+
+    text, _ = asyncio.run(router.complete(MESSAGES, {}))
+
+    assert text == "backup answer"
+    assert primary.errors == 1 and primary.hedges == 0
+    assert backup.calls == 1
+
+
+def test_router_complete_failover_skips_routes_that_failed_in_a_race():
+    first = Route("first", StubBackend(_fail, latency=0.05), cost=0.1)
+    second = Route("second", StubBackend(_fail), cost=0.2)
+    third = Route("third", StubBackend(_reply("third answer")), cost=0.3)
+    router = LLMRouter([first, second, third], hedge_min_samples=1)
+    first.record(0.01, True)
+
+    text, _ = asyncio.run(router.complete(MESSAGES, {}))
+
+    assert text == "third answer"
+    assert first.hedges == 1 and second.errors == 1 and third.calls == 1
+
+
+def test_router_stream_failover_skips_routes_that_failed_in_a_race():
+    first = Route("first", StubBackend(_fail, latency=0.05), cost=0.1)
+    second = Route("second", StubBackend(_fail), cost=0.2)
+    third = Route("third", StubBackend(_reply("third answer")), cost=0.3)
+    router = LLMRouter([first, second, third], hedge_min_samples=1)
+    first.record(0.01, True, first_chunk=0.01)
+
+    text = asyncio.run(_collect(router.stream(MESSAGES, {})))
+
+    assert text == "third answer"
+    assert first.hedges == 1
+    assert second.errors == 1  # raced once as the backup, not retried afterwards
+    assert third.calls == 1
+
+
+def test_router_stream_feeds_latency_percentiles():
+    route = Route("only", StubBackend(_reply("a streamed answer"), chunk_size=4))
+    router = LLMRouter([route])
+
+    asyncio.run(_collect(router.stream(MESSAGES, {})))
+
+    assert route.samples == 1 and route.first_chunk_samples == 1
+    assert route.p50 is not None and route.p95 is not None
+
+
+def test_router_breaker_opens_and_closes():
+    switch = _Switch("primary answer")
+    primary = Route("primary", StubBackend(switch), cost=0.1)
+    backup = Route("backup", StubBackend(_reply("backup answer")), cost=1.0)
+    router = LLMRouter([primary, backup], breaker_min_calls=3, breaker_cooldown=0.05)
+
+    for _ in range(3):
+        assert asyncio.run(router.complete(MESSAGES, {}))[0] == "backup answer"
+    assert primary.errors == 3
+
+    # Open: the primary is passed over without being called
+    assert [r.name for r in router.ranked()] == ["backup", "primary"]
+    assert primary.stats()["breaker"] == "open"
+    asyncio.run(router.complete(MESSAGES, {}))
+    assert primary.calls == 3
+
+    # Half-open: after the cooldown one probe goes through and closes the breaker on success
+    switch.up = True
+    time.sleep(0.06)
+    assert asyncio.run(router.complete(MESSAGES, {}))[0] == "primary answer"
+    assert primary.stats()["breaker"] == "closed"
+    assert primary.error_rate == 0.0
+    assert [r.name for r in router.ranked()] == ["primary", "backup"]
+
+
+def test_router_failed_probe_reopens_breaker():
+    primary = Route("primary", StubBackend(_fail), cost=0.1)
+    backup = Route("backup", StubBackend(_reply("backup answer")), cost=1.0)
+    router = LLMRouter([primary, backup], breaker_min_calls=2, breaker_cooldown=0.05)
+    for _ in range(2):
+        asyncio.run(router.complete(MESSAGES, {}))
+    router.ranked()
+    assert primary.breaker_opened is not None
+
+    time.sleep(0.06)
+    assert asyncio.run(router.complete(MESSAGES, {}))[0] == "backup answer"
+    assert primary.errors == 3
+    assert [r.name for r in router.ranked()] == ["backup", "primary"]
+
+
+# ----------------------------------------------------------------------
+# StreamingJSONParser
+# ----------------------------------------------------------------------
+
+def _parse_in_chunks(text, cuts):
+    """
+    Feed text split at the given offsets; return (fields in completion order, final object).
+    """
+    parser = StreamingJSONParser()
+    completed = []
+    bounds = [0] + list(cuts) + [len(text)]
+    for start, end in zip(bounds, bounds[1:]):
+        completed.extend(parser.feed(text[start:end]))
+    return completed, parser.close()
+
+
+def _every_split(text):
+    """
+    Parse text split once at every offset and check each result against json.loads.
+    """
+    expected = json.loads(text)
+    for cut in range(len(text) + 1):
+        completed, result = _parse_in_chunks(text, [cut])
+        assert result == expected, cut
+        assert completed == list(expected.items()), cut
+
+
+def test_parser_string_split_across_chunks():
+    _every_split('{"greeting": "hello, world", "quote": "she said \\"hi\\"", "path": "C:\\\\tmp\\\\"}')
+
+
+def test_parser_unicode_escape_split_mid_sequence():
+    text = '{"word": "caf\\u00e9", "pair": "\\ud83d\\ude00"}'
+    _every_split(text)
+    completed, result = _parse_in_chunks(text, [14, 15, 16, 17])  # inside \u00e9
+    assert result == {"word": "café", "pair": "😀"}
+
+
+def test_parser_nested_arrays_and_objects():
+    text = '{"a": [1, [2, 3], {"b": [4, {"c": "]}"}]}], "d": {"e": {"f": []}}, "g": true, "h": null, "i": -1.5e3}'
+    _every_split(text)
+    parser = StreamingJSONParser()
+    fields = [f for c in text for f in parser.feed(c)]
+    assert [k for k, _ in fields] == ["a", "d", "g", "h", "i"]
+    assert parser.done
+
+
+def test_parser_emits_fields_as_soon_as_complete():
+    parser = StreamingJSONParser()
+    assert parser.feed('```json\n{"first": [1, 2]') == []
+    assert parser.feed(', "second"') == [("first", [1, 2])]
+    assert parser.feed(': 42') == []
+    assert parser.feed('}\n```') == [("second", 42)]
+    assert parser.close() == {"first": [1, 2], "second": 42}
+
+
+def test_parser_empty_object():
+    assert _parse_in_chunks("{}", [1]) == ([], {})
+
+
+@pytest.mark.parametrize("text", [
+    '{"a" 1}',              # missing colon
+    '{"a": 1,, "b": 2}',    # double comma
+    '{"a": 1, }',           # trailing comma
+    '{a: 1}',               # unquoted key
+    '{"a": @}',             # not a value
+    '{"a": 1 "b": 2}',      # missing comma
+    '{"a": [1}, "b": 2}',   # mismatched brackets
+    '{"a": tru}',           # bad literal
+])
+def test_parser_rejects_malformed_input(text):
+    parser = StreamingJSONParser()
+    with pytest.raises(StructuredOutputError):
+        for c in text:
+            parser.feed(c)
+        parser.close()
+
+
+def test_parser_fails_early_without_waiting_for_the_end():
+    parser = StreamingJSONParser()
+    parser.feed('{"a": 1')
+    with pytest.raises(StructuredOutputError):
+        parser.feed(' x')
+
+
+def test_parser_rejects_unclosed_object_and_missing_object():
+    parser = StreamingJSONParser()
+    parser.feed('{"a": "unterminated')
+    with pytest.raises(StructuredOutputError):
+        parser.close()
+    with pytest.raises(StructuredOutputError):
+        StreamingJSONParser(max_preamble=10).feed("no json in this response at all")
+
+
+# ----------------------------------------------------------------------
+# MemoryConsolidator
+# ----------------------------------------------------------------------
+
+def _timeline(events=60):
+    episodic = EpisodicMemory(segment_size=20)
+    for i in range(events):
+        episodic.add_event(f"step {i} touched the {('parser', 'router', 'cache')[i % 3]} module",
+                           {"type": ("tool", "chat")[i % 2], "module": ("parser", "router", "cache")[i % 3]})
+    return episodic
+
+
+def _synthesizer(episodic=None):
+    return ExperienceSynthesizer(episodic or _timeline(), SemanticMemory(), ReflectiveMemory())
+
+
+def _memory_state(synthesizer):
+    return (sorted(e["insight"] for e in synthesizer.reflective.get_recent(1000)),
+            sorted(map(repr, synthesizer.semantic.all_facts())))
+
+
+def test_consolidation_resumes_from_checkpoint_after_interruption(tmp_path):
+    options = dict(batch_size=10, fanout=3, keep_recent=0, promote_after=2)
+    timeline = _timeline()
+    reference = _synthesizer(timeline)
+    MemoryConsolidator(reference, str(tmp_path / "reference.json"), **options).run()
+    assert reference.semantic.all_facts()
+
+    synthesizer = _synthesizer(timeline)
+    checkpoint = str(tmp_path / "consolidation.json")
+    batches = []
+    first = MemoryConsolidator(synthesizer, checkpoint, should_stop=lambda: len(batches) >= 2, **options)
+    original_step = first.step
+    first.step = lambda: batches.append(1) or original_step()
+    report = first.run()
+    assert report["interrupted"] and report["cursor"] == 20 and report["pending"] == 4
+
+    # A fresh instance (e.g. after a restart) picks up at the checkpointed cursor
+    resumed = MemoryConsolidator(synthesizer, checkpoint, **options)
+    assert resumed.state["cursor"] == 20
+    report = resumed.run()
+    assert not report["interrupted"] and report["batches"] == 4 and report["cursor"] == 60
+    assert _memory_state(synthesizer) == _memory_state(reference)
+
+
+def test_consolidation_rerun_batch_after_crash_is_idempotent(tmp_path):
+    options = dict(batch_size=10, fanout=3, keep_recent=0, promote_after=2)
+    timeline = _timeline()
+    reference = _synthesizer(timeline)
+    MemoryConsolidator(reference, str(tmp_path / "reference.json"), **options).run()
+    assert reference.semantic.all_facts()
+
+    synthesizer = _synthesizer(timeline)
+    checkpoint = tmp_path / "consolidation.json"
+    consolidator = MemoryConsolidator(synthesizer, str(checkpoint), **options)
+    consolidator.run(max_batches=2)
+    saved = checkpoint.read_text()
+    consolidator.step()  # its writes land, then the process dies before the next checkpoint
+    checkpoint.write_text(saved)
+
+    report = MemoryConsolidator(synthesizer, str(checkpoint), **options).run()
+    assert report["cursor"] == 60
+    assert _memory_state(synthesizer) == _memory_state(reference)
+
+
+def test_sleep_wake_stops_consolidation_at_wake_time(tmp_path):
+    synthesizer = _synthesizer()
+    reindexed = []
+    consolidator = MemoryConsolidator(synthesizer, str(tmp_path / "consolidation.json"),
+                                      reindex=lambda: reindexed.append(threading.current_thread()),
+                                      batch_size=1, keep_recent=0)
+    describe = synthesizer.describe
+
+    def slow_describe(*args, **kwargs):
+        time.sleep(0.005)
+        return describe(*args, **kwargs)
+
+    synthesizer.describe = slow_describe
+    schedule = {"asleep": True}
+    woken = []
+
+    async def on_wake():
+        woken.append(sleep_wake.sleeping)
+        consolidator.stop()
+
+    sleep_wake = SleepWake(datetime.time(0), datetime.time(0), on_wake, consolidator.on_sleep, check_interval=0.01)
+    sleep_wake.is_sleep_time = lambda now=None: schedule["asleep"]
+
+    async def scenario():
+        sleep_wake.start()
+        await asyncio.sleep(0.05)
+        schedule["asleep"] = False
+        await asyncio.sleep(0.05)
+        sleep_wake.stop()
+
+    asyncio.run(scenario())
+    assert woken and woken[0] is True  # on_wake ran while consolidation was in progress
+    assert 0 < consolidator.state["cursor"] < 60
+    assert reindexed == []  # an interrupted run leaves the reindex to the next one
+
+    consolidator.synthesizer.describe = describe
+    asyncio.run(consolidator.on_sleep())
+    assert consolidator.state["cursor"] == 60
+    assert len(reindexed) == 1 and reindexed[0] is threading.main_thread()
+
+
+def test_on_sleep_reindexes_on_the_loop_while_events_are_written(tmp_path):
+    episodic = _timeline()
+    stores = (episodic, SemanticMemory(), ProceduralMemory(), WorkingMemory(), ReflectiveMemory())
+    embedding, release = threading.Event(), threading.Event()
+    readers = set()
+
+    def embed(text):
+        embedding.set()
+        assert release.wait(5)
+        return [float(len(text)), float(sum(map(ord, text)) % 97), 1.0]
+
+    get_event = episodic.get_event
+
+    def tracked_get_event(index):
+        readers.add(threading.current_thread())
+        return get_event(index)
+
+    episodic.get_event = tracked_get_event
+    indexer = MemoryIndexer(embed, str(tmp_path / "index"), background_compaction=False)
+    synthesizer = ExperienceSynthesizer(episodic, stores[1], stores[4])
+    consolidator = MemoryConsolidator(synthesizer, str(tmp_path / "consolidation.json"),
+                                      reindex=functools.partial(indexer.abuild_index, *stores),
+                                      batch_size=20, keep_recent=0)
+
+    async def scenario():
+        sleeping = asyncio.create_task(consolidator.on_sleep())
+        for _ in range(5000):
+            if embedding.is_set():
+                break
+            await asyncio.sleep(0.001)
+        assert embedding.is_set()
+        for i in range(5):  # the agent keeps writing while the reindex embeds
+            episodic.add_event(f"written during reindex {i}")
+            await asyncio.sleep(0)
+        release.set()
+        await sleeping
+
+    asyncio.run(scenario())
+    assert consolidator.state["indexed"] == 60
+    assert readers == {threading.main_thread()}
+    indexer.build_index(*stores)
+    assert {f"episodic:{i}" for i in range(len(episodic))} <= set(indexer._index.ids)
+    assert len(episodic) == 65
+
+
+
+def test_sleep_wake_survives_callback_errors(caplog):
+    calls = {"sleep": 0, "wake": 0}
+    schedule = {"asleep": True}
+
+    async def on_sleep():
+        calls["sleep"] += 1
+        if calls["sleep"] == 1:
+            raise RuntimeError("reindex failed")
+
+    async def on_wake():
+        calls["wake"] += 1
+        raise ValueError("wake failed")
+
+    sleep_wake = SleepWake(datetime.time(0), datetime.time(0), on_wake, on_sleep, check_interval=0.005)
+    sleep_wake.is_sleep_time = lambda now=None: schedule["asleep"]
+
+    async def scenario():
+        sleep_wake.start()
+        await asyncio.sleep(0.05)
+        schedule["asleep"] = False
+        await asyncio.sleep(0.03)
+        assert sleep_wake._task is not None and not sleep_wake._task.done()
+        sleep_wake.stop()
+
+    asyncio.run(scenario())
+    assert calls["sleep"] >= 2  # started again after the failed run
+    assert calls["wake"] >= 2
+    assert sleep_wake.errors == 1 + calls["wake"]
+    assert isinstance(sleep_wake.last_error, ValueError)
+    assert "on_sleep failed" in caplog.text
+
+# ----------------------------------------------------------------------
+# Streaming (user-007)
+# ----------------------------------------------------------------------
+
+def test_stream_stopped_by_until_is_not_cached(make_llm):
+    llm = make_llm(_reply("Thought: a\nAction: b\nObservation: c"), stub={"chunk_size": 4})
+
+    async def scenario():
+        streamed = await _collect(llm.astream("p", until=lambda text: "Action:" in text))
+        return streamed, await llm.agenerate("p")
+
+    streamed, generated = asyncio.run(scenario())
+    assert streamed.startswith("Thought: a\nAction:") and "Observation" not in streamed
+    assert generated == "Thought: a\nAction: b\nObservation: c"
+    assert llm.backend.calls == 2
+
+
+def test_stream_closed_by_consumer_is_not_cached(make_llm):
+    llm = make_llm(_reply("x" * 64), stub={"chunk_size": 4, "latency": 0.01})
+
+    async def scenario():
+        stream = llm.astream("p")
+        first = await stream.__anext__()
+        await stream.aclose()
+        return first, await llm.agenerate("p")
+
+    first, generated = asyncio.run(scenario())
+    assert first == "xxxx" and generated == "x" * 64
+
+
+def test_complete_stream_is_cached(make_llm):
+    llm = make_llm(_reply("full answer"), stub={"chunk_size": 3})
+    assert llm.stream("p") == "full answer"
+    assert llm.generate("p") == "full answer"
+    assert llm.backend.calls == 1
+
+
+# ----------------------------------------------------------------------
+# SemanticCache (user-003)
+# ----------------------------------------------------------------------
+
+def _bag_of_words(text, dim=64):
+    """
+    Deterministic bag-of-words embedding: similar wording gives similar vectors.
+    """
+    vector = [0.0] * dim
+    for word in text.split():
+        vector[sum(map(ord, word)) % dim] += 1.0
+    return vector
+
+
+def test_semantic_cache_masks_timestamps_and_ids():
+    cache = SemanticCache(_bag_of_words, call_sites={"site": None})
+    _, probe = cache.lookup("site", "m", "Report at 2026-10-18T10:00:00Z for run 123e4567-e89b-12d3-a456-426614174000")
+    cache.store("site", "m", "the report", probe)
+    hit, _ = cache.lookup("site", "m", "report at 2026-10-19 11:30:05 for  run 00000000-0000-0000-0000-000000000001")
+    assert hit == "the report"
+    assert cache.lookup("site", "other-model", "report at 2026-10-19 11:30:05 for run x")[0] is None
+    assert cache.stats()["site"]["hits"] == 1 and cache.stats()["site"]["lookups"] == 3
+
+
+def test_semantic_cache_prompts_differing_in_a_number_do_not_share_an_answer():
+    cache = SemanticCache(_bag_of_words, threshold=0.5, call_sites={"site": None})
+    _, probe = cache.lookup("site", "m", "summarize the last 5 posts")
+    cache.store("site", "m", "five posts", probe)
+    assert cache.normalize("summarize the last 5 posts")[0] == cache.normalize("summarize the last 50 posts")[0]
+    assert cache.lookup("site", "m", "summarize the last 50 posts")[0] is None
+    assert cache.lookup("site", "m", "summarize the last 5 posts on 2026-01-02")[0] is None
+    assert cache.lookup("site", "m", "Summarize   the last 5 posts")[0] == "five posts"
+
+
+def test_semantic_cache_threshold_and_opt_in():
+    cache = SemanticCache(_bag_of_words, threshold=0.99)
+    assert not cache.enabled("site") and not cache.enabled(None)
+    cache.opt_in("site", threshold=0.7)
+    _, probe = cache.lookup("site", "m", "list the open issues in the tracker")
+    cache.store("site", "m", "issues", probe)
+    assert cache.lookup("site", "m", "list the open issues in the bug tracker")[0] == "issues"
+    assert cache.lookup("site", "m", "write a poem about autumn leaves")[0] is None
+    cache.opt_out("site")
+    assert not cache.enabled("site")
+
+
+def test_llm_semantic_cache_keeps_numbers_apart(make_llm):
+    llm = make_llm(lambda messages, params: f"answer to {messages[-1]['content']}", cache=False)
+    llm.semantic_cache = SemanticCache(_bag_of_words, threshold=0.5, call_sites={"site": None})
+    assert llm.generate("summarize the last 5 posts", call_site="site") == "answer to summarize the last 5 posts"
+    assert llm.generate("summarize the last 50 posts", call_site="site") == "answer to summarize the last 50 posts"
+    assert llm.generate("summarize the last 5 posts ", call_site="site") == "answer to summarize the last 5 posts"
+    assert llm.backend.calls == 2
+
+
+# ----------------------------------------------------------------------
+# LLMInterface async API (user-001)
+# ----------------------------------------------------------------------
+
+class _Tracking(StubBackend):
+    """
+    StubBackend echoing the prompt that records how many completions run at once and how
+    many were cancelled.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(lambda messages, params: f"re: {messages[-1]['content']}", **kwargs)
+        self.active = 0
+        self.peak = 0
+        self.cancelled = 0
+
+    async def complete(self, messages, params, call_site=None):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            return await super().complete(messages, params, call_site)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        finally:
+            self.active -= 1
+
+
+def test_agenerate_many_keeps_order_within_the_in_flight_limit(make_llm):
+    backend = _Tracking(latency=0.02)
+    llm = make_llm(backend=backend, cache=False, max_in_flight=3)
+    prompts = [f"q{i}" for i in range(10)]
+
+    started = time.monotonic()
+    answers = asyncio.run(llm.agenerate_many(prompts))
+
+    assert answers == [f"re: q{i}" for i in range(10)]
+    assert backend.peak == 3
+    assert time.monotonic() - started < 10 * 0.02  # four waves, not ten sequential calls
+
+
+def test_agenerate_many_returns_or_raises_exceptions(make_llm):
+    def responder(messages, params):
+        if messages[-1]["content"] == "bad":
+            raise ValueError("bad prompt")
+        return "ok"
+
+    llm = make_llm(responder, cache=False)
+    results = asyncio.run(llm.agenerate_many(["a", "bad", "b"], return_exceptions=True))
+    assert results[0] == results[2] == "ok" and isinstance(results[1], ValueError)
+    with pytest.raises(ValueError):
+        llm.generate_many(["a", "bad"])
+
+
+def test_sync_threads_and_other_event_loops_share_one_io_loop(make_llm):
+    llm = make_llm(backend=_Tracking(), cache=False)
+    assert llm.generate("a") == "re: a"
+    io = llm._io
+
+    async def from_another_loop():
+        return await llm.agenerate("b")
+
+    assert asyncio.run(from_another_loop()) == "re: b"
+    with concurrent.futures.ThreadPoolExecutor(4) as pool:
+        assert list(pool.map(llm.generate, ["c", "d", "e"])) == ["re: c", "re: d", "re: e"]
+    assert llm._io is io
+
+
+def test_timeouts_and_cancelled_callers_cancel_the_request(make_llm):
+    backend = _Tracking(latency=1.0)
+    llm = make_llm(backend=backend, cache=False)
+
+    with pytest.raises(asyncio.TimeoutError):
+        llm.generate("slow", timeout=0.02)
+
+    async def impatient():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(llm.agenerate("slower", timeout=5.0), 0.02)
+
+    asyncio.run(impatient())
+    deadline = time.monotonic() + 1.0
+    while backend.cancelled < 2 and time.monotonic() < deadline:
+        time.sleep(0.005)
+    assert backend.cancelled == 2 and backend.active == 0
+
+
+# ----------------------------------------------------------------------
+# LLMCache (user-002)
+# ----------------------------------------------------------------------
+
+@pytest.fixture
+def clock(monkeypatch):
+    """
+    Settable wall clock for llm_cache.
+    """
+    now = {"t": 1000.0}
+    monkeypatch.setattr(llm_cache, "time", types.SimpleNamespace(time=lambda: now["t"]))
+    return now
+
+
+def test_llm_cache_persists_across_reopen(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = LLMCache(Database(path))
+    key = LLMCache.make_key("m", MESSAGES, 0.0, None, 16)
+    cache.put(key, "cached answer", model="m")
+    cache.close()
+    cache.db.close()
+
+    reopened = LLMCache(Database(path))
+    assert reopened.get(key) == "cached answer"
+    assert reopened.get(LLMCache.make_key("m", MESSAGES, 0.0, None, 32)) is None  # other max_tokens
+    assert reopened.stats()["size"] == 1 and reopened.stats()["hit_ratio"] == 0.5
+    reopened.close()
+
+
+def test_llm_cache_ttl_expiry(tmp_path, clock):
+    cache = LLMCache(Database(str(tmp_path / "cache.db")), ttl=None)
+    cache.put("short", "a", ttl=5)
+    cache.put("long", "b", ttl=60)
+    cache.put("forever", "c")
+    clock["t"] += 10
+    assert cache.get("short") is None and cache.get("long") == "b"
+    clock["t"] += 100
+    assert cache.purge_expired() == 1
+    assert cache.get("long") is None and cache.get("forever") == "c"
+    assert cache.stats()["expirations"] == 2 and cache.stats()["size"] == 1
+    cache.close()
+
+
+def test_llm_cache_evicts_least_recently_used_including_buffered_hits(tmp_path, clock):
+    cache = LLMCache(Database(str(tmp_path / "cache.db")), max_entries=3, touch_batch=100)
+    for key in ("a", "b", "c"):
+        clock["t"] += 1
+        cache.put(key, key.upper())
+    clock["t"] += 1
+    assert cache.get("a") == "A"  # buffered access time, written before the eviction
+    clock["t"] += 1
+    cache.put("d", "D")
+    assert cache.get("b") is None
+    assert [cache.get(k) for k in ("a", "c", "d")] == ["A", "C", "D"]
+    assert cache.stats()["evictions"] == 1 and cache.stats()["size"] == 3
+    cache.close()
+
+
+def test_llm_interface_caches_deterministic_calls_by_default(make_llm):
+    counter = {"n": 0}
+
+    def responder(messages, params):
+        counter["n"] += 1
+        return f"answer {counter['n']}"
+
+    llm = make_llm(responder)
+    assert llm.generate("p") == llm.generate("p") == "answer 1"
+    assert llm.generate("p", temperature=0.7) == "answer 2"  # sampled: not cached
+    assert llm.generate("p", temperature=0.7) == "answer 3"
+    assert llm.generate("p", temperature=0.7, cache=True) == "answer 4"
+    assert llm.generate("p", temperature=0.7, cache=True) == "answer 4"
+    assert llm.generate("p", cache=False) == "answer 5"
+    assert llm.cache.stats()["hits"] == 2
+
+
+# ----------------------------------------------------------------------
+# Evaluator batched scoring (user-004)
+# ----------------------------------------------------------------------
+
+SCORES = {"alpha": 0.2, "beta": 0.9, "gamma": 0.5, "delta": 0.7, "epsilon": 0.1, "zeta": 0.6, "eta": 0.4}
+
+
+def _scorer(skip=()):
+    """
+    Responder scoring items from SCORES; batched answers leave out the items in skip.
+    """
+    def respond(messages, params):
+        prompt = messages[-1]["content"]
+        if prompt.startswith("Evaluate each"):
+            return "\n".join(f"{number}: {SCORES[item]}"
+                             for number, item in re.findall(r"\[(\d+)\] (\w+)", prompt) if item not in skip)
+        return f"Score: {SCORES[prompt.split()[-1]]}"
+    return respond
+
+
+def test_parse_batch_scores_formats():
+    assert _parse_batch_scores("1: 0.8\n2) 7/10\nItem 3 - 80%\n[4] score: 1", 4) == {0: 0.8, 1: 0.7, 2: 0.8, 3: 1.0}
+    assert _parse_batch_scores("Scores: [0.1, 0.5, 0.9]", 3) == {0: 0.1, 1: 0.5, 2: 0.9}
+    assert _parse_batch_scores('{"1": 0.3, "3": "60%"}', 3) == {0: 0.3, 2: 0.6}
+    assert _parse_batch_scores("1: 4.5\n9: 0.5", 2) == {}  # out of range score and item number
+
+
+def test_rank_batch_scores_in_chunks_and_rescores_missed_items(make_llm):
+    llm = make_llm(_scorer(skip={"gamma"}), cache=False)
+    evaluator = Evaluator(llm)
+    items = list(SCORES)
+
+    ranked = evaluator.rank(items, strategy="batch", batch_size=3)
+
+    assert [r["item"] for r in ranked] == sorted(items, key=SCORES.get, reverse=True)
+    assert [r["score"] for r in ranked] == sorted(SCORES.values(), reverse=True)
+    assert llm.backend.calls == 3 + 1  # three batches, then gamma on its own
+    assert evaluator.rank(items, strategy="batch", top_k=2) == ranked[:2]
+
+
+def test_rank_pointwise_and_batch_agree(make_llm):
+    evaluator = Evaluator(make_llm(_scorer(), cache=False))
+    items = list(SCORES)
+    assert evaluator.rank(items) == evaluator.rank(items, strategy="batch", batch_size=4)
+    with pytest.raises(ValueError):
+        evaluator.rank(items, strategy="unknown")
+
+
+# ----------------------------------------------------------------------
+# Evaluator tournament ranking (user-005)
+# ----------------------------------------------------------------------
+
+def _judge(messages, params):
+    """
+    Pairwise responder preferring the item with the higher number.
+    """
+    a, b = re.findall(r"item-(\d+)", messages[-1]["content"])
+    return "A" if int(a) > int(b) else "B"
+
+
+def test_tournament_full_ranking(make_llm):
+    evaluator = Evaluator(make_llm(_judge, cache=False))
+    items = [f"item-{n}" for n in (5, 12, 1, 9, 3, 14, 7, 0, 11)]
+
+    ranked = evaluator.rank(items, strategy="tournament")
+
+    assert [r["item"] for r in ranked] == sorted(items, key=lambda i: -int(i.split("-")[1]))
+    assert [r["rank"] for r in ranked] == list(range(1, 10))
+    assert ranked[0]["score"] == 1.0 and ranked[-1]["score"] == 0.0
+
+
+def test_tournament_top_k_stops_early(make_llm):
+    llm = make_llm(_judge, cache=False)
+    items = [f"item-{n}" for n in range(16)]
+
+    winner = Evaluator(llm).rank(items, strategy="tournament", top_k=1)
+    assert [r["item"] for r in winner] == ["item-15"]
+    assert llm.backend.calls == 15  # a single knockout
+
+    calls = llm.backend.calls
+    top3 = Evaluator(llm).rank(items, strategy="tournament", top_k=3)
+    assert [r["item"] for r in top3] == ["item-15", "item-14", "item-13"]
+    assert llm.backend.calls - calls <= 15 + 2 * 4  # n - 1 plus about log2(n) per further place
+
+
+def test_tournament_comparisons_are_memoized_per_unordered_pair(make_llm):
+    llm = make_llm(_judge, cache=False)
+    evaluator = Evaluator(llm)
+    items = [f"item-{n}" for n in (4, 2, 8, 6)]
+
+    first = evaluator.rank(items, strategy="tournament")
+    calls = llm.backend.calls
+    assert evaluator.rank(list(reversed(items)), strategy="tournament") == first
+    assert llm.backend.calls == calls
+    assert asyncio.run(evaluator.acompare("item-2", "item-4")) is False
+    assert asyncio.run(evaluator.acompare("item-4", "item-2")) is True
+    assert llm.backend.calls == calls
+    assert evaluator.comparison_stats["cached"] == evaluator.comparison_stats["requested"] - calls
+
+
+# ----------------------------------------------------------------------
+# Tree of thoughts (user-006)
+# ----------------------------------------------------------------------
+
+class _LastStepScorer:
+    """
+    Evaluator stand-in scoring a reasoning path by the number in its last step.
+    """
+
+    def __init__(self):
+        self.batches = 0
+
+    async def ascore_many(self, items, batch_size=None):
+        self.batches += 1
+        return [int(re.findall(r"\d+", item)[-1]) / 100 for item in items]
+
+
+def _ideas():
+    numbers = itertools.count(1)
+    return lambda messages, params: f"idea {next(numbers)}"
+
+
+def test_tree_of_thoughts_keeps_the_best_beam_per_level(make_llm):
+    llm = make_llm(_ideas(), cache=False, temperature=0.7)
+    scorer = _LastStepScorer()
+
+    result = ReasoningChain(llm, scorer).tree_of_thoughts("p", depth=2, width=3, beam=2)
+
+    tree = result["tree"]
+    assert len(tree) == 1 + 3 + 2 * 3 and llm.backend.calls == 9
+    assert scorer.batches == 2  # one batched scoring pass per level
+    level1 = [n for n in tree if n["depth"] == 1]
+    kept = {n["id"] for n in level1 if not n["pruned"]}
+    assert len(kept) == 2 and all(n["parent"] in kept for n in tree if n["depth"] == 2)
+    assert sorted(n["score"] for n in level1 if n["pruned"]) < sorted(n["score"] for n in level1 if not n["pruned"])
+    assert sum(n["pruned"] for n in tree if n["depth"] == 2) == 4
+    assert result["solution"].endswith("idea 9") and result["score"] == 0.09
+    assert result["stop_reason"] == "depth"
+
+
+def test_tree_of_thoughts_drops_duplicate_thoughts(make_llm):
+    llm = make_llm(_reply("the same idea 1"), cache=False, temperature=0.7)
+    result = ReasoningChain(llm, _LastStepScorer()).tree_of_thoughts("p", depth=2, width=3)
+    assert [n["depth"] for n in result["tree"]] == [0, 1, 2]
+    assert result["solution"] == "the same idea 1"  # the deeper node scores no better
+
+
+def test_tree_of_thoughts_respects_budgets(make_llm):
+    llm = make_llm(_ideas(), cache=False, temperature=0.7, max_tokens=16)
+    result = ReasoningChain(llm, _LastStepScorer()).tree_of_thoughts("p", depth=5, width=3, token_budget=400)
+    assert result["stop_reason"] == "tokens" and result["tokens_used"] <= 400
+    assert result["solution"] is not None
+
+    slow = make_llm(_ideas(), cache=False, temperature=0.7, stub={"latency": 0.5})
+    result = ReasoningChain(slow, _LastStepScorer()).tree_of_thoughts("p", time_budget=0.05)
+    assert result["stop_reason"] == "time" and result["solution"] is None
+
+
+# ----------------------------------------------------------------------
+# ReAct loop (user-007)
+# ----------------------------------------------------------------------
+
+class _Chunks(StubBackend):
+    """
+    StubBackend counting the chunks its streams deliver.
+    """
+
+    def __init__(self, responder, **kwargs):
+        super().__init__(responder, **kwargs)
+        self.streamed = 0
+
+    async def stream(self, messages, params, call_site=None):
+        async for chunk in super().stream(messages, params, call_site):
+            self.streamed += 1
+            yield chunk
+
+
+def test_react_stops_streaming_once_the_action_is_settled(make_llm):
+    answer = "Thought: go outside\nAction: walk\n"
+    backend = _Chunks(_reply(answer + "Observation: " + "x" * 400), chunk_size=8)
+    llm = make_llm(backend=backend, cache=False)
+
+    result = ReasoningChain(llm, None).react("It is sunny.", ["walk", "drive"])
+
+    assert result["action"] == "walk" and result["stop_reason"] == "action"
+    step = result["trace"][0]
+    assert step["thought"] == "go outside" and step["observation"] is None
+    assert step["first_token_latency"] is not None and step["tokens"] > 0
+    assert backend.streamed <= len(answer) // 8 + 1
+
+
+def test_react_feeds_back_an_observation_for_an_unknown_action(make_llm):
+    def responder(messages, params):
+        if "Observation:" in messages[-1]["content"]:
+            return "Thought: walking it is\nAction: Walk.\n"
+        return "Thought: fastest\nAction: fly\n"
+
+    llm = make_llm(responder, cache=False)
+    result = ReasoningChain(llm, None).react("Get to town.", ["walk", "drive"])
+
+    assert result["action"] == "walk"
+    assert [s["action"] for s in result["trace"]] == [None, "walk"]
+    assert "'fly' is not an available action" in result["trace"][0]["observation"]
+
+
+def test_react_budgets(make_llm):
+    llm = make_llm(_reply("Thought: hmm\nAction: wait\n"), cache=False)
+    chain = ReasoningChain(llm, None)
+
+    result = chain.react("p", ["go"], max_steps=2, token_budget=None)
+    assert result["stop_reason"] == "max_steps" and len(result["trace"]) == 2
+    assert result["trace"][0]["observation"].startswith("'wait' is not")
+
+    result = chain.react("p", ["go"], max_steps=5, token_budget=10)
+    assert result["stop_reason"] == "tokens" and len(result["trace"]) == 1
+
+    slow = make_llm(_reply("Thought: hmm\nAction: go\n"), cache=False, stub={"latency": 0.5})
+    result = ReasoningChain(slow, None).react("p", ["go"], time_budget=0.05)
+    assert result["stop_reason"] == "time" and result["action"] is None
+
+
+def test_action_line_settles_only_when_unambiguous():
+    settled = _action_complete(["search", "search_web", "stop"])
+    assert not settled("Thought: look it up")
+    assert not settled("Thought: x\nAction: search")  # may still become search_web
+    assert settled("Thought: x\nAction: search\n")
+    assert settled("Thought: x\nAction: search_web")
+    assert settled("Thought: x\nAction: stop")
+
+
+# ----------------------------------------------------------------------
+# Token budget and usage accounting (user-008)
+# ----------------------------------------------------------------------
+
+def test_token_usage_per_call_site_and_tick():
+    usage = TokenUsage()
+    usage.record("plan", prompt_tokens=10, completion_tokens=5)
+    usage.record("plan", cache_hit=True, trimmed_tokens=3)
+    usage.record(None, prompt_tokens=1, coalesced=True)
+
+    snapshot = usage.snapshot()
+    plan = snapshot["by_call_site"]["plan"]
+    assert (plan["calls"], plan["cache_hits"], plan["prompt_tokens"], plan["completion_tokens"],
+            plan["trimmed_tokens"]) == (2, 1, 10, 5, 3)
+    assert snapshot["by_call_site"]["default"]["coalesced"] == 1
+    assert snapshot["total"]["calls"] == snapshot["tick_total"]["calls"] == 3
+
+    finished = usage.start_tick()
+    assert finished["plan"]["calls"] == 2
+    usage.record("plan", prompt_tokens=2)
+    snapshot = usage.snapshot()
+    assert snapshot["tick_count"] == 1
+    assert snapshot["tick_total"]["prompt_tokens"] == 2 and snapshot["total"]["prompt_tokens"] == 13
+
+
+def test_fit_sections_trims_lowest_priority_first():
+    counter = TokenCounter()
+    system = PromptSection("You are a careful planner.", priority=10, name="system",
+                           min_tokens=counter.count("You are a careful planner."))
+    history = PromptSection("old turn " * 200, priority=0, name="history", keep="tail")
+    task = PromptSection("Task: book a flight. " * 10, priority=5, name="task", min_tokens=20)
+    sections = [system, history, task]
+
+    prompt, removed = asyncio.run(fit_sections(sections, 10000, counter))
+    assert removed == 0 and prompt == "\n\n".join(s.text for s in sections)
+
+    prompt, removed = asyncio.run(fit_sections(sections, 80, counter))
+    assert counter.count(prompt) <= 80 and removed > 0
+    assert prompt.startswith(system.text) and prompt.endswith(task.text)
+
+    # History is dropped entirely, the task shrinks to min_tokens, the system section stays
+    prompt, removed = asyncio.run(fit_sections(sections, 20, counter))
+    head, tail = prompt.split("\n\n")
+    assert head == system.text and tail.startswith("Task:") and abs(counter.count(tail) - task.min_tokens) <= 1
+
+
+def test_fit_sections_summarizes_flagged_sections():
+    counter = TokenCounter()
+    requests = []
+
+    async def summarizer(text, target):
+        requests.append(target)
+        return "summary of the notes"
+
+    notes = PromptSection("note " * 400, name="notes", summarize=True)
+    prompt, removed = asyncio.run(fit_sections([PromptSection("Question?", priority=1), notes],
+                                               100, counter, summarizer))
+    assert prompt == "Question?\n\nsummary of the notes"
+    assert len(requests) == 1 and 0 < requests[0] < counter.count(notes.text)
+    assert removed == counter.count(notes.text) - counter.count("summary of the notes")
+
+
+def test_interface_enforces_the_prompt_budget_and_records_usage(make_llm):
+    seen = []
+
+    def responder(messages, params):
+        content = messages[-1]["content"]
+        seen.append(content)
+        return "short summary" if content.startswith("Summarize") else "done"
+
+    llm = make_llm(responder, cache=False, max_prompt_tokens=60)
+    assert llm.prompt_budget() == 60
+    assert make_llm(cache=False, context_window=1000, max_tokens=100).prompt_budget() == 900
+
+    assert llm.generate("word " * 500, call_site="act") == "done"
+    assert llm.count_tokens(seen[-1]) <= 60
+
+    sections = [PromptSection("Answer briefly.", priority=1), PromptSection("log " * 500, summarize=True)]
+    assert llm.generate(sections, call_site="act") == "done"
+    assert seen[-1] == "Answer briefly.\n\nshort summary"
+
+    usage = llm.usage.snapshot()["by_call_site"]
+    assert usage["act"]["calls"] == 2 and usage["act"]["trimmed_tokens"] > 0
+    assert usage["act"]["prompt_tokens"] > 0 and usage["act"]["completion_tokens"] > 0
+    assert usage["llm.summarize"]["calls"] == 1
+
+
+# ----------------------------------------------------------------------
+# Recording, replay and stub backends (user-009)
+# ----------------------------------------------------------------------
+
+def _numbered():
+    count = itertools.count(1)
+    return lambda messages, params: f"answer {next(count)} to {messages[-1]['content']}"
+
+
+def test_recorded_session_replays_offline(make_llm, tmp_path):
+    cassette = str(tmp_path / "cassettes" / "session.jsonl")
+    live = make_llm(backend=RecordingBackend(StubBackend(_numbered(), chunk_size=3), cassette), cache=False)
+    recorded = [live.generate("a", call_site="plan"), live.generate("a"), live.stream("b"),
+                live.embed_many(["x", "y"])]
+
+    records = [json.loads(line) for line in open(cassette, encoding="utf-8")]
+    assert [r["kind"] for r in records] == ["complete", "complete", "stream", "embed"]
+    assert records[0]["call_site"] == "plan" and records[0]["latency"] >= 0.0
+    assert records[2]["complete"] and records[2]["first_chunk_latency"] is not None
+
+    replay = ReplayBackend(cassette)
+    offline = make_llm(backend=replay, cache=False)
+    assert [offline.generate("a"), offline.generate("a"), offline.stream("b"),
+            offline.embed_many(["x", "y"])] == recorded
+    assert offline.generate("a") == recorded[0]  # repeated recordings cycle
+    assert replay.misses == 0
+
+    with pytest.raises(CassetteMiss):
+        offline.generate("never recorded")
+    assert replay.misses == 1
+
+
+def test_replay_falls_back_and_simulates_latency(make_llm, tmp_path):
+    cassette = str(tmp_path / "session.jsonl")
+    slow = RecordingBackend(StubBackend(_reply("recorded"), latency=0.2), cassette)
+    assert make_llm(backend=slow, cache=False).generate("slow") == "recorded"
+
+    replay = ReplayBackend(cassette, simulate_latency=True, latency_scale=0.5, fallback=StubBackend(_reply("live")))
+    llm = make_llm(backend=replay, cache=False)
+    started = time.monotonic()
+    assert llm.generate("slow") == "recorded"
+    assert time.monotonic() - started >= 0.1
+    assert llm.generate("missing") == "live" and replay.misses == 1
+
+
+def test_stub_backend_is_deterministic():
+    stub = StubBackend(embedding_dim=8)
+    params = {"model": "m", "temperature": 0.0}
+    first = asyncio.run(stub.complete(MESSAGES, params))
+    assert first == asyncio.run(stub.complete(MESSAGES, params)) and first[0].startswith("stub-")
+    assert first != asyncio.run(stub.complete(MESSAGES, {"model": "m", "temperature": 0.5}))
+    assert stub.calls == 3
+
+    vectors = asyncio.run(stub.embed(["a", "b", "a"], "e"))
+    assert len(vectors[0]) == 8 and vectors[0] == vectors[2] != vectors[1]
+    assert all(-1.0 <= v <= 1.0 for v in vectors[1])
+
+    assert isinstance(create_backend("stub"), StubBackend)
+    with pytest.raises(ValueError):
+        create_backend("carrier-pigeon")
+
+
+# ----------------------------------------------------------------------
+# Request coalescing (user-010)
+# ----------------------------------------------------------------------
+
+def _concurrently(llm, prompt, n, **kwargs):
+    async def main():
+        return await asyncio.gather(*(llm.agenerate(prompt, **kwargs) for _ in range(n)))
+    return asyncio.run(main())
+
+
+def test_identical_concurrent_calls_share_one_provider_call(make_llm):
+    llm = make_llm(_numbered(), cache=False, stub={"latency": 0.1})
+
+    assert _concurrently(llm, "q", 5, call_site="plan") == ["answer 1 to q"] * 5
+    assert llm.backend.calls == 1
+    stats = llm.coalescing_stats()
+    assert stats["calls"] == 5 and stats["collapsed"] == 4 and stats["in_flight"] == 0
+    plan = llm.usage.snapshot()["by_call_site"]["plan"]
+    assert plan["calls"] == 5 and plan["coalesced"] == 4 and plan["completion_tokens"] > 0
+
+    # Nothing is kept once the call finished
+    assert llm.generate("q") == "answer 2 to q"
+
+
+def test_sampled_calls_stay_independent(make_llm):
+    llm = make_llm(_numbered(), cache=False, stub={"latency": 0.05})
+    assert len(set(_concurrently(llm, "q", 3, temperature=0.7))) == 3
+    assert len(set(_concurrently(llm, "q", 3, temperature=0.7, cache=True))) == 1
+
+    off = make_llm(_numbered(), cache=False, coalesce=False, stub={"latency": 0.05})
+    assert len(set(_concurrently(off, "q", 3))) == 3
+
+
+def test_single_flight_cancels_the_shared_call_only_with_its_last_waiter():
+    async def main():
+        flights = SingleFlight()
+        started = asyncio.Event()
+        release = asyncio.Event()
+
+        async def call():
+            started.set()
+            await release.wait()
+            return "shared"
+
+        first = asyncio.ensure_future(flights.do("k", call))
+        await started.wait()
+        second = asyncio.ensure_future(flights.do("k", call))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        assert await second == ("shared", False)
+        assert first.cancelled()
+
+        release.clear()
+        lone = asyncio.ensure_future(flights.do("k", call))
+        await asyncio.sleep(0)
+        shared = flights._inflight["k"]
+        lone.cancel()
+        await asyncio.gather(lone, return_exceptions=True)
+        await asyncio.sleep(0)
+        assert shared.cancelled() and flights.stats()["in_flight"] == 0
+
+    asyncio.run(main())
+
@@ -1 +1,873 @@
 # Memory system tests
+
+import time
+import types
+import datetime
+import threading
+
+import numpy as np
+import pytest
+
+from agent.memory import episodic_memory
+from agent.memory.episodic_memory import EpisodicMemory
+from agent.memory.triple_store import ANY, TripleStore
+from agent.memory.semantic_memory import SemanticMemory
+from agent.infra.db import Database
+from agent.memory.text_index import TextIndex, tokenize
+from agent.memory.keyword_index import KeywordIndex, matches, words
+from agent.memory.working_memory import WorkingMemory, approx_size
+from agent.memory.reflective_memory import ReflectiveMemory
+from agent.memory.context_builder import ContextBuilder
+from agent.meta.self_reflector import SelfReflector
+from agent.memory.vector_index import FlatIndex, IVFIndex, create_index, load_index
+from agent.memory.memory_indexer import MemoryIndexer
+from agent.memory.embedding_pipeline import EmbeddingPipeline
+from agent.memory.episodic_segments import Segment, dump_events, read_events, write_atomic
+from agent.memory.event_columns import EventColumns, from_epoch_us, to_epoch_us
+from agent.memory.procedural_memory import ProceduralMemory
+
+
+def _vectors(n, dim=16, seed=0):
+    return np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+
+
+def _ids(n, prefix="e"):
+    return [f"{prefix}{i}" for i in range(n)]
+
+
+def _hash_embed(text, dim=16):
+    """
+    Deterministic text embedding for indexer tests.
+    """
+    rng = np.random.default_rng(abs(hash(text)) % (2 ** 32))
+    return rng.normal(size=dim).astype(np.float32)
+
+
+# ----------------------------------------------------------------------
+# Context builder (user-013)
+# ----------------------------------------------------------------------
+
+def _builder_stores():
+    reflective, episodic, semantic = ReflectiveMemory(duplicate_distance=0), EpisodicMemory(), SemanticMemory()
+    reflective.add_insight("Retry flaky network calls with backoff")
+    reflective.add_insight("Keep plans short")
+    episodic.add_event("Called the weather API, it timed out")
+    episodic.add_event("Planned the morning walk")
+    semantic.add_fact("weather", "source", "met office")
+    return reflective, episodic, semantic
+
+
+def test_context_builder_fills_the_budget_best_first():
+    reflective, episodic, semantic = _builder_stores()
+    builder = ContextBuilder(reflective, episodic, semantic, recency_weight=0.0)
+
+    context = builder.build("weather network retry", max_tokens=1000)
+    assert context["facts"] == [("weather", "source", "met office")]
+    assert context["insights"][0]["insight"].startswith("Retry flaky")
+    assert context["episodes"][0]["content"].startswith("Called the weather API")
+    text = builder.render(context)
+    assert text.startswith("Insights:") and "Known facts:\n- weather source met office" in text
+
+    # Facts rank first; what no longer fits is skipped
+    fact_cost = builder.counter.count(builder.format_item("facts", context["facts"][0])) + 1
+    small = builder.build("weather network retry", max_tokens=fact_cost)
+    assert small == {"insights": [], "episodes": [], "facts": [("weather", "source", "met office")]}
+
+
+def test_context_builder_weighs_relevance_against_recency():
+    memory = ReflectiveMemory(duplicate_distance=0)
+    memory.add_insight("deploy rollback procedure for the database")
+    for i in range(20):
+        memory.add_insight(f"note {i} mentions deploy")
+
+    relevant = ContextBuilder(memory, recency_weight=0.0, half_life=2.0)
+    assert relevant.select_insights("database rollback deploy", k=1)[0]["id"] == 0
+    recent = ContextBuilder(memory, recency_weight=0.95, half_life=2.0)
+    assert recent.select_insights("deploy", k=1)[0]["id"] == 20
+    assert [e["id"] for e in recent.select_insights(None, k=3)] == [20, 19, 18]
+
+
+def test_context_builder_select_facts_matches_query_terms():
+    semantic = SemanticMemory()
+    semantic.add_fact("Paris", "capital_of", "France")
+    semantic.add_fact("paris", "population", 2100000)
+    semantic.add_fact("tea", "temperature", "hot")
+    builder = ContextBuilder(semantic=semantic)
+
+    assert builder.select_facts("Is Paris, the city, big?") == [
+        ("Paris", "capital_of", "France"), ("paris", "population", 2100000)]
+    assert builder.select_facts("Is Paris big?", k=1) == [("Paris", "capital_of", "France")]
+    assert builder.select_facts("") == [] and ContextBuilder().select_facts("Paris") == []
+
+
+def test_context_builder_indexes_only_new_entries(monkeypatch):
+    reflective, episodic, _ = _builder_stores()
+    builder = ContextBuilder(reflective, episodic)
+    indexed = []
+    add = TextIndex.add
+    monkeypatch.setattr(TextIndex, "add", lambda self, text, payload: indexed.append(text) or add(self, text, payload))
+
+    builder.build("weather", max_tokens=500)
+    assert len(indexed) == 4
+    builder.build("walk", max_tokens=500)
+    assert len(indexed) == 4
+
+    episodic.add_event("Walked to the station")
+    assert builder.select_episodes("station", k=1)[0]["content"] == "Walked to the station"
+    assert indexed[4:] == ["Walked to the station "]
+
+    reflective.clear()
+    reflective.add_insight("Start over")
+    assert [e["insight"] for e in builder.select_insights("over", k=5)] == ["Start over"]
+    assert len(builder._insights) == 1
+
+
+# ----------------------------------------------------------------------
+# Vector indexes (user-014)
+# ----------------------------------------------------------------------
+
+def test_flat_index_save_and_memmap_load(tmp_path):
+    vectors = _vectors(50)
+    index = FlatIndex()
+    index.add(vectors, _ids(50), [{"n": i} for i in range(50)])
+    base = str(tmp_path / "index")
+    index.save(base)
+
+    loaded = load_index(base)
+    assert isinstance(loaded, FlatIndex) and len(loaded) == 50
+    assert isinstance(loaded.vectors, np.memmap)
+    for row in (0, 17, 49):
+        assert loaded.search(vectors[row], 3) == index.search(vectors[row], 3)
+        assert loaded.search(vectors[row], 1)[0]["metadata"] == {"n": row}
+
+
+def test_flat_index_insert_after_memmap_load_copies_into_memory(tmp_path):
+    base = str(tmp_path / "index")
+    index = FlatIndex()
+    index.add(_vectors(10), _ids(10))
+    index.save(base)
+
+    loaded = FlatIndex.load(base)
+    extra = _vectors(1, seed=1)
+    loaded.add(extra, ["new"])
+    assert not isinstance(loaded._matrix, np.memmap)
+    assert loaded.search(extra[0], 1)[0]["id"] == "new"
+    assert len(FlatIndex.load(base)) == 10  # the file on disk is untouched
+
+
+def test_flat_index_remove_and_compaction(tmp_path):
+    vectors = _vectors(20)
+    index = FlatIndex()
+    index.add(vectors, _ids(20))
+    for i in range(0, 20, 2):
+        assert index.remove(f"e{i}")
+    assert not index.remove("e0")
+    assert len(index) == 10 and index.tombstone_ratio == 0.5
+    assert "e4" not in {hit["id"] for hit in index.search(vectors[4], 20)}
+
+    compacted = index.compacted()
+    assert len(compacted) == 10 and compacted.tombstone_ratio == 0.0
+    assert compacted.ids == _ids(20)[1::2]
+    hits, expected = compacted.search(vectors[5], 3), index.search(vectors[5], 3)
+    assert [h["id"] for h in hits] == [h["id"] for h in expected]
+    assert [h["score"] for h in hits] == pytest.approx([h["score"] for h in expected], abs=1e-6)
+
+    base = str(tmp_path / "index")
+    index.save(base)  # tombstones are compacted away in the written copy
+    assert FlatIndex.load(base).ids == compacted.ids
+
+
+def test_flat_index_replaces_existing_id():
+    index = FlatIndex()
+    index.add(_vectors(3), ["a", "b", "c"])
+    replacement = _vectors(1, seed=7)
+    index.add(replacement, ["b"], [{"v": 2}])
+    assert len(index) == 3
+    assert index.search(replacement[0], 1)[0] == {"id": "b", "score": pytest.approx(1.0), "metadata": {"v": 2}}
+
+
+def test_ivf_index_save_load_and_compaction(tmp_path):
+    vectors = _vectors(600, seed=3)
+    index = IVFIndex(nlist=8, nprobe=8, train_threshold=200)
+    index.add(vectors, _ids(600))
+    assert index.trained
+
+    base = str(tmp_path / "ivf")
+    index.save(base)
+    loaded = load_index(base)
+    assert isinstance(loaded, IVFIndex) and loaded.trained
+    for row in (0, 99, 599):
+        assert loaded.search(vectors[row], 5) == index.search(vectors[row], 5)
+        assert loaded.search(vectors[row], 1)[0]["id"] == f"e{row}"  # nprobe = nlist is exact
+
+    loaded.remove("e99")
+    compacted = loaded.compacted()
+    assert len(compacted) == 599 and compacted.trained
+    assert compacted.search(vectors[100], 1)[0]["id"] == "e100"
+    assert "e99" not in {hit["id"] for hit in compacted.search(vectors[99], 10)}
+
+
+def _clustered(n, dim=16, clusters=20, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    return (centers[rng.integers(clusters, size=n)] + 0.3 * rng.normal(size=(n, dim))).astype(np.float32)
+
+
+def test_ivf_index_recall_against_flat():
+    vectors = _clustered(3000)
+    exact, approximate = FlatIndex(), IVFIndex(nlist=32, nprobe=4, train_threshold=1000)
+    exact.add(vectors[:500], _ids(500))
+    approximate.add(vectors[:500], _ids(500))
+    assert not approximate.trained
+    assert approximate.search(vectors[7], 10) == exact.search(vectors[7], 10)  # exact until trained
+
+    exact.add(vectors[500:], _ids(3000)[500:])
+    approximate.add(vectors[500:], _ids(3000)[500:])
+    assert approximate.trained and len(approximate.centroids) == 32
+
+    queries = vectors[::60] + 0.1 * _vectors(50, seed=1)
+    found = [len({h["id"] for h in approximate.search(q, 10)} & {h["id"] for h in exact.search(q, 10)})
+             for q in queries]
+    assert sum(found) / (10 * len(queries)) >= 0.9
+    # Probing every bucket is exact
+    assert all(approximate.search(q, 10, nprobe=32) == exact.search(q, 10) for q in queries[:5])
+
+
+def test_ivf_index_retrains_as_it_grows(tmp_path):
+    vectors = _clustered(2000, seed=2)
+    index = create_index("ivf", nlist=8, nprobe=8, train_threshold=200, retrain_factor=4.0)
+    index.add(vectors[:200], _ids(200))
+    first = index.centroids
+    index.add(vectors[200:700], _ids(700)[200:])
+    assert index.centroids is first  # assigned to the existing buckets
+    index.add(vectors[700:], _ids(2000)[700:])
+    assert index.centroids is not first and index._trained_at == 2000
+
+    base = str(tmp_path / "ivf")
+    index.save(base)
+    loaded = load_index(base)
+    assert np.allclose(loaded.centroids, index.centroids)
+    loaded.add(_clustered(1, seed=3), ["new"])
+    assert loaded.search(_clustered(1, seed=3)[0], 1)[0]["id"] == "new"
+
+
+def test_memory_indexer_queries_do_not_evict_entry_embeddings(tmp_path):
+    calls = []
+
+    def embed(text):
+        calls.append(text)
+        return _hash_embed(text)
+
+    indexer = MemoryIndexer(embed, str(tmp_path / "index"), embedding_cache_size=4, query_cache_size=2)
+    vectors = indexer._embed(["alpha", "beta"])
+    indexer._index.add(vectors, ["a", "b"])
+    for i in range(10):
+        indexer.search(f"query {i}")
+    assert len(indexer._embeddings) == 2  # entry cache untouched by queries
+    assert len(indexer._query_embeddings) == 2
+    calls.clear()
+    indexer.search("query 9")
+    indexer._embed(["alpha", "beta"])
+    assert calls == []
+
+
+
+# ----------------------------------------------------------------------
+# Incremental indexing (user-015)
+# ----------------------------------------------------------------------
+
+def _other_stores():
+    return SemanticMemory(), ProceduralMemory(), WorkingMemory(), ReflectiveMemory()
+
+
+def test_memory_indexer_embeds_only_what_changed(tmp_path):
+    embedded = []
+
+    def embed(text):
+        embedded.append(text)
+        return _hash_embed(text)
+
+    episodic, semantic, procedural, working, reflective = EpisodicMemory(), *_other_stores()
+    for i in range(3):
+        episodic.add_event(f"event {i}")
+    semantic.add_fact("sky", "color", "blue")
+    procedural.register("greet", lambda: "hi")
+    working.add("goal", "find coffee")
+    working.add("mood", "curious")
+    reflective.add_insight("coffee helps")
+    stores = (episodic, semantic, procedural, working, reflective)
+    indexer = MemoryIndexer(embed, str(tmp_path / "index"), compact_ratio=1.0)
+
+    indexer.build_index(*stores)
+    assert len(embedded) == 8 and len(indexer._index) == 8
+    embedded.clear()
+    indexer.build_index(*stores)
+    assert embedded == []
+
+    episodic.add_event("event 3")
+    working.add("goal", "find tea")
+    working.remove("mood")
+    procedural.unregister("greet")
+    indexer.build_index(*stores)
+    assert sorted(embedded) == ["event 3", "goal: find tea"]
+    assert len(indexer._index) == 7 and indexer.stats["removed"] == 2
+    assert indexer._index.tombstone_ratio > 0
+    hits = {hit["id"] for hit in indexer.search("goal: find tea", top_k=10)}
+    assert "working:goal" in hits and "working:mood" not in hits and "procedural:greet" not in hits
+
+    # A rebuild starts a fresh index but reuses the cached embeddings
+    embedded.clear()
+    indexer.build_index(*stores, rebuild=True)
+    assert embedded == [] and len(indexer._index) == 7 and indexer._index.tombstone_ratio == 0.0
+
+
+def test_memory_indexer_resumes_from_saved_cursors(tmp_path, monkeypatch):
+    embedded = []
+    loads = []
+
+    def embed(text):
+        embedded.append(text)
+        return _hash_embed(text)
+
+    store_dir, index_path = str(tmp_path / "episodes"), str(tmp_path / "index")
+    episodic = EpisodicMemory(store_dir, segment_size=2)
+    for i in range(7):
+        episodic.add_event(f"event {i}")
+    episodic.save_to_file(store_dir)
+    indexer = MemoryIndexer(embed, index_path)
+    indexer.build_index(episodic, *_other_stores())
+    indexer.save()
+
+    # Restart: the store and the index come back at the positions they were saved at
+    original_load = Segment.load
+    monkeypatch.setattr(Segment, "load", lambda self: (loads.append(self.start), original_load(self))[1])
+    embedded.clear()
+    episodic = EpisodicMemory()
+    episodic.load_from_file(store_dir)
+    indexer = MemoryIndexer(embed, index_path)
+    indexer.load()
+    indexer.build_index(episodic, *_other_stores())
+    assert loads == [] and embedded == []
+    assert len(indexer._index) == 7
+
+    episodic.add_event("event 7")
+    indexer.build_index(episodic, *_other_stores())
+    assert embedded == ["event 7"]
+    assert indexer.search("event 7", top_k=1)[0]["id"] == "episodic:7"
+
+
+def test_memory_indexer_rescans_a_store_saved_at_another_position(tmp_path):
+    store_dir, index_path = str(tmp_path / "episodes"), str(tmp_path / "index")
+    episodic = EpisodicMemory(store_dir, segment_size=2)
+    episodic.add_event("indexed")
+    episodic.save_to_file(store_dir)
+    indexer = MemoryIndexer(_hash_embed, index_path)
+    indexer.build_index(episodic, *_other_stores())
+    indexer.save()
+    episodic.add_event("added after the index was saved")
+    episodic.save_to_file(store_dir)
+
+    episodic = EpisodicMemory()
+    episodic.load_from_file(store_dir)
+    indexer = MemoryIndexer(_hash_embed, index_path)
+    indexer.load()
+    indexer.build_index(episodic, *_other_stores())
+    assert sorted(indexer._index.ids) == ["episodic:0", "episodic:1"]
+    assert indexer.stats["embedded"] == 1  # the indexed event came from the stored vectors
+
+
+def test_memory_indexer_search_is_not_blocked_by_embedding(tmp_path):
+    started, release = threading.Event(), threading.Event()
+
+    def embed(text):
+        if text == "slow":
+            started.set()
+            assert release.wait(5)
+        return _hash_embed(text)
+
+    indexer = MemoryIndexer(embed, str(tmp_path / "index"))
+    episodic = EpisodicMemory()
+    episodic.add_event("fast")
+    stores = _other_stores()
+    indexer.build_index(episodic, *stores)
+    episodic.add_event("slow")
+    worker = threading.Thread(target=indexer.build_index, args=(episodic, *stores))
+    worker.start()
+    try:
+        assert started.wait(5)
+        searched = []
+        searcher = threading.Thread(target=lambda: searched.append(indexer.search("fast", top_k=1)))
+        searcher.start()
+        searcher.join(5)
+        assert searched and searched[0][0]["id"] == "episodic:0"
+    finally:
+        release.set()
+        worker.join(5)
+    assert len(indexer._index) == 2
+
+
+def test_memory_indexer_drops_an_embedding_whose_entry_was_removed_meanwhile(tmp_path):
+    started, release = threading.Event(), threading.Event()
+
+    def embed(text):
+        if text.startswith("temp"):
+            started.set()
+            assert release.wait(5)
+        return _hash_embed(text)
+
+    indexer = MemoryIndexer(embed, str(tmp_path / "index"))
+    episodic, semantic, procedural, reflective = EpisodicMemory(), SemanticMemory(), ProceduralMemory(), ReflectiveMemory()
+    working = WorkingMemory()
+    working.add("temp", "value")
+    stores = (episodic, semantic, procedural, working, reflective)
+    worker = threading.Thread(target=indexer.build_index, args=stores)
+    worker.start()
+    assert started.wait(5)
+    working.remove("temp")
+    indexer.build_index(*stores)  # processes the removal while the first pass embeds
+    release.set()
+    worker.join(5)
+    assert len(indexer._index) == 0
+
+
+# ----------------------------------------------------------------------
+# Keyword queries (user-018)
+# ----------------------------------------------------------------------
+
+_WORDS = ["retry", "retries", "disk", "full", "Network", "timeout", "café", "ok", "user-42", "plan"]
+
+_KEYWORDS = ["retry", "ret", "RETRIES", "disk full", "isk", "user-4", "42", "café", "work", "!!", "",
+             "missing", "alice", "2"]
+
+_FILTERS = [None, {"user": "alice"}, {"level": 2}, {"level": "2"}, {"user": "alice", "level": 1}, {"nope": 1}]
+
+
+def _random_text(rng):
+    return " ".join(rng.choice(_WORDS, size=rng.integers(1, 5))) + rng.choice(["", ".", "!!"])
+
+
+def _random_metadata(rng):
+    return {"user": str(rng.choice(["alice", "bob"])), "level": int(rng.integers(0, 3))}
+
+
+def test_episodic_keyword_queries_equal_a_full_scan(tmp_path):
+    rng = np.random.default_rng(5)
+    store_dir = str(tmp_path / "episodes")
+    episodic = EpisodicMemory(store_dir, segment_size=16)
+    for _ in range(150):
+        episodic.add_event(_random_text(rng), _random_metadata(rng))
+    episodic.save_to_file(store_dir)
+    reloaded = EpisodicMemory()
+    reloaded.load_from_file(store_dir)
+
+    events = [episodic.get_event(i) for i in range(len(episodic))]
+    for keyword in _KEYWORDS:
+        for filters in _FILTERS:
+            expected = [e["content"] for e in events if matches(keyword, e["content"], e["metadata"], filters)]
+            for memory in (episodic, reloaded):
+                for limit in (3, 1000):
+                    found = memory.query(keyword, limit=limit, filters=filters)
+                    assert [e["content"] for e in found] == expected[:limit], (keyword, filters, limit)
+
+
+def test_reflective_keyword_queries_equal_a_full_scan():
+    rng = np.random.default_rng(6)
+    memory = ReflectiveMemory(max_entries=60, duplicate_distance=0)
+    for _ in range(150):
+        memory.add_insight(_random_text(rng), _random_metadata(rng), importance=float(rng.random()))
+    entries = memory.get_all()
+    assert len(entries) <= 60  # evicted entries must not come back
+
+    for keyword in _KEYWORDS:
+        for filters in _FILTERS:
+            expected = [e["id"] for e in entries if matches(keyword, e["insight"], e["metadata"], filters)]
+            for limit in (3, 1000):
+                found = memory.query_insights(keyword, limit=limit, filters=filters)
+                assert [e["id"] for e in found] == expected[:limit], (keyword, filters, limit)
+
+
+# ----------------------------------------------------------------------
+# Embedding pipeline (user-017)
+# ----------------------------------------------------------------------
+
+def test_embedding_pipeline_batches_by_count_and_characters():
+    pipeline = EmbeddingPipeline(len, max_batch_size=3, max_batch_chars=10)
+    texts = ["ab", "cd", "ef", "gh", "a" * 12, "ij", "klmnop", "qrstu"]
+    assert list(pipeline.batches(texts)) == [["ab", "cd", "ef"], ["gh"], ["a" * 12], ["ij", "klmnop"], ["qrstu"]]
+    with pytest.raises(ValueError):
+        EmbeddingPipeline(len, executor="gpu")
+
+
+def test_embedding_pipeline_keeps_order_across_workers():
+    lock = threading.Lock()
+    active, peak = [0], [0]
+
+    def embed_batch(texts):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.01 * (len(texts[0]) % 3))
+        with lock:
+            active[0] -= 1
+        return [[float(t)] for t in texts]
+
+    pipeline = EmbeddingPipeline(embed_batch, batched=True, max_batch_size=4, workers=4, max_pending=3)
+    try:
+        texts = [str(i) for i in range(100)]
+        assert pipeline.embed(texts) == [[float(i)] for i in range(100)]
+        assert pipeline("7") == [7.0]
+    finally:
+        pipeline.close()
+    assert 1 < peak[0] <= 3
+    stats = pipeline.stats()
+    assert stats["texts"] == 101 and stats["batches"] == 26 and stats["texts_per_sec"] > 0
+
+
+def test_embedding_pipeline_retries_failed_batches():
+    attempts = {}
+
+    def flaky(text):
+        attempts[text] = attempts.get(text, 0) + 1
+        if text.startswith("flaky") and attempts[text] < 3:
+            raise ConnectionError("rate limited")
+        return [float(len(text))]
+
+    pipeline = EmbeddingPipeline(flaky, max_batch_size=2, workers=1, retries=2, backoff=0.0)
+    assert pipeline.embed(["a", "flaky", "bb"]) == [[1.0], [5.0], [2.0]]
+    assert pipeline.stats()["retries"] == 2
+
+    attempts.clear()
+    strict = EmbeddingPipeline(flaky, workers=2, retries=1, backoff=0.0)
+    with pytest.raises(ConnectionError):
+        strict.embed(["flaky again"])
+    strict.close()
+    assert attempts["flaky again"] == 2 and strict.stats()["failures"] == 1
+
+    short = EmbeddingPipeline(lambda texts: texts[:-1], batched=True, workers=1, retries=0)
+    with pytest.raises(ValueError):
+        short.embed(["x", "y"])
+
+
+# ----------------------------------------------------------------------
+# EpisodicMemory (user-019)
+# ----------------------------------------------------------------------
+
+def test_episodic_timestamps_stay_monotonic_when_the_clock_steps_back(monkeypatch):
+    clock = iter([5_000_000_000, 4_000_000_000, 6_000_000_000, 1_000_000_000, 2_000_000_000])
+    monkeypatch.setattr(episodic_memory, "time", types.SimpleNamespace(time_ns=lambda: next(clock) * 1000))
+    memory = EpisodicMemory(segment_size=2)
+    for name in ("a", "b", "c", "d", "e"):  # "d" lands in a fresh tail after a seal
+        memory.add_event(name)
+
+    stamps = [memory.get_event(i)["timestamp"] for i in range(5)]
+    assert stamps == sorted(stamps)
+    assert stamps[1] == stamps[0] and stamps[3] == stamps[2] == stamps[4]
+    since = datetime.datetime.fromtimestamp(5_500, tz=datetime.timezone.utc)
+    assert [e["content"] for e in memory.query_range(start=since)] == ["c", "d", "e"]
+
+
+
+def test_episodic_keyword_query_loads_only_segments_that_can_match(tmp_path, monkeypatch):
+    store_dir = str(tmp_path / "episodes")
+    memory = EpisodicMemory(store_dir, segment_size=10, cached_segments=2)
+    for i in range(100):
+        topic = "deploy" if i in (23, 87) else "routine"
+        memory.add_event(f"{topic} check {i}", {"host": "db" if i == 55 else "web"})
+    memory.save_to_file(store_dir)
+    reference = [(e["content"], e["metadata"]) for e in memory.query("deploy", limit=100)]
+
+    loads = []
+    original_load = Segment.load
+    monkeypatch.setattr(Segment, "load", lambda self: (loads.append(self.start), original_load(self))[1])
+    memory = EpisodicMemory()
+    memory.load_from_file(store_dir)
+    for _ in range(3):
+        found = memory.query("deplo", limit=100)
+    assert [(e["content"], e["metadata"]) for e in found] == reference
+    assert sorted(set(loads)) == [20, 80]
+    loads.clear()
+    assert [e["content"] for e in memory.query("check", filters={"host": "db"})] == ["routine check 55"]
+    assert loads == [50]
+    loads.clear()
+    assert memory.query("missing") == [] and loads == []
+
+
+# ----------------------------------------------------------------------
+# Event columns (user-020)
+# ----------------------------------------------------------------------
+
+def test_epoch_microsecond_timestamps_round_trip():
+    naive = datetime.datetime(2024, 2, 29, 23, 59, 59, 123456)
+    assert from_epoch_us(to_epoch_us(naive)) == naive.isoformat()
+    assert to_epoch_us(naive.isoformat()) == to_epoch_us(naive)
+    aware = datetime.datetime(2024, 3, 1, 1, 59, 59, 123456, tzinfo=datetime.timezone(datetime.timedelta(hours=2)))
+    assert to_epoch_us(aware) == to_epoch_us(naive)
+    assert to_epoch_us("1970-01-01T00:00:00.000001") == 1
+    assert from_epoch_us(-1) == "1969-12-31T23:59:59.999999"
+
+
+def test_event_columns_store_events_behind_read_only_views():
+    events = EventColumns()
+    events.append(10, "première", {"user": "alice", "level": 1})
+    events.append(20, "", None)
+    events.append(30, "third", {"user": "bob", "level": 2})
+    assert len(events) == 3 and list(events.timestamps) == [10, 20, 30]
+    assert events._shape[0] == events._shape[2] != events._shape[1]  # one interned key tuple per shape
+
+    view = events.view(0)
+    assert dict(view) == events.to_dict(0) == {"timestamp": from_epoch_us(10), "content": "première",
+                                               "metadata": {"user": "alice", "level": 1}}
+    assert view == view.to_dict() and list(view) == ["timestamp", "content", "metadata"]
+    assert view.get("missing") is None and "content" in view
+    with pytest.raises(TypeError):
+        view["content"] = "changed"
+    view["metadata"]["user"] = "mallory"
+    assert events.metadata(0)["user"] == "alice"
+    assert events.view(1)["metadata"] == {} and events.content(1) == ""
+
+    assert [v["content"] for v in events.views(1)] == ["", "third"]
+    assert [v["content"] for v in events.views(-1)] == ["third"]
+    assert events.views(2, 1) == []
+
+
+def test_event_columns_survive_a_jsonl_round_trip(tmp_path):
+    events = EventColumns()
+    events.append_event({"timestamp": "2024-05-01T12:00:00.000001", "content": "a\nmulti-line event",
+                         "metadata": {"tags": ["x", "y"], "score": 0.5}})
+    events.append_event({"timestamp": "2024-05-01T12:00:01", "content": "no metadata"})
+    path = str(tmp_path / "segment.jsonl")
+    write_atomic(path, dump_events(events))
+
+    loaded = read_events(path)
+    assert [loaded.to_dict(row) for row in range(len(loaded))] == [events.to_dict(row) for row in range(2)]
+    assert list(loaded.timestamps) == list(events.timestamps)
+
+
+# ----------------------------------------------------------------------
+# Triple store and semantic memory (user-021, user-022)
+# ----------------------------------------------------------------------
+
+def test_triple_store_deduplicates_and_keeps_typed_terms_apart():
+    store = TripleStore()
+    assert store.add("x", "value", 1) == 0
+    assert store.add("x", "value", 1) is None
+    assert store.add("x", "value", 1.0) == 1
+    assert store.add("x", "value", True) == 2
+    assert store.add("x", "tags", ["a", "b"]) == 3
+    assert store.add("x", "tags", ["a", "b"]) is None
+    assert len(store) == 4
+
+    assert list(store.match(obj=1)) == [("x", "value", 1)]
+    assert [type(o) for _, _, o in store.match("x", "value")] == [int, float, bool]
+    assert list(store.match(obj=["a", "b"])) == [("x", "tags", ["a", "b"])]
+    assert list(store.match("y")) == [] and list(store.match(obj=2)) == []
+    assert store.contains("x", "value", True) and not store.contains("x", "value", 2)
+
+
+def test_triple_store_match_by_object_and_predicate():
+    store = TripleStore()
+    for city, country in (("paris", "france"), ("lyon", "france"), ("rome", "italy")):
+        store.add(city, "located_in", country)
+        store.add(city, "type", "city")
+    assert [s for s, _, _ in store.match(obj="france")] == ["paris", "lyon"]
+    assert list(store.match(ANY, "located_in", "italy")) == [("rome", "located_in", "italy")]
+    assert len(list(store.match(predicate="type"))) == 3
+    assert store.subject_fact("lyon", 1) == ("lyon", "type", "city")
+    assert list(store.subjects()) == ["paris", "lyon", "rome"]
+
+
+def test_semantic_memory_reads_through_from_sqlite(tmp_path):
+    path = str(tmp_path / "facts.db")
+    db = Database(path)
+    memory = SemanticMemory(db=db, batch_size=2)
+    assert memory.add_fact("paris", "located_in", "france")
+    assert memory.add_fact("paris", "population", 2100000)
+    assert memory.add_fact("lyon", "located_in", "france")
+    assert not memory.add_fact("paris", "located_in", "france")
+    memory.flush()
+    db.close()
+
+    db = Database(path)
+    reopened = SemanticMemory(db=db)
+    assert len(reopened) == 3
+    assert reopened.query_object("france") == [("paris", "located_in"), ("lyon", "located_in")]
+    assert reopened._loaded == set()  # object lookups run against the table
+
+    assert reopened.query_subject("paris") == [("located_in", "france"), ("population", 2100000)]
+    assert reopened._loaded == {"paris"}
+    assert reopened.has_fact("lyon", "located_in", "france")
+    assert not reopened.add_fact("lyon", "located_in", "france")  # known from the table
+    assert reopened.add_fact("lyon", "population", 520000)
+    assert reopened.query_predicate("population") == [("paris", 2100000), ("lyon", 520000)]
+    db.close()
+
+
+# ----------------------------------------------------------------------
+# Reflective memory, context builder and reflector (user-023)
+# ----------------------------------------------------------------------
+
+def test_text_index_remove_leaves_only_live_documents():
+    index = TextIndex()
+    for i in range(6):
+        index.add(f"note {i} about apples", i)
+    assert index.remove(1) and index.remove(4)
+    assert not index.remove(4) and not index.remove(99)
+    assert len(index) == 4 and index.dead == 2
+    assert sorted(p for _, p in index.search("apples", top_k=10)) == [0, 2, 3, 5]
+    assert [p for _, p in index.search(None, top_k=3)] == [5, 3, 2]
+    assert index.add("pears", 6) == 6  # ids keep increasing past tombstones
+
+
+
+def test_text_index_shares_keyword_index_tokens_and_frequencies():
+    keywords = KeywordIndex(scan_density=1.0, frequencies=True)
+    keywords.add(0, "cache miss, cache hit", {"kind": "cache"})
+    keywords.add(1, "cache")
+    assert [list(p) for p in keywords.postings("cache")] == [[0, 1], [3, 1]]
+    assert list(keywords.candidates("mis")) == [0]
+
+    text = "Sleep-wake didn't reach the Café"
+    assert set(tokenize(text)) == words(text) - {"the"}
+    index = TextIndex()
+    index.add("sleep-wake scheduler stopped", "scheduler")
+    index.add("café menu", "menu")
+    index.add("retry retry retry timeout", "retries")
+    index.add("retry timeout budget", "budget")
+    assert index.search("wake", top_k=1, recency_weight=0.0)[0][1] == "scheduler"
+    assert index.search("CAFÉ", top_k=1, recency_weight=0.0)[0][1] == "menu"
+    assert [p for _, p in index.search("retry", top_k=2, recency_weight=0.0)] == ["retries", "budget"]
+    index.remove(2)
+    assert set(index.relevance("retry")) == {3}
+
+
+def test_context_builder_drops_evicted_insights_and_returns_k():
+    memory = ReflectiveMemory(max_entries=10, duplicate_distance=0)
+    builder = ContextBuilder(reflective=memory)
+    for i in range(10):
+        memory.add_insight(f"alpha lesson number {i}", importance=0.1)
+    assert len(builder.select_insights("alpha lesson", k=5)) == 5
+
+    for i in range(30):
+        memory.add_insight(f"beta finding {i} about lesson", importance=5.0)
+        hits = builder.select_insights("lesson", k=8)
+        assert len(hits) == 8
+        assert all(entry["id"] in memory for entry in hits)
+        assert builder._insights.dead <= len(builder._insights)
+    assert not any("alpha" in e["insight"] for e in builder.select_insights("alpha lesson", k=10))
+    assert len(builder._insights) == len(memory)
+
+
+def test_context_builder_is_shared_per_reflective_memory():
+    memory, other = ReflectiveMemory(), ReflectiveMemory()
+    assert ContextBuilder.shared(memory) is ContextBuilder.shared(memory)
+    assert ContextBuilder.shared(other) is not ContextBuilder.shared(memory)
+
+
+def test_self_reflector_reflects_on_what_is_passed():
+    memory = ReflectiveMemory(duplicate_distance=0)
+    reflector = SelfReflector(memory)
+    actions = [{"type": "search"}, {"type": "write"}, {"type": "search"}]
+    outcomes = [{"ok": True}, {"ok": False}, {"status": "error"}]
+
+    first = memory.get_entry(reflector.reflect(actions, outcomes))
+    assert first["insight"] == "Reflected on 3 action(s) (search, write) with 3 outcome(s), 2 failed."
+    again = memory.get_entry(reflector.reflect(actions, outcomes))
+    assert again["insight"] == first["insight"]  # no hidden state between calls
+
+    tail = memory.get_entry(reflector.reflect(actions, outcomes, since=2))
+    assert tail["insight"] == "Reflected on 1 action(s) (search) with 1 outcome(s), 1 failed."
+    assert reflector.reflect(actions, outcomes, since=3) is None
+
+
+# ----------------------------------------------------------------------
+# Working memory (user-024)
+# ----------------------------------------------------------------------
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_working_memory_ttl_expiry():
+    clock = _Clock()
+    memory = WorkingMemory(capacity=10, default_ttl=5.0, clock=clock)
+    memory.add("short", 1, ttl=1.0)
+    memory.add("default", 2)
+    memory.add("long", 3, ttl=60.0)
+
+    clock.now = 1.0
+    assert "short" not in memory and memory.get("short") is None
+    assert memory.get("default") == 2
+    clock.now = 4.0
+    memory.add("default", 2)  # an update restarts the ttl
+    clock.now = 8.0
+    assert memory.expire() == 0
+    clock.now = 9.0
+    assert memory.expire() == 1
+    assert [k for k, _ in memory.items()] == ["long"]
+    assert memory.stats["expirations"] == 2
+    assert memory.stats["hits"] == 1 and memory.stats["misses"] == 1
+    assert memory.hit_rate == 0.5
+
+
+def test_working_memory_pinned_entries_survive_eviction():
+    memory = WorkingMemory(capacity=2)
+    memory.add("pinned", "p", pinned=True)
+    for key in ("a", "b", "c"):
+        memory.add(key, key)
+    assert [k for k, _ in memory.items()] == ["pinned", "c"]
+    assert memory.stats["evictions"] == 2
+
+    memory.add("pinned", "p2")  # an update keeps the pin
+    memory.add("d", "d")
+    assert "pinned" in memory and "d" in memory and "c" not in memory
+    assert memory.pin("d") and not memory.pin("missing")
+    memory.add("e", "e")  # everything else is pinned: the new entry is the only victim
+    assert [k for k, _ in memory.items()] == ["pinned", "d"]
+    memory.unpin("d")
+    memory.add("f", "f")
+    assert [k for k, _ in memory.items()] == ["pinned", "f"]
+
+
+def test_working_memory_pinned_entries_may_exceed_the_budget():
+    memory = WorkingMemory(capacity=1)
+    memory.add("a", 1, pinned=True)
+    memory.add("b", 2, pinned=True)
+    assert len(memory) == 2
+    memory.unpin("a")  # evicted at once now that it may be
+    assert [k for k, _ in memory.items()] == ["b"]
+
+
+def test_working_memory_byte_budget():
+    item = "x" * 1000
+    size = approx_size(item)
+    memory = WorkingMemory(capacity=100, max_bytes=3 * size)
+    for key in ("a", "b", "c"):
+        memory.add(key, item)
+    assert memory.nbytes == 3 * size
+    memory.get("a")  # "b" becomes least recently used
+    memory.add("d", item)
+    assert [k for k, _ in memory.items()] == ["c", "a", "d"]
+    assert memory.nbytes == 3 * size
+
+    memory.add("huge", "y" * 10 * size)
+    assert "huge" not in memory and memory.stats["rejected"] == 1
+    memory.add("a", "small")
+    assert memory.nbytes == 2 * size + approx_size("small")
+    memory.remove("c")
+    memory.clear()
+    assert memory.nbytes == 0 and len(memory) == 0
+
+
+def test_working_memory_expired_entries_are_evicted_before_live_ones():
+    clock = _Clock()
+    memory = WorkingMemory(capacity=2, clock=clock)
+    memory.add("old", 1)
+    memory.add("temp", 2, ttl=1.0)
+    clock.now = 2.0
+    memory.add("new", 3)
+    assert [k for k, _ in memory.items()] == ["old", "new"]
+    assert memory.stats == {"hits": 0, "misses": 0, "evictions": 0, "expirations": 1, "rejected": 0}